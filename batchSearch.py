@@ -0,0 +1,257 @@
+'''
+Description: batch query mode. Runs a file (or stdin) of queries through the
+search engine without any terminal UI, writes one JSON line of results per
+query and reports the throughput and latency, e.g. to replay a production
+query log against a new index build.
+
+Input: one query per line (blank lines are skipped). A line starting with '{'
+is a JSON object like the server's POST body, {"q": "war peace", "n": 5,
+"ranking": "bm25"}, so per-query options can be replayed as well.
+
+Output: one JSON line per query, in input order:
+{"query", "results", "message", "latency_ms"} (see searchServer.py), or
+{"query", "error"} for lines that cannot be run.
+
+With --workers the queries are spread over a process pool. Every worker opens
+the same memory-mapped index directory, so the index pages are shared through
+the page cache instead of being loaded per worker.
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from tokenizer import DEFAULT_CONTEXT_SIZE
+from scoring import SCORERS, TfIdfScorer, DEFAULT_K1, DEFAULT_B
+from searchServer import SearchService, RequestError, loadIndex, searchOptions
+
+# queries read, run and written at a time (bounds memory on large query logs)
+DEFAULT_CHUNK_SIZE = 1000
+
+# search service of a pool worker (set by _initWorker)
+_service = None
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Run a file of queries against the inverted index and report QPS and latency.")
+    parser.add_argument(
+        '-i', '--index',
+        type = str,
+        default = 'inverted_index',
+        help = 'Path to the index directory (or pickle file). Default is "inverted_index".'
+    )
+    parser.add_argument(
+        '-q', '--queries',
+        type = str,
+        default = '-',
+        help = 'File with one query (or JSON object) per line, "-" reads stdin. Default is "-".'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type = str,
+        default = '-',
+        help = 'JSONL file the results are written to, "-" writes stdout. Default is "-".'
+    )
+    parser.add_argument(
+        '-n', '--top_n',
+        type = int,
+        default = 10,
+        help = 'Number of results per query. Default is 10.'
+    )
+    parser.add_argument(
+        '--context_size',
+        type = int,
+        default = DEFAULT_CONTEXT_SIZE,
+        help = f'Number of words shown before and after a match as its context. Default is {DEFAULT_CONTEXT_SIZE}.'
+    )
+    parser.add_argument(
+        '--ranking',
+        type = str,
+        choices = sorted(SCORERS),
+        default = TfIdfScorer.name,
+        help = f'Ranking function. Default is {TfIdfScorer.name}.'
+    )
+    parser.add_argument(
+        '--k1',
+        type = float,
+        default = DEFAULT_K1,
+        help = f'BM25 term frequency saturation. Default is {DEFAULT_K1}.'
+    )
+    parser.add_argument(
+        '--b',
+        type = float,
+        default = DEFAULT_B,
+        help = f'BM25 length normalization. Default is {DEFAULT_B}.'
+    )
+    parser.add_argument(
+        '--workers',
+        type = int,
+        default = 1,
+        help = 'Number of worker processes (1 runs in this process, 0 uses every cpu). Default is 1.'
+    )
+    parser.add_argument(
+        '--cache_size',
+        type = int,
+        default = 0,
+        help = 'Query cache size per worker (0 measures every query uncached, like a cold replay). Default is 0.'
+    )
+    parser.add_argument(
+        '--chunk_size',
+        type = int,
+        default = DEFAULT_CHUNK_SIZE,
+        help = f'Number of queries handed out and written at a time. Default is {DEFAULT_CHUNK_SIZE}.'
+    )
+    return parser.parse_args()
+
+def readQueries(lines, defaults):
+    """
+        turns the lines of a query file into (query, options) jobs.
+        lines that cannot be run become (line, error message).
+
+        input:
+            - lines: iterable of lines
+            - defaults: options of queries that do not set their own (command line)
+
+        output: generator of (query, options or None, error or None)
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line.startswith('{'):
+                try:
+                    values = json.loads(line)
+                except ValueError:
+                    raise RequestError("line is not valid JSON")
+                if not isinstance(values, dict) or not isinstance(values.get('q'), str) or not values['q'].strip():
+                    raise RequestError("missing query 'q'")
+                yield values['q'], searchOptions(values, defaults), None
+            else:
+                yield line, searchOptions({}, defaults), None
+        except RequestError as e:
+            yield line, None, str(e)
+
+def runJobs(service, jobs):
+    """
+        runs (query, options, error) jobs and times every query.
+
+        output: list of response dictionaries with their latency in milliseconds
+    """
+    responses = []
+    for query, options, error in jobs:
+        if error is not None:
+            responses.append({'query': query, 'error': error})
+            continue
+        start = time.perf_counter()
+        response = service.search(query, **options)
+        response['latency_ms'] = (time.perf_counter() - start) * 1000
+        responses.append(response)
+    return responses
+
+def _initWorker(index_path, cache_size):
+    """
+        opens the index once per pool worker
+    """
+    global _service
+    index = loadIndex(index_path)
+    if index is None:
+        raise RuntimeError(f"cannot load the index '{index_path}'")
+    _service = SearchService(index, cache_size)
+
+def _runChunk(jobs):
+    return runJobs(_service, jobs)
+
+def percentile(sorted_values, p):
+    """
+        nearest-rank percentile (p in 0 - 100) of an ascending list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(-(-p * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+def main():
+    args = parse_arguments()
+    defaults = {'n': args.top_n, 'context_size': args.context_size, 'ranking': args.ranking, 'k1': args.k1, 'b': args.b}
+    try:
+        searchOptions({}, defaults)
+    except RequestError as e:
+        print(f"Invalid option: {e}", file = sys.stderr)
+        return
+
+    # open the index once before writing anything: a missing index is reported here instead of
+    # breaking every pool worker (a memory-mapped directory only reads its term dictionary header)
+    index = loadIndex(args.index)
+    if index is None:
+        return
+
+    input_file = sys.stdin if args.queries == '-' else open(args.queries, 'r', encoding = 'utf-8')
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w', encoding = 'utf-8')
+    jobs = readQueries(input_file, defaults)
+    chunks = iter(lambda: list(itertools.islice(jobs, max(args.chunk_size, 1))), [])
+
+    latencies = []
+    num_queries = 0
+    errors = 0
+    pool = None
+    start = time.perf_counter()
+    try:
+        if args.workers == 1:
+            service = SearchService(index, args.cache_size)
+            chunk_responses = (runJobs(service, chunk) for chunk in chunks)
+        else:
+            # the workers open their own copy of the index
+            index = None
+            workers = args.workers or os.cpu_count() or 1
+            pool = ProcessPoolExecutor(max_workers = workers, initializer = _initWorker,
+                                       initargs = (args.index, args.cache_size))
+            # every chunk is split into one piece per worker, the chunks keep the input order
+
+            def runChunk(chunk):
+                size = max(-(-len(chunk) // workers), 1)
+                pieces = [chunk[i:i + size] for i in range(0, len(chunk), size)]
+                return [response for piece in pool.map(_runChunk, pieces) for response in piece]
+
+            chunk_responses = (runChunk(chunk) for chunk in chunks)
+        # the clock starts once the index is open (pool workers open it, memory-mapped, with their first piece)
+        start = time.perf_counter()
+
+        for responses in chunk_responses:
+            for response in responses:
+                num_queries += 1
+                if 'error' in response:
+                    errors += 1
+                else:
+                    latencies.append(response['latency_ms'])
+                output_file.write(json.dumps(response) + '\n')
+    except BrokenProcessPool as e:
+        print(f"error: a search worker failed: {e}", file = sys.stderr)
+        return
+    finally:
+        elapsed = time.perf_counter() - start
+        if pool is not None:
+            pool.shutdown()
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    # the report goes to stderr, stdout may be the results
+    latencies.sort()
+    report = sys.stderr
+    print(f"Queries:         {num_queries:12,d} ({errors} could not be run)", file = report)
+    print(f"Elapsed:         {elapsed:12.3f} sec", file = report)
+    print(f"Throughput:      {num_queries / elapsed if elapsed else 0.0:12,.1f} queries/sec", file = report)
+    if latencies:
+        print(f"Latency mean:    {sum(latencies) / len(latencies):12.3f} ms", file = report)
+        for p in (50, 95, 99):
+            print(f"Latency p{p}:     {percentile(latencies, p):12.3f} ms", file = report)
+        print(f"Latency max:     {latencies[-1]:12.3f} ms", file = report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+'''
+Description: block-compressed text files, used for the combined documents file
+(see processFiles.py and invertedIndex.py) when its name ends in ".gz".
+
+The file is a series of independent gzip members ("blocks"), every one holding
+whole lines of about DEFAULT_BLOCK_SIZE bytes. A concatenation of gzip members
+is itself a valid gzip file, so gzip, zcat and python's gzip module read it
+like any .gz file (mrjob only decompresses the first member, so the MapReduce
+job gets the byte ranges of the blocks as its input, see writeSplits). The header of every block has an extra
+field (RFC 1952, subfield "IB") with the size of the block in the file and the
+size of its text:
+
+    1f 8b 08 04 | mtime 0 | xfl 0 | os 255 | xlen 12 | 'I' 'B' | len 8 |
+    block size (uint32) | text size (uint32) | deflate data | crc32 | text size
+
+so the block index (offset, size and text size of every block) is read by
+jumping from header to header, without decompressing anything. Readers split
+the file into byte ranges on block boundaries (one per worker) and decompress a
+range block by block, so their memory does not depend on the size of the file.
+A plain .gz file (without the block headers) can still be read, but only as a
+single range.
+'''
+
+import os
+import zlib
+import struct
+
+from fileIO import openOutput
+
+# suffix of the block-compressed files
+COMPRESSED_SUFFIX = '.gz'
+
+# text bytes per block (a block always ends at the end of a line, a longer line gets a block of its own)
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# zlib compression level of the blocks
+DEFAULT_LEVEL = 6
+
+# gzip header with the extra field: magic, method, flags (FEXTRA), mtime, xfl, os, xlen,
+# subfield id, subfield length, block size, text size
+HEADER = struct.Struct('<4BIBBH2sHII')
+SUBFIELD_ID = b'IB'
+FEXTRA = 4
+
+# size of the compressed reads of a range
+READ_SIZE = 256 * 1024
+
+def isCompressed(path):
+    """
+        true if the file is (to be) written block-compressed, i.e. its name ends in .gz
+    """
+    return path.endswith(COMPRESSED_SUFFIX)
+
+def compressBlock(data, level = DEFAULT_LEVEL):
+    """
+        compresses the bytes of a block into a gzip member with the block header
+
+        input:
+            - data: the text of the block (utf-8 bytes)
+            - level: zlib compression level
+
+        output: the bytes of the gzip member
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = HEADER.size + len(deflated) + 8
+    if block_size > 0xffffffff or len(data) > 0xffffffff:
+        raise ValueError(f"block of {len(data)} bytes is too large for a block header")
+    header = HEADER.pack(0x1f, 0x8b, zlib.DEFLATED, FEXTRA, 0, 0, 255, 12, SUBFIELD_ID, 8, block_size, len(data))
+    return header + deflated + struct.pack('<II', zlib.crc32(data), len(data))
+
+class BlockWriter:
+    """
+        text file (write, writelines, close, with) writing utf-8 lines into gzip blocks.
+
+        - block_size: text bytes per block
+        - level: zlib compression level
+    """
+
+    def __init__(self, path, block_size = DEFAULT_BLOCK_SIZE, level = DEFAULT_LEVEL):
+        self.file = open(path, 'wb')
+        self.block_size = max(block_size, 1)
+        self.level = level
+        self.pending = []
+        self.pending_size = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= self.block_size:
+            self._flushBlock()
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _flushBlock(self, final = False):
+        """
+            compresses the complete lines written so far into a block (everything if final)
+        """
+        data = b''.join(self.pending)
+        cut = len(data) if final else data.rfind(b'\n') + 1
+        rest = data[cut:]
+        self.pending = [rest] if rest else []
+        self.pending_size = len(rest)
+        if cut:
+            self.file.write(compressBlock(data[:cut], self.level))
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            self._flushBlock(final = True)
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def openTextOutput(path):
+    """
+        opens a utf-8 text file for writing: block-compressed if its name ends in .gz
+        (BlockWriter), a buffered plain file otherwise (see fileIO.openOutput)
+    """
+    return BlockWriter(path) if isCompressed(path) else openOutput(path)
+
+def readBlockIndex(path):
+    """
+        reads the block index of a block-compressed file from the block headers
+
+        input:
+            - path: path to the file
+
+        output: list of (offset, block size, text size) of every block, in file order
+                (ValueError if the file is not block-compressed)
+    """
+    blocks = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        offset = 0
+        while offset < size:
+            file.seek(offset)
+            header = file.read(HEADER.size)
+            fields = HEADER.unpack(header) if len(header) == HEADER.size else None
+            if (fields is None or fields[:4] != (0x1f, 0x8b, zlib.DEFLATED, FEXTRA) or fields[7] != 12
+                    or fields[8] != SUBFIELD_ID or fields[9] != 8 or fields[10] <= HEADER.size):
+                raise ValueError(f"'{path}' has no block header at offset {offset}")
+            blocks.append((offset, fields[10], fields[11]))
+            offset += fields[10]
+    return blocks
+
+def textSize(path):
+    """
+        returns the size of the text of a block-compressed file (the file size for a plain .gz file)
+    """
+    try:
+        return sum(text_size for _, _, text_size in readBlockIndex(path))
+    except ValueError:
+        return os.path.getsize(path)
+
+def splitBlocks(path, num_parts):
+    """
+        splits a block-compressed file into ranges of whole blocks with about the same amount of text
+
+        input:
+            - path: path to the file
+            - num_parts: number of ranges to split into
+
+        output: list of (start, end) byte offsets, in file order (a plain .gz file is one range)
+    """
+    size = os.path.getsize(path)
+    try:
+        blocks = readBlockIndex(path)
+    except ValueError:
+        # without the block headers the members cannot be found without decompressing
+        return [(0, size)] if size else []
+
+    total = sum(text_size for _, _, text_size in blocks)
+    boundaries = [0]
+    text_so_far = 0
+    for offset, block_size, text_size in blocks:
+        # the next range starts at the first block after the next share of the text
+        if len(boundaries) < num_parts and text_so_far >= total * len(boundaries) / num_parts and offset > boundaries[-1]:
+            boundaries.append(offset)
+        text_so_far += text_size
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def writeSplits(path, splits_file):
+    """
+        writes the byte ranges of the blocks of a block-compressed file, one "start end" line per
+        block, as the input of a MapReduce job whose mappers decompress them (see mapReduceWordCount.py)
+
+        input:
+            - path: path to the block-compressed file
+            - splits_file: path to the ranges file to write
+
+        output: number of ranges (a plain .gz file is one range)
+    """
+    try:
+        ranges = [(offset, offset + block_size) for offset, block_size, _ in readBlockIndex(path)]
+    except ValueError:
+        ranges = splitBlocks(path, 1)
+    with open(splits_file, 'w', encoding = 'utf-8') as f:
+        f.writelines(f"{start} {end}\n" for start, end in ranges)
+    return len(ranges)
+
+def readBlockLines(path, start = 0, end = None):
+    """
+        streams the lines of the blocks between the byte offsets start and end (see splitBlocks),
+        decompressing one read at a time
+
+        input:
+            - path: path to the file (block-compressed, or any gzip file with start 0 and no end)
+            - start, end: byte offsets of the range (default: the whole file)
+
+        output: yields every line as utf-8 bytes, with its newline
+    """
+    if end is None:
+        end = os.path.getsize(path)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    in_member = False
+    rest = b''
+    with open(path, 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            data = file.read(min(READ_SIZE, end - position))
+            if not data:
+                break
+            position += len(data)
+            while data:
+                text = decompressor.decompress(data)
+                in_member = True
+                data = b''
+                if decompressor.eof:
+                    # next member (block), the bytes read past the end of this one belong to it
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    in_member = False
+                if not text:
+                    continue
+                lines = (rest + text).split(b'\n')
+                rest = lines.pop()
+                for line in lines:
+                    yield line + b'\n'
+    if in_member:
+        raise ValueError(f"'{path}' ends in the middle of a block (truncated file or range)")
+    if rest:
+        yield rest
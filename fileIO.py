@@ -0,0 +1,122 @@
+'''
+Description: bulk file I/O of the processing pipeline (processFiles.py,
+invertedIndex.py, updateIndex.py and utils/). The collections are made of
+many small files, so the cost per file matters more than the cost per byte:
+    - a directory is listed with a single os.scandir (the file types come
+      with the listing, no extra stat per file)
+    - a file is read with one unbuffered read() and decoded once, instead of
+      a text wrapper building a list of lines that is joined back together
+      (files of MMAP_THRESHOLD bytes or more are decoded straight from a memory map)
+    - with several threads, the next files are opened and read while the
+      current one is processed, which hides the latency of a network filesystem
+    - output files get a large write buffer and are written in batches of lines
+
+The text is the same as reading the file in text mode: utf-8, and "\\r\\n" and
+"\\r" line ends become "\\n" (universal newlines), so the outputs do not change.
+'''
+
+import os
+import mmap
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+# files at least this large are decoded from a memory map instead of being read into memory first (bytes)
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# write buffer of the output files (bytes)
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+def listFiles(input_dir):
+    """
+        lists the regular files of a directory (symlinks to files included), in directory order
+
+        input:
+            - input_dir: the directory
+
+        output: list of filenames
+    """
+    with os.scandir(input_dir) as entries:
+        return [entry.name for entry in entries if entry.is_file()]
+
+def decodeText(data):
+    """
+        decodes utf-8 file contents like a file opened in text mode (universal newlines)
+
+        input:
+            - data: bytes (or any buffer, e.g. a memory map)
+
+        output: the text
+    """
+    text = str(data, 'utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+def readText(path):
+    """
+        reads a whole utf-8 text file in one read (or through a memory map if it is large)
+
+        input:
+            - path: path to the file
+
+        output: the text, like open(path, 'r', encoding = 'utf-8').read()
+    """
+    with open(path, 'rb', buffering = 0) as file:
+        if os.fstat(file.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                return decodeText(data)
+        return decodeText(file.read())
+
+def splitLines(text):
+    """
+        splits a text into the lines readlines() would return, without their line ends
+        (a text that ends with a newline has no empty last line, an empty text has no lines)
+    """
+    lines = text.split('\n')
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+def _readFile(input_dir, filename):
+    """
+        returns (filename, text, None), or (filename, None, error) if the file cannot be read
+    """
+    try:
+        return filename, readText(os.path.join(input_dir, filename)), None
+    except Exception as e:
+        return filename, None, e
+
+def readFiles(input_dir, filenames, threads = 1):
+    """
+        reads files of a directory, on a thread pool with several threads. only a few files per
+        thread are read ahead, so a large directory is never held in memory at once.
+
+        input:
+            - input_dir: the directory
+            - filenames: the files to read
+            - threads: number of reading threads (1: read each file when it is needed)
+
+        output: generator of (filename, text or None, error or None) in the order of filenames,
+                an unreadable file (missing, not utf-8, ...) comes with its exception
+    """
+    if threads <= 1:
+        for filename in filenames:
+            yield _readFile(input_dir, filename)
+        return
+
+    with ThreadPoolExecutor(max_workers = threads) as executor:
+        remaining = iter(filenames)
+        pending = []
+        while True:
+            # keep four files per thread in flight
+            for filename in itertools.islice(remaining, 4 * threads - len(pending)):
+                pending.append(executor.submit(_readFile, input_dir, filename))
+            if not pending:
+                return
+            yield pending.pop(0).result()
+
+def openOutput(path):
+    """
+        opens a utf-8 text file for writing with a large buffer (WRITE_BUFFER_SIZE)
+    """
+    return open(path, 'w', encoding = 'utf-8', buffering = WRITE_BUFFER_SIZE)
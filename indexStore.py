@@ -0,0 +1,1232 @@
+'''
+Description: in-memory and memory-mapped representations of the inverted index.
+
+Documents are stored once in a document table (doc id -> filename, title,
+length) and every term keeps its postings sorted by doc id, compressed with the
+delta + varint block codec from postingsCodec.py (decoded on demand into two
+parallel arrays of doc ids and counts).
+
+Everything tf-idf needs is computed at build time: the idf of every term and,
+aligned with its postings, the normalized term frequency (count / document
+length) of every posting. For BM25 the average document length and the
+length normalization factor (length / average length) of every document are
+stored as well. Searching only needs the index itself.
+
+Instead of context strings every posting stores the token positions of the
+term in its document, and the tokenized documents are kept once in a
+compressed forward store. Context snippets are cut from the forward store at
+query time, so their size is chosen when searching, not when building.
+
+On disk an index is stored as a directory with the following files:
+    - meta.json: format version, build id, basic counts, the stopwords and the
+      tokenizer configuration (see tokenizer.py) the index was built with
+    - docs.bin: document table (doc id -> filename, title, length, length / average length)
+    - terms.bin: sorted term dictionary (with idf), binary searched in place
+    - postings.bin: compressed postings list of every term
+    - weights.bin: float32 normalized term frequency of every posting
+    - positions.bin: token positions of every posting
+    - forward.bin: zlib compressed tokens of every document (for the context snippets)
+
+Segments of an index built in parallel (one per shard of documents) are
+combined by mergeIndexes, a k-way merge over their sorted term dictionaries.
+
+An index that is updated incrementally (see updateIndex.py) is a directory of
+segments instead:
+    - segments.json: format version, build id, generation and the list of segments
+    - segment_<generation>/: one regular index directory per segment
+    - segment_<generation>/deletes_<generation>.bin: tombstone bitmap of the documents
+      of the segment that were deleted or replaced after it was written
+SegmentedIndex reads the segments as one index (doc ids run through the
+segments in order) and mergeIndexes drops the tombstoned documents when
+segments are merged.
+
+All binary files are opened with mmap, so opening an index is near-instant,
+a query only touches the pages of the terms it looks up, and several search
+processes share the same pages through the OS page cache. Every file is
+written next to the old one and then moved over it (meta.json last), so an
+index can be rebuilt in place while a search server still has the old files
+mapped: it keeps reading them until it reopens the index.
+'''
+
+import os
+import sys
+import json
+import math
+import mmap
+import heapq
+import zlib
+import uuid
+import struct
+import itertools
+from array import array
+from contextlib import contextmanager
+
+from bisect import bisect_right
+
+import numpy as np
+
+from postingsCodec import encodePostings, decodePostings, decodePostingsArrays, documentFrequency, PostingsReader, \
+    encodePositions, decodePositions, concatPositions, selectPositions
+from tokenizer import contextWindow, DEFAULT_CONTEXT_SIZE, DEFAULT_TOKENIZER, Tokenizer
+
+# format version written to meta.json and the binary headers
+FORMAT_VERSION = 8
+
+META_FILE = 'meta.json'
+DOCS_FILE = 'docs.bin'
+TERMS_FILE = 'terms.bin'
+POSTINGS_FILE = 'postings.bin'
+WEIGHTS_FILE = 'weights.bin'
+POSITIONS_FILE = 'positions.bin'
+FORWARD_FILE = 'forward.bin'
+SEGMENTS_FILE = 'segments.json'
+
+# header of docs.bin, terms.bin and forward.bin: magic, format version, number of records
+HEADER = struct.Struct('<4sII')
+DOCS_MAGIC = b'IIDX'
+TERMS_MAGIC = b'IITM'
+FORWARD_MAGIC = b'IIFW'
+
+# one entry of the term dictionary:
+# term offset, term length, df, postings offset, postings length, positions offset, positions length,
+# idf, weights offset
+TERM_ENTRY = struct.Struct('<QIIQQQQdQ')
+# offsets into the docs and forward blobs
+DOC_OFFSET = struct.Struct('<Q')
+
+# decoded postings arrays and document lengths hold unsigned 32 bit integers
+POSTINGS_TYPECODE = 'I'
+# normalized term frequencies are stored as 32 bit floats
+WEIGHTS_TYPECODE = 'f'
+
+def encodeTokens(tokens):
+    """
+        compresses the tokens of a document for the forward store
+    """
+    return zlib.compress(' '.join(tokens).encode('utf-8'))
+
+def decodeTokens(data):
+    """
+        returns the tokens of a document from the forward store
+    """
+    return zlib.decompress(data).decode('utf-8').split() if data else []
+
+class Postings:
+    """
+        postings list of a single term: parallel arrays of doc ids and counts
+        (python arrays while building, numpy arrays when read back from an index)
+    """
+    __slots__ = ('doc_ids', 'counts')
+
+    def __init__(self, doc_ids = None, counts = None):
+        self.doc_ids = doc_ids if doc_ids is not None else array(POSTINGS_TYPECODE)
+        self.counts = counts if counts is not None else array(POSTINGS_TYPECODE)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __iter__(self):
+        return zip(self.doc_ids, self.counts)
+
+class InvertedIndex:
+    """
+        in-memory inverted index built by invertedIndex.py.
+
+        - filenames / titles / doc_lengths: document table indexed by doc id
+        - avg_doc_length / length_norms: average document length and length / average length of every document
+        - forward: compressed tokens of every document, indexed by doc id
+        - postings_by_term: word -> compressed postings (see postingsCodec.py)
+        - weights_by_term: word -> count / document length of every posting
+        - positions_by_term: word -> encoded token positions of every posting
+        - idf_by_term: word -> log(total_docs / df)
+        - stop_words: the stopwords left out of the index (searches use the same set)
+        - tokenizer: the Tokenizer the documents were split with (searches split the queries with it)
+        - build_id: random id given by finalize, changes whenever the index is rebuilt
+
+        postings are collected as arrays while building and compressed by finalize,
+        which must be called before the index is queried or saved.
+    """
+
+    # indexes pickled before the tokenizer was stored were built with the default one
+    tokenizer = DEFAULT_TOKENIZER
+
+    def __init__(self, doc_lengths = None, stop_words = frozenset(), tokenizer = None):
+        self.filenames = []
+        self.titles = []
+        self.doc_lengths = array(POSTINGS_TYPECODE)
+        self.avg_doc_length = 0.0
+        self.length_norms = array(WEIGHTS_TYPECODE)
+        self.forward = []
+        self.postings_by_term = {}
+        self.weights_by_term = {}
+        self.positions_by_term = {}
+        self.idf_by_term = {}
+        self.stop_words = frozenset(stop_words)
+        self.tokenizer = tokenizer or DEFAULT_TOKENIZER
+        self.build_id = None
+        # filename -> doc id, word -> Postings and word -> position lists, only needed while building
+        self._doc_ids = {}
+        self._building = {}
+        self._positions = {}
+        # filename -> total words (wordCount.txt). documents missing from it get length 1
+        self._doc_lengths = doc_lengths or {}
+        # N of the idf: every counted document, even the ones without indexed words
+        self.total_docs = len(self._doc_lengths)
+
+    def addDocument(self, filename, title, length = None, tokens = None):
+        """
+            adds a document to the document table (once) and returns its doc id.
+            without a length the one from the doc_lengths given to the constructor is used.
+            tokens (encoded with encodeTokens) go to the forward store, without them
+            the document has no context snippets.
+        """
+        doc_id = self._doc_ids.get(filename)
+        if doc_id is None:
+            doc_id = len(self.filenames)
+            self._doc_ids[filename] = doc_id
+            self.filenames.append(filename)
+            self.titles.append(title)
+            if length is None:
+                length = self._doc_lengths.get(filename, 1)
+            self.doc_lengths.append(max(length, 1))
+            self.forward.append(tokens or b'')
+        return doc_id
+
+    def addPosting(self, word, doc_id, count, positions):
+        """
+            appends a posting for word with the ascending token positions of its occurrences
+        """
+        postings = self._building.get(word)
+        if postings is None:
+            postings = self._building[word] = Postings()
+            self._positions[word] = []
+        postings.doc_ids.append(doc_id)
+        postings.counts.append(count)
+        self._positions[word].append(positions)
+
+    def finalize(self):
+        """
+            sorts every postings list by doc id (postings only arrive out of order
+            when the input was not grouped by document), compresses it, precomputes
+            the idf and the per-posting weights and drops build-only state
+        """
+        if not self.total_docs:
+            self.total_docs = self.num_docs
+        self.avg_doc_length, self.length_norms = _lengthNorms(self.doc_lengths)
+        # caches of search results are keyed by it (see queryCache.py)
+        self.build_id = uuid.uuid4().hex
+
+        for word, postings in self._building.items():
+            doc_ids = postings.doc_ids
+            counts = postings.counts
+            positions = self._positions[word]
+            if any(doc_ids[i] >= doc_ids[i + 1] for i in range(len(doc_ids) - 1)):
+                order = sorted(range(len(doc_ids)), key = doc_ids.__getitem__)
+                doc_ids = [doc_ids[i] for i in order]
+                counts = [counts[i] for i in order]
+                positions = [positions[i] for i in order]
+            self.postings_by_term[word] = encodePostings(doc_ids, counts)
+            self.positions_by_term[word] = encodePositions(positions)
+
+            # normalized term frequency of every posting
+            self.weights_by_term[word] = array(WEIGHTS_TYPECODE, (count / self.doc_lengths[doc_id] for doc_id, count in zip(doc_ids, counts)))
+            self.idf_by_term[word] = math.log(self.total_docs / len(doc_ids))
+        self._building = {}
+        self._positions = {}
+        self._doc_ids = {}
+        self._doc_lengths = {}
+
+    @property
+    def num_docs(self):
+        return len(self.filenames)
+
+    def document(self, doc_id):
+        """
+            returns (filename, title) of the given doc id
+        """
+        return self.filenames[doc_id], self.titles[doc_id]
+
+    def docLength(self, doc_id):
+        """
+            returns the total number of words of the given doc id
+        """
+        return self.doc_lengths[doc_id]
+
+    def lengthNorms(self):
+        """
+            returns the length / average length of every document (indexed by doc id)
+        """
+        return self.length_norms
+
+    def documentTokens(self, doc_id):
+        """
+            returns the tokens of the given doc id from the forward store
+        """
+        return decodeTokens(self.forward[doc_id])
+
+    def deletedDocs(self):
+        """
+            returns the deleted documents (only segmented indexes have any, see SegmentedIndex)
+        """
+        return None
+
+    def encodedPostings(self, word):
+        """
+            returns the compressed postings of a word, or None if the word is not indexed
+        """
+        return self.postings_by_term.get(word)
+
+    def documentFrequency(self, word):
+        """
+            returns the number of documents containing word (0 if it is not indexed)
+        """
+        data = self.postings_by_term.get(word)
+        return documentFrequency(data) if data is not None else 0
+
+    def idf(self, word):
+        """
+            returns the precomputed inverse document frequency of a word
+        """
+        return self.idf_by_term.get(word, 0.0)
+
+    def weights(self, word):
+        """
+            returns count / document length of every posting of a word (aligned with
+            the postings), or None if the word is not indexed
+        """
+        return self.weights_by_term.get(word)
+
+    def postings(self, word):
+        """
+            returns the decoded Postings (numpy arrays) of a word, or None if the word is not indexed
+        """
+        data = self.postings_by_term.get(word)
+        if data is None:
+            return None
+        return Postings(*decodePostingsArrays(data))
+
+    def postingsReader(self, word):
+        """
+            returns a streaming PostingsReader for a word, or None if the word is not indexed
+        """
+        data = self.postings_by_term.get(word)
+        if data is None:
+            return None
+        return PostingsReader(data)
+
+    def encodedPositions(self, word):
+        """
+            returns the encoded token positions of a word, or None if the word is not indexed
+        """
+        return self.positions_by_term.get(word)
+
+    def positions(self, word, i):
+        """
+            returns the token positions of the i-th posting of a word
+        """
+        return decodePositions(self.positions_by_term[word], i)
+
+    def contexts(self, word, i, doc_id, context_size = DEFAULT_CONTEXT_SIZE):
+        """
+            returns the context snippets of the i-th posting of a word (in document doc_id),
+            cut from the forward store with context_size words before and after every occurrence
+        """
+        tokens = self.documentTokens(doc_id)
+        if not tokens:
+            return []
+        return [contextWindow(tokens, position, context_size) for position in self.positions(word, i)]
+
+    def __contains__(self, word):
+        return word in self.postings_by_term
+
+    def __len__(self):
+        return len(self.postings_by_term)
+
+    def keys(self):
+        """
+            yields all terms in sorted order
+        """
+        return iter(sorted(self.postings_by_term))
+
+def writeIndex(index, output_dir):
+    """
+        writes an inverted index to output_dir in the memory-mapped format.
+
+        input:
+            - index: InvertedIndex to write
+            - output_dir: directory to write the index files to
+    """
+    os.makedirs(output_dir, exist_ok = True)
+
+    documents = (index.document(doc_id) for doc_id in range(index.num_docs))
+    _writeDocs(os.path.join(output_dir, DOCS_FILE), documents, index.doc_lengths, index.length_norms)
+    _writeForward(os.path.join(output_dir, FORWARD_FILE), index.forward, index.num_docs)
+
+    # terms are sorted by their utf-8 bytes so lookups can binary search the raw file
+    terms = sorted(index.keys(), key = lambda word: word.encode('utf-8'))
+    num_terms = _writeTerms(output_dir, _termRecords(index, terms))
+
+    _writeMeta(output_dir, num_terms, index.num_docs, index.total_docs, index.avg_doc_length, index.stop_words,
+               index.tokenizer, index.build_id)
+
+def _termRecords(index, terms):
+    """
+        yields (word, postings bytes, weights bytes, positions bytes, idf) of
+        every term of an in-memory index, in the given order
+    """
+    for word in terms:
+        yield (
+            word,
+            index.encodedPostings(word),
+            _toLittleEndian(index.weights(word)),
+            index.encodedPositions(word),
+            index.idf(word)
+        )
+
+@contextmanager
+def _replacingFile(path, mode = 'wb'):
+    """
+        opens a temporary file next to path for writing and moves it over path once it is
+        complete, so the old file is never truncated under a reader that has it memory-mapped
+    """
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, mode, encoding = None if 'b' in mode else 'utf-8') as file:
+            yield file
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _writeTerms(output_dir, records):
+    """
+        writes postings.bin, weights.bin, positions.bin and the term dictionary from a
+        stream of term records (see _termRecords), which must be sorted by utf-8 bytes.
+        only the term dictionary is kept in memory, returns the number of terms.
+    """
+    term_entries = []
+    term_blob = bytearray()
+    with _replacingFile(os.path.join(output_dir, POSTINGS_FILE)) as postings_file, \
+         _replacingFile(os.path.join(output_dir, WEIGHTS_FILE)) as weights_file, \
+         _replacingFile(os.path.join(output_dir, POSITIONS_FILE)) as positions_file:
+        postings_offset = 0
+        weights_offset = 0
+        positions_offset = 0
+        for word, postings_bytes, weights_bytes, positions_bytes, idf in records:
+            # postings: already compressed
+            postings_file.write(postings_bytes)
+            # weights: float32 array aligned with the postings
+            weights_file.write(weights_bytes)
+            # positions: offsets table followed by the positions of each posting
+            positions_file.write(positions_bytes)
+
+            encoded_word = word.encode('utf-8')
+            term_entries.append(TERM_ENTRY.pack(
+                len(term_blob), len(encoded_word), documentFrequency(postings_bytes),
+                postings_offset, len(postings_bytes),
+                positions_offset, len(positions_bytes),
+                idf, weights_offset
+            ))
+            term_blob += encoded_word
+
+            postings_offset += len(postings_bytes)
+            weights_offset += len(weights_bytes)
+            positions_offset += len(positions_bytes)
+
+    # term dictionary: header, fixed width entry table, then the term strings
+    with _replacingFile(os.path.join(output_dir, TERMS_FILE)) as terms_file:
+        terms_file.write(HEADER.pack(TERMS_MAGIC, FORMAT_VERSION, len(term_entries)))
+        terms_file.writelines(term_entries)
+        terms_file.write(term_blob)
+
+    return len(term_entries)
+
+def _writeMeta(output_dir, num_terms, num_docs, total_docs, avg_doc_length, stop_words, tokenizer, build_id = None):
+    """
+        writes meta.json (with a new build id unless one is given)
+    """
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'build_id': build_id or uuid.uuid4().hex,
+        'num_terms': num_terms,
+        'num_docs': num_docs,
+        'total_docs': total_docs,
+        'avg_doc_length': avg_doc_length,
+        'stop_words': sorted(stop_words),
+        'tokenizer': tokenizer.config()
+    }
+    with _replacingFile(os.path.join(output_dir, META_FILE), 'w') as meta_file:
+        json.dump(meta, meta_file, indent = 2)
+
+def _lengthNorms(doc_lengths):
+    """
+        returns the average document length and the length / average length of every document
+    """
+    if not doc_lengths:
+        return 0.0, array(WEIGHTS_TYPECODE)
+    avg_doc_length = sum(doc_lengths) / len(doc_lengths)
+    return avg_doc_length, array(WEIGHTS_TYPECODE, (length / avg_doc_length for length in doc_lengths))
+
+def _writeDocs(path, documents, doc_lengths, length_norms):
+    """
+        writes the document table: header, offsets table, document lengths, length norms and the
+        'filename\\ttitle' strings of the (filename, title) pairs in documents
+    """
+    blob = bytearray()
+    offsets = [0]
+    for filename, title in documents:
+        blob += f"{filename}\t{title}".encode('utf-8')
+        offsets.append(len(blob))
+
+    with _replacingFile(path) as docs_file:
+        docs_file.write(HEADER.pack(DOCS_MAGIC, FORMAT_VERSION, len(doc_lengths)))
+        docs_file.writelines(DOC_OFFSET.pack(offset) for offset in offsets)
+        docs_file.write(_toLittleEndian(doc_lengths))
+        docs_file.write(_toLittleEndian(length_norms))
+        docs_file.write(blob)
+
+def _writeForward(path, texts, num_docs):
+    """
+        writes the forward store: header, offsets table and the compressed tokens of
+        every document (texts yields the encoded tokens of each doc id in order)
+    """
+    with _replacingFile(path) as forward_file:
+        forward_file.write(HEADER.pack(FORWARD_MAGIC, FORMAT_VERSION, num_docs))
+        # the offsets table is written before the texts, so leave room for it
+        table_start = forward_file.tell()
+        forward_file.write(bytes((num_docs + 1) * DOC_OFFSET.size))
+        offsets = [0]
+        for text in texts:
+            forward_file.write(text)
+            offsets.append(offsets[-1] + len(text))
+        forward_file.seek(table_start)
+        forward_file.writelines(DOC_OFFSET.pack(offset) for offset in offsets)
+
+def _toLittleEndian(values):
+    """
+        returns the raw little-endian bytes of an array
+    """
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _fromLittleEndian(typecode, data):
+    """
+        returns an array of the given typecode from raw little-endian bytes
+    """
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def _mapFile(path):
+    """
+        memory maps a file read-only (empty files cannot be mapped, so they map to b'')
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+class MappedIndex:
+    """
+        read-only view of an index directory written by writeIndex.
+        exposes the same lookup methods as InvertedIndex.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+
+        with open(os.path.join(index_dir, META_FILE), 'r', encoding = 'utf-8') as meta_file:
+            self.meta = json.load(meta_file)
+        if self.meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"unsupported index format version: {self.meta.get('format_version')}")
+
+        self._docs = _mapFile(os.path.join(index_dir, DOCS_FILE))
+        self._terms = _mapFile(os.path.join(index_dir, TERMS_FILE))
+        self._postings = _mapFile(os.path.join(index_dir, POSTINGS_FILE))
+        self._weights = _mapFile(os.path.join(index_dir, WEIGHTS_FILE))
+        self._positions = _mapFile(os.path.join(index_dir, POSITIONS_FILE))
+        self._forward = _mapFile(os.path.join(index_dir, FORWARD_FILE))
+
+        # check the headers before trusting any offsets
+        magic, version, self.num_docs = HEADER.unpack_from(self._docs, 0)
+        if magic != DOCS_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"'{DOCS_FILE}' is not a valid document table")
+        magic, version, self.num_terms = HEADER.unpack_from(self._terms, 0)
+        if magic != TERMS_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"'{TERMS_FILE}' is not a valid term dictionary")
+        magic, version, num_forward = HEADER.unpack_from(self._forward, 0)
+        if magic != FORWARD_MAGIC or version != FORMAT_VERSION or num_forward != self.num_docs:
+            raise ValueError(f"'{FORWARD_FILE}' is not a valid forward store")
+        self.total_docs = self.meta.get('total_docs', self.num_docs)
+        self.avg_doc_length = self.meta.get('avg_doc_length', 0.0)
+        self.stop_words = frozenset(self.meta.get('stop_words', ()))
+        # indexes written before the tokenizer was stored use the default one
+        self.tokenizer = Tokenizer.fromConfig(self.meta.get('tokenizer'))
+        # indexes written before build ids were stored fall back to the time meta.json was written
+        self.build_id = self.meta.get('build_id') or str(os.stat(os.path.join(index_dir, META_FILE)).st_mtime_ns)
+
+        # the term strings start right after the entry table
+        self._term_blob_start = HEADER.size + self.num_terms * TERM_ENTRY.size
+        # the document lengths follow the offsets table, then the length norms and the document strings
+        self._doc_lengths_start = HEADER.size + (self.num_docs + 1) * DOC_OFFSET.size
+        self._length_norms_start = self._doc_lengths_start + self.num_docs * 4
+        self._doc_blob_start = self._length_norms_start + self.num_docs * 4
+        self._length_norms = None
+        # the compressed documents follow the offsets table of the forward store
+        self._forward_blob_start = HEADER.size + (self.num_docs + 1) * DOC_OFFSET.size
+
+    def _termEntry(self, i):
+        return TERM_ENTRY.unpack_from(self._terms, HEADER.size + i * TERM_ENTRY.size)
+
+    def _termAt(self, entry):
+        start = self._term_blob_start + entry[0]
+        return self._terms[start:start + entry[1]]
+
+    def _findTerm(self, word):
+        """
+            binary searches the term dictionary, returns the term entry or None
+        """
+        key = word.encode('utf-8')
+        low, high = 0, self.num_terms
+        while low < high:
+            mid = (low + high) // 2
+            entry = self._termEntry(mid)
+            term = self._termAt(entry)
+            if term < key:
+                low = mid + 1
+            elif term > key:
+                high = mid
+            else:
+                return entry
+        return None
+
+    def document(self, doc_id):
+        """
+            returns (filename, title) of the given doc id
+        """
+        start, end = struct.unpack_from('<QQ', self._docs, HEADER.size + doc_id * DOC_OFFSET.size)
+        text = self._docs[self._doc_blob_start + start:self._doc_blob_start + end].decode('utf-8')
+        filename, _, title = text.partition('\t')
+        return filename, title
+
+    def docLength(self, doc_id):
+        """
+            returns the total number of words of the given doc id
+        """
+        return struct.unpack_from('<I', self._docs, self._doc_lengths_start + doc_id * 4)[0]
+
+    def lengthNorms(self):
+        """
+            returns the length / average length of every document (indexed by doc id)
+        """
+        # read once, the table is small (4 bytes per document)
+        if self._length_norms is None:
+            self._length_norms = _fromLittleEndian(WEIGHTS_TYPECODE, self._docs[self._length_norms_start:self._doc_blob_start])
+        return self._length_norms
+
+    def _documentText(self, doc_id):
+        """
+            returns the compressed tokens of the given doc id
+        """
+        start, end = struct.unpack_from('<QQ', self._forward, HEADER.size + doc_id * DOC_OFFSET.size)
+        return self._forward[self._forward_blob_start + start:self._forward_blob_start + end]
+
+    def documentTokens(self, doc_id):
+        """
+            returns the tokens of the given doc id from the forward store
+        """
+        return decodeTokens(self._documentText(doc_id))
+
+    def documentLengths(self):
+        """
+            returns the total number of words of every document (indexed by doc id)
+        """
+        return _fromLittleEndian(POSTINGS_TYPECODE, self._docs[self._doc_lengths_start:self._length_norms_start])
+
+    def deletedDocs(self):
+        """
+            returns the deleted documents (only segmented indexes have any, see SegmentedIndex)
+        """
+        return None
+
+    def encodedPostings(self, word):
+        """
+            returns the compressed postings of a word, or None if the word is not indexed
+        """
+        entry = self._findTerm(word)
+        if entry is None:
+            return None
+
+        postings_offset, postings_length = entry[3], entry[4]
+        return self._postings[postings_offset:postings_offset + postings_length]
+
+    def documentFrequency(self, word):
+        """
+            returns the number of documents containing word (0 if it is not indexed)
+        """
+        entry = self._findTerm(word)
+        return entry[2] if entry is not None else 0
+
+    def idf(self, word):
+        """
+            returns the precomputed inverse document frequency of a word
+        """
+        entry = self._findTerm(word)
+        return entry[7] if entry is not None else 0.0
+
+    def weights(self, word):
+        """
+            returns count / document length of every posting of a word (aligned with
+            the postings), or None if the word is not indexed
+        """
+        entry = self._findTerm(word)
+        if entry is None:
+            return None
+
+        df, weights_offset = entry[2], entry[8]
+        return _fromLittleEndian(WEIGHTS_TYPECODE, self._weights[weights_offset:weights_offset + df * 4])
+
+    def postings(self, word):
+        """
+            returns the decoded Postings (numpy arrays) of a word, or None if the word is not indexed
+        """
+        data = self.encodedPostings(word)
+        if data is None:
+            return None
+        return Postings(*decodePostingsArrays(data))
+
+    def postingsReader(self, word):
+        """
+            returns a streaming PostingsReader for a word, or None if the word is not indexed
+        """
+        data = self.encodedPostings(word)
+        if data is None:
+            return None
+        return PostingsReader(data)
+
+    def encodedPositions(self, word):
+        """
+            returns the encoded token positions of a word, or None if the word is not indexed
+        """
+        entry = self._findTerm(word)
+        if entry is None:
+            return None
+
+        positions_offset, positions_length = entry[5], entry[6]
+        return self._positions[positions_offset:positions_offset + positions_length]
+
+    def positions(self, word, i):
+        """
+            returns the token positions of the i-th posting of a word
+        """
+        data = self.encodedPositions(word)
+        return decodePositions(data, i) if data is not None else []
+
+    def contexts(self, word, i, doc_id, context_size = DEFAULT_CONTEXT_SIZE):
+        """
+            returns the context snippets of the i-th posting of a word (in document doc_id),
+            cut from the forward store with context_size words before and after every occurrence
+        """
+        tokens = self.documentTokens(doc_id)
+        if not tokens:
+            return []
+        return [contextWindow(tokens, position, context_size) for position in self.positions(word, i)]
+
+    def __contains__(self, word):
+        return self._findTerm(word) is not None
+
+    def __len__(self):
+        return self.num_terms
+
+    def keys(self):
+        """
+            yields all terms in sorted order
+        """
+        for i in range(self.num_terms):
+            yield self._termAt(self._termEntry(i)).decode('utf-8')
+
+    def close(self):
+        for mapped in (self._docs, self._terms, self._postings, self._weights, self._positions, self._forward):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+def readSegments(index_dir):
+    """
+        reads segments.json of a segmented index directory
+
+        output: the manifest dictionary, or None if the directory is not a segmented index
+    """
+    path = os.path.join(index_dir, SEGMENTS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding = 'utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"unsupported index format version: {manifest.get('format_version')}")
+    return manifest
+
+def writeSegments(index_dir, manifest):
+    """
+        writes segments.json with a new build id. the file is replaced atomically, so
+        readers see either the old or the new list of segments, never a mix.
+
+        input:
+            - index_dir: path to the segmented index directory
+            - manifest: dictionary with the 'generation' and the 'segments' (name, num_docs,
+                        deletes, num_deleted) plus any other fields of the writer
+    """
+    manifest = dict(manifest, format_version = FORMAT_VERSION, build_id = uuid.uuid4().hex)
+    path = os.path.join(index_dir, SEGMENTS_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding = 'utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent = 2)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(temp_path, path)
+
+def writeTombstones(path, deleted):
+    """
+        writes the tombstone bitmap of a segment (one bit per document, set if deleted)
+    """
+    with open(path, 'wb') as tombstones_file:
+        tombstones_file.write(np.packbits(deleted, bitorder = 'little').tobytes())
+
+def readTombstones(path, num_docs):
+    """
+        reads the tombstone bitmap of a segment
+
+        output: numpy bool array, true for the deleted doc ids of the segment
+    """
+    with open(path, 'rb') as tombstones_file:
+        bits = np.frombuffer(tombstones_file.read(), dtype = np.uint8)
+    return np.unpackbits(bits, count = num_docs, bitorder = 'little').astype(bool)
+
+def segmentTombstones(index_dir, entry):
+    """
+        returns the deleted doc ids of a segment listed in segments.json as a bool array
+    """
+    if not entry.get('deletes'):
+        return np.zeros(entry['num_docs'], dtype = bool)
+    return readTombstones(os.path.join(index_dir, entry['name'], entry['deletes']), entry['num_docs'])
+
+class _ChainedPostingsReader:
+    """
+        PostingsReader over the postings lists of a term in several segments: the lists
+        are read one after the other, with the doc ids shifted by the doc id base of
+        their segment and positions counted over all of them
+    """
+
+    def __init__(self, parts):
+        # (PostingsReader, doc id base, postings in the parts before) of every part, in order
+        self.parts = parts
+        self.df = sum(len(reader) for reader, _, _ in parts)
+        self._part = 0
+
+    def __len__(self):
+        return self.df
+
+    def next(self):
+        while self._part < len(self.parts):
+            reader, base, _ = self.parts[self._part]
+            posting = reader.next()
+            if posting is not None:
+                return posting[0] + base, posting[1]
+            self._part += 1
+        return None
+
+    def position(self):
+        reader, _, before = self.parts[self._part]
+        return before + reader.position()
+
+    def skipTo(self, target):
+        while self._part < len(self.parts):
+            # parts that end before the next part starts at or below target are passed over undecoded
+            if self._part + 1 < len(self.parts) and self.parts[self._part + 1][1] <= target:
+                self._part += 1
+                continue
+            reader, base, _ = self.parts[self._part]
+            posting = reader.skipTo(target - base)
+            if posting is not None:
+                return posting[0] + base, posting[1]
+            self._part += 1
+        return None
+
+    def __iter__(self):
+        while self._part < len(self.parts):
+            reader, base, _ = self.parts[self._part]
+            for doc_id, count in reader:
+                yield doc_id + base, count
+            self._part += 1
+
+class SegmentedIndex:
+    """
+        read-only view of a segmented index directory (see updateIndex.py): the
+        segments listed in segments.json are read as one index, the doc ids of every
+        segment shifted past the documents of the segments before it.
+        exposes the same lookup methods as MappedIndex.
+
+        the idf and the BM25 length norms are computed over all segments when a term
+        is looked up. documents deleted after their segment was written are only
+        marked in its tombstone bitmap: deletedDocs tells the search to skip them, but
+        (like in the postings) they still count in the document frequencies and the
+        average length until their segment is merged.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.manifest = readSegments(index_dir)
+        if self.manifest is None:
+            raise FileNotFoundError(f"'{os.path.join(index_dir, SEGMENTS_FILE)}' does not exist")
+
+        self.segments = []
+        self.doc_bases = []
+        self.num_docs = 0
+        deleted = []
+        try:
+            for entry in self.manifest['segments']:
+                segment = MappedIndex(os.path.join(index_dir, entry['name']))
+                self.segments.append(segment)
+                self.doc_bases.append(self.num_docs)
+                self.num_docs += segment.num_docs
+                deleted.append(segmentTombstones(index_dir, entry))
+        except Exception:
+            self.close()
+            raise
+
+        self.total_docs = sum(segment.total_docs for segment in self.segments)
+        self.stop_words = frozenset().union(*(segment.stop_words for segment in self.segments))
+        try:
+            self.tokenizer = _commonTokenizer(self.segments)
+        except ValueError:
+            self.close()
+            raise
+        self.build_id = self.manifest['build_id']
+        self._deleted = np.concatenate(deleted) if deleted else np.zeros(0, dtype = bool)
+        self.num_deleted = int(self._deleted.sum())
+        self._length_norms = None
+        self._num_terms = None
+
+    def _segmentOf(self, doc_id):
+        """
+            returns the segment number and the doc id inside the segment of a doc id
+        """
+        n = bisect_right(self.doc_bases, doc_id) - 1
+        return n, doc_id - self.doc_bases[n]
+
+    def _termParts(self, word):
+        """
+            returns (segment number, term entry) of every segment containing word, in order
+        """
+        parts = []
+        for n, segment in enumerate(self.segments):
+            entry = segment._findTerm(word)
+            if entry is not None:
+                parts.append((n, entry))
+        return parts
+
+    def document(self, doc_id):
+        """
+            returns (filename, title) of the given doc id
+        """
+        n, local_id = self._segmentOf(doc_id)
+        return self.segments[n].document(local_id)
+
+    def docLength(self, doc_id):
+        """
+            returns the total number of words of the given doc id
+        """
+        n, local_id = self._segmentOf(doc_id)
+        return self.segments[n].docLength(local_id)
+
+    def lengthNorms(self):
+        """
+            returns the length / average length of every document (indexed by doc id),
+            with the average over all segments
+        """
+        if self._length_norms is None:
+            doc_lengths = array(POSTINGS_TYPECODE)
+            for segment in self.segments:
+                doc_lengths += segment.documentLengths()
+            _, self._length_norms = _lengthNorms(doc_lengths)
+        return self._length_norms
+
+    def documentTokens(self, doc_id):
+        """
+            returns the tokens of the given doc id from the forward store of its segment
+        """
+        n, local_id = self._segmentOf(doc_id)
+        return self.segments[n].documentTokens(local_id)
+
+    def deletedDocs(self):
+        """
+            returns a numpy bool array marking the deleted doc ids, or None if no document is deleted
+        """
+        return self._deleted if self.num_deleted else None
+
+    def documentFrequency(self, word):
+        """
+            returns the number of documents containing word (0 if it is not indexed)
+        """
+        return sum(entry[2] for _, entry in self._termParts(word))
+
+    def idf(self, word):
+        """
+            returns the inverse document frequency of a word over all segments
+        """
+        df = self.documentFrequency(word)
+        return math.log(self.total_docs / df) if df else 0.0
+
+    def weights(self, word):
+        """
+            returns count / document length of every posting of a word (aligned with
+            the postings), or None if the word is not indexed
+        """
+        parts = self._termParts(word)
+        if not parts:
+            return None
+        weights = array(WEIGHTS_TYPECODE)
+        for n, _ in parts:
+            weights += self.segments[n].weights(word)
+        return weights
+
+    def postings(self, word):
+        """
+            returns the decoded Postings (numpy arrays) of a word, or None if the word is not indexed
+        """
+        parts = self._termParts(word)
+        if not parts:
+            return None
+        doc_ids = []
+        counts = []
+        for n, _ in parts:
+            postings = self.segments[n].postings(word)
+            doc_ids.append(postings.doc_ids + self.doc_bases[n])
+            counts.append(postings.counts)
+        return Postings(np.concatenate(doc_ids), np.concatenate(counts))
+
+    def postingsReader(self, word):
+        """
+            returns a streaming reader over the postings of a word in every segment
+            (same methods as PostingsReader), or None if the word is not indexed
+        """
+        parts = self._termParts(word)
+        if not parts:
+            return None
+        readers = []
+        before = 0
+        for n, entry in parts:
+            readers.append((self.segments[n].postingsReader(word), self.doc_bases[n], before))
+            before += entry[2]
+        return _ChainedPostingsReader(readers)
+
+    def encodedPositions(self, word):
+        """
+            returns the encoded token positions of a word, or None if the word is not indexed
+        """
+        parts = self._termParts(word)
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return self.segments[parts[0][0]].encodedPositions(word)
+        return concatPositions([self.segments[n].encodedPositions(word) for n, _ in parts])
+
+    def _localPosting(self, word, i):
+        """
+            returns the segment number and the posting index inside the segment of the
+            i-th posting of a word
+        """
+        for n, entry in self._termParts(word):
+            if i < entry[2]:
+                return n, i
+            i -= entry[2]
+        raise IndexError(f"posting {i} of '{word}' out of range")
+
+    def positions(self, word, i):
+        """
+            returns the token positions of the i-th posting of a word
+        """
+        if word not in self:
+            return []
+        n, local_i = self._localPosting(word, i)
+        return self.segments[n].positions(word, local_i)
+
+    def contexts(self, word, i, doc_id, context_size = DEFAULT_CONTEXT_SIZE):
+        """
+            returns the context snippets of the i-th posting of a word (in document doc_id),
+            cut from the forward store with context_size words before and after every occurrence
+        """
+        n, local_i = self._localPosting(word, i)
+        return self.segments[n].contexts(word, local_i, doc_id - self.doc_bases[n], context_size)
+
+    def __contains__(self, word):
+        return any(word in segment for segment in self.segments)
+
+    def __len__(self):
+        # terms shared by several segments are counted once
+        if self._num_terms is None:
+            self._num_terms = sum(1 for _ in self.keys())
+        return self._num_terms
+
+    def keys(self):
+        """
+            yields all terms in sorted order
+        """
+        merged = heapq.merge(*(segment.keys() for segment in self.segments), key = lambda word: word.encode('utf-8'))
+        for word, _ in itertools.groupby(merged):
+            yield word
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+def openIndex(index_dir):
+    """
+        opens an index directory written by writeIndex (or a segmented index directory
+        written by updateIndex.py).
+
+        input:
+            - index_dir: path to the index directory
+
+        output: MappedIndex (SegmentedIndex for a segmented index)
+    """
+    if os.path.exists(os.path.join(index_dir, SEGMENTS_FILE)):
+        return SegmentedIndex(index_dir)
+    return MappedIndex(index_dir)
+
+def _commonTokenizer(segments):
+    """
+        returns the tokenizer of the segments of one index, which must all have been built with the same one
+    """
+    tokenizers = {segment.tokenizer for segment in segments}
+    if len(tokenizers) > 1:
+        raise ValueError(f"the segments were built with different tokenizers: {sorted(map(repr, tokenizers))}")
+    return tokenizers.pop() if tokenizers else DEFAULT_TOKENIZER
+
+def mergeIndexes(segment_dirs, output_dir, deleted = None):
+    """
+        k-way merges index segments (written by writeIndex) into a single index.
+
+        the segments must cover consecutive ranges of documents, in order: the doc ids
+        of every segment are shifted past the documents of the segments before it, so
+        each merged postings list is the concatenation of the segment lists. terms are
+        streamed in sorted order, so only one term per segment is held in memory.
+
+        input:
+            - segment_dirs: index directories of the segments, in document order
+            - output_dir: directory to write the merged index to
+            - deleted: optional numpy bool array per segment marking the doc ids to leave
+                       out (the tombstones of a segmented index), the documents after them
+                       move up
+
+        output: number of terms of the merged index
+    """
+    segments = [MappedIndex(segment_dir) for segment_dir in segment_dirs]
+    try:
+        os.makedirs(output_dir, exist_ok = True)
+        if deleted is None:
+            deleted = [np.zeros(segment.num_docs, dtype = bool) for segment in segments]
+
+        # document table: the kept documents of the segment tables one after the other
+        kept = [np.flatnonzero(~segment_deleted).tolist() for segment_deleted in deleted]
+        doc_bases = []
+        doc_lengths = array(POSTINGS_TYPECODE)
+        for segment, segment_deleted, doc_ids in zip(segments, deleted, kept):
+            doc_bases.append(len(doc_lengths))
+            segment_lengths = segment.documentLengths()
+            if segment_deleted.any():
+                segment_lengths = array(POSTINGS_TYPECODE, (segment_lengths[doc_id] for doc_id in doc_ids))
+            doc_lengths += segment_lengths
+        documents = (segment.document(doc_id) for segment, doc_ids in zip(segments, kept) for doc_id in doc_ids)
+        # the length norms depend on the average over the whole collection
+        avg_doc_length, length_norms = _lengthNorms(doc_lengths)
+        _writeDocs(os.path.join(output_dir, DOCS_FILE), documents, doc_lengths, length_norms)
+        texts = (segment._documentText(doc_id) for segment, doc_ids in zip(segments, kept) for doc_id in doc_ids)
+        _writeForward(os.path.join(output_dir, FORWARD_FILE), texts, len(doc_lengths))
+
+        # the idf uses the document count of the whole collection (without the deleted documents)
+        total_docs = sum(segment.total_docs for segment in segments) - sum(int(segment_deleted.sum()) for segment_deleted in deleted)
+        stop_words = frozenset().union(*(segment.stop_words for segment in segments))
+        tokenizer = _commonTokenizer(segments)
+
+        num_terms = _writeTerms(output_dir, _mergedTermRecords(segments, doc_bases, deleted, total_docs))
+        _writeMeta(output_dir, num_terms, len(doc_lengths), total_docs, avg_doc_length, stop_words, tokenizer)
+        return num_terms
+    finally:
+        for segment in segments:
+            segment.close()
+
+def _segmentEntries(segment, segment_number):
+    """
+        yields (term bytes, segment number, term entry) of a segment in sorted order
+    """
+    for i in range(segment.num_terms):
+        entry = segment._termEntry(i)
+        yield segment._termAt(entry), segment_number, entry
+
+def _mergedTermRecords(segments, doc_bases, deleted, total_docs):
+    """
+        yields the term records (see _termRecords) of the merged segments in sorted order
+        (deleted: numpy bool array of the doc ids to leave out of every segment)
+    """
+    streams = [_segmentEntries(segment, n) for n, segment in enumerate(segments)]
+    # every stream is sorted by term bytes and segment numbers break ties,
+    # so the parts of a term come out grouped and in document order
+    merged = heapq.merge(*streams, key = lambda item: (item[0], item[1]))
+    # merged doc id of every doc id of the segments with deleted documents
+    new_ids = [np.cumsum(~segment_deleted) - 1 + base if segment_deleted.any() else None
+               for segment_deleted, base in zip(deleted, doc_bases)]
+
+    for term, parts in itertools.groupby(merged, key = lambda item: item[0]):
+        doc_ids = array(POSTINGS_TYPECODE)
+        counts = array(POSTINGS_TYPECODE)
+        weights = bytearray()
+        position_parts = []
+        for _, n, entry in parts:
+            segment = segments[n]
+            df = entry[2]
+            postings_offset, postings_length = entry[3], entry[4]
+            postings_bytes = segment._postings[postings_offset:postings_offset + postings_length]
+            # weights and positions do not depend on the other documents, so their bytes are copied as they are
+            weights_offset = entry[8]
+            part_weights = segment._weights[weights_offset:weights_offset + df * 4]
+            positions_offset, positions_length = entry[5], entry[6]
+            part_positions = segment._positions[positions_offset:positions_offset + positions_length]
+
+            if new_ids[n] is None:
+                part_doc_ids, part_counts = decodePostings(postings_bytes)
+                base = doc_bases[n]
+                if base:
+                    part_doc_ids = array(POSTINGS_TYPECODE, (doc_id + base for doc_id in part_doc_ids))
+            else:
+                # the postings of deleted documents are cut out of every array
+                part_doc_ids, part_counts = decodePostingsArrays(postings_bytes)
+                keep = np.flatnonzero(~deleted[n][part_doc_ids])
+                if not len(keep):
+                    continue
+                if len(keep) < df:
+                    part_doc_ids = part_doc_ids[keep]
+                    part_counts = part_counts[keep]
+                    part_weights = np.frombuffer(part_weights, dtype = '<f4')[keep].tobytes()
+                    part_positions = selectPositions(part_positions, keep.tolist())
+                part_doc_ids = array(POSTINGS_TYPECODE, new_ids[n][part_doc_ids].tolist())
+                part_counts = array(POSTINGS_TYPECODE, part_counts.tolist())
+
+            doc_ids += part_doc_ids
+            counts += part_counts
+            weights += part_weights
+            position_parts.append(part_positions)
+
+        # terms only found in deleted documents are dropped
+        if not doc_ids:
+            continue
+        yield (
+            term.decode('utf-8'),
+            encodePostings(doc_ids, counts),
+            bytes(weights),
+            concatPositions(position_parts),
+            math.log(total_docs / len(doc_ids))
+        )
@@ -3,42 +3,105 @@ Author:
 Date:
 Description:
 
-How to run: python3 inverted_index.py --input-file word_counts.txt --output-file inverted_index.pkl
-Format of word_counts.txt: 
+How to run: python3 inverted_index.py --input-file word_counts.txt --output-file inverted_index
+            (an output file ending in .pkl is saved as a single pickle instead of the memory-mapped format)
+        or: python3 inverted_index.py --combined_file combined_documents.txt --output-file inverted_index
+            (single pass over the documents, no MapReduce job and no word_counts.txt)
+        or: python3 inverted_index.py --combined_file combined_documents.txt --output-file inverted_index --workers 8
+            (parallel build: shards indexed by a process pool, then merged)
+Format of word_counts.txt: filename\ttitle\tword\tcount\tpositions (space separated token positions)
 '''
 
 import pickle
-from collections import defaultdict
 import argparse
 import os
+import sys
 import csv
+import math
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-import nltk
+from indexStore import InvertedIndex, writeIndex, mergeIndexes, encodeTokens
+from stopWords import loadStopwords, DEFAULT_LANGUAGE
+from tokenizer import parseCombinedLine, positionsByWord, Tokenizer, DEFAULT_TOKENIZER
+from fileIO import listFiles, readFiles, splitLines
+from blockGzip import isCompressed, splitBlocks, readBlockLines, textSize
 
-# rnsure nltk stopwords are downloaded
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+# target size of a shard of the combined file in a parallel build (bytes)
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
 
-from nltk.corpus import stopwords
+def loadDocumentLengths(word_count_file):
+    """
+        loads the total word count of every document (wordCount.txt, 'filename:count' lines).
+        
+        input:
+            - word_count_file: path to the word count file
+
+        output: dictionary mapping filenames to their total word counts (empty if the file is missing)
+    """
+    doc_lengths = {}
+    if not word_count_file or not os.path.exists(word_count_file):
+        print(f"Word count file not found: {word_count_file} (every document gets length 1)")
+        return doc_lengths
+
+    with open(word_count_file, 'r', encoding = 'utf-8') as f:
+        for line in f:
+            filename, _, count = line.strip().partition(':')
+            try:
+                doc_lengths[filename.strip()] = int(count)
+            except ValueError:
+                continue
+    return doc_lengths
+
+def loadForwardStore(combined_file, tokenizer = DEFAULT_TOKENIZER):
+    """
+        tokenizes the documents of the combined file for the forward store of the index
+        (the context snippets shown when searching are cut from it).
+        
+        input:
+            - combined_file: path to the combined documents file
+            - tokenizer: Tokenizer the index is built with
+
+        output: dictionary mapping filenames to their encoded tokens (empty if the file is missing)
+    """
+    forward = {}
+    if not combined_file or not os.path.exists(combined_file):
+        print(f"Combined file not found: {combined_file} (search results will have no context)")
+        return forward
+
+    for filename, _, content in readCombinedFile(combined_file):
+        forward[filename] = encodeTokens(tokenizer.words(content))
+    return forward
 
-def buildInvertedIndex(file_path):
+def buildInvertedIndex(file_path, word_count_file = None, stop_words = None, combined_file = None, tokenizer = DEFAULT_TOKENIZER):
     """
         builds an inverted index from the given word_counts.txt file.
         
         input:
             - file_path: Path to the word_counts.txt file
+            - word_count_file: Path to wordCount.txt, the document lengths used to
+                               precompute the normalized term frequencies stored in the index
+            - stop_words: set of words to leave out (default: NLTK english stopwords),
+                          stored in the index so searches use the same list
+            - combined_file: Path to the combined documents file, tokenized into the
+                             forward store the context snippets are cut from
+            - tokenizer: Tokenizer the MapReduce job split the documents with (stored in the index)
 
-        output: inverted index as a defaultdict
+        output: InvertedIndex (document table, compressed postings, positions, idf and weights),
+                or None if the file could not be read
     """
-    inverted_index = defaultdict(list)
+    if stop_words is None:
+        stop_words = loadStopwords()
+    stop_words = tokenizer.stopWords(stop_words)
+    inverted_index = InvertedIndex(loadDocumentLengths(word_count_file), stop_words, tokenizer)
+    forward = loadForwardStore(combined_file, tokenizer)
     line_number = 0  # for debugging 
 
     # see if file exists
     if not os.path.exists(file_path):
         print(f"Input file not found: {file_path}")
-        return inverted_index
+        return None
 
     try:
         # open file
@@ -57,56 +120,277 @@ def buildInvertedIndex(file_path):
                     print(f"malformed line {line_number}: {row}")
                     continue
 
-                # unpack row into filename, title, word, frequecny and contexts
-                filename, title, word, frequency_str, joined_contexts = row
+                # unpack row into filename, title, word, frequecny and positions
+                filename, title, word, frequency_str, positions_str = row
 
-                # exclude stop words
-                if word.lower() in stopwords.words('english'):
+                # exclude stop words (the mapper already left them out, and a stem can look like one)
+                if tokenizer.stemmer is None and word.lower() in stop_words:
                     continue
 
-                # convert frequency to integer
+                # convert frequency and positions to integers
                 try:
                     frequency = int(frequency_str)
+                    positions = [int(position) for position in positions_str.split()]
                 except ValueError:
-                    print(f"invalid frequency")
+                    print(f"invalid frequency or positions")
                     continue
 
-                # Split contexts by ' | ' and clean them
-                contexts = [ctx.strip() for ctx in joined_contexts.split('|') if ctx.strip()]
+                # get the doc id (filename and title are stored once in the document table)
+                doc_id = inverted_index.addDocument(filename, title, tokens = forward.get(filename))
 
-                # make entry
-                entry = {
-                    'filename': filename,
-                    'title': title,
-                    'count': frequency,
-                    'contexts': contexts
-                }
-
-                # add entry to a lowercase word in the inverted index
-                inverted_index[word.lower()].append(entry)
+                # add posting to a lowercase word in the inverted index
+                inverted_index.addPosting(word.lower(), doc_id, frequency, positions)
 
     except Exception as e:
+        # a partial index is not saved
         print(f"An error occurred while building the index: {e}")
+        return None
+
+    # sort and compress postings, precompute idf and weights
+    inverted_index.finalize()
+
+    return inverted_index
+
+def readCombinedFile(combined_file):
+    """
+        streams the documents of the combined file (made by combine_files).
+        
+        input:
+            - combined_file: path to the tab-delimited combined file (block-compressed if it ends in .gz)
+
+        output: yields (filename, title, content) for every document
+    """
+    if isCompressed(combined_file):
+        # decompressed block by block (see blockGzip.py)
+        yield from readCombinedRange(combined_file, 0, os.path.getsize(combined_file))
+        return
+
+    with open(combined_file, 'r', encoding = 'utf-8') as file:
+        for line in file:
+            parts = parseCombinedLine(line)
+            if parts is not None:
+                yield parts
+
+def readDocumentsDir(input_dir, io_threads = 1):
+    """
+        streams the documents of a directory of cleaned files (the same way combine_files reads them).
+        
+        input:
+            - input_dir: directory containing the cleaned documents
+            - io_threads: number of threads reading the files ahead (see fileIO.readFiles)
+
+        output: yields (filename, title, content) for every document
+    """
+    for filename, text, error in readFiles(input_dir, listFiles(input_dir), io_threads):
+        if error is not None:
+            raise error
+        lines = splitLines(text)
+        # if file is empty, skip it
+        if not lines:
+            continue
+        yield parseDocument(filename, lines)
+
+def parseDocument(filename, lines):
+    """
+        extracts the title and the content of a cleaned document (the same way combine_files does).
+        
+        input:
+            - filename: name of the document
+            - lines: lines of the cleaned document
+
+        output: (filename, title, content) without tabs
+    """
+    # process lines to extract title and content
+    title_text = "[Missing Title]"
+    content = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("Title: "):
+            title_text = line[len("Title: "):].strip()
+        elif not line.startswith("Filename: "):
+            content.append(line)
+
+    return filename.replace('\t', ' '), title_text.replace('\t', ' '), ' '.join(content).replace('\t', ' ')
+
+def indexDocuments(documents, stop_words = None, export_file = None, tokenizer = DEFAULT_TOKENIZER):
+    """
+        builds an inverted index in a single pass over the documents, without the
+        MapReduce job or word_counts.txt (tokenization is shared with the mapper).
+        
+        input:
+            - documents: iterable of (filename, title, content), e.g. from readCombinedFile
+            - stop_words: set of words to leave out (default: NLTK english stopwords)
+            - export_file: optional path to also write the postings in the word_counts.txt format
+            - tokenizer: Tokenizer splitting the documents into words (stored in the index)
+
+        output: InvertedIndex (document table, compressed postings, positions, idf and weights)
+    """
+    if stop_words is None:
+        stop_words = loadStopwords()
+    stop_words = tokenizer.stopWords(stop_words)
+    inverted_index = InvertedIndex(stop_words = stop_words, tokenizer = tokenizer)
+
+    export = open(export_file, 'w', encoding = 'utf-8') if export_file else None
+    try:
+        for filename, title, content in documents:
+            words = tokenizer.words(content)
+
+            # every document gets a doc id (and counts for the idf), even without indexable words.
+            # its length is its number of tokens, the same words the term frequencies count
+            doc_id = inverted_index.addDocument(filename, title, len(words), encodeTokens(words))
+
+            # positions of every term of the document, in order of appearance
+            doc_terms = positionsByWord(words, stop_words, tokenizer.term)
+            for word, positions in doc_terms.items():
+                inverted_index.addPosting(word, doc_id, len(positions), positions)
+
+            if export is not None:
+                # same line format as the MapReduce reducer
+                for word in sorted(doc_terms):
+                    positions = doc_terms[word]
+                    export.write(f"{filename}\t{title}\t{word}\t{len(positions)}\t{' '.join(map(str, positions))}\n")
+    finally:
+        if export is not None:
+            export.close()
+
+    # sort and compress postings, precompute idf and weights
+    inverted_index.finalize()
 
     return inverted_index
 
+def splitCombinedFile(combined_file, num_shards):
+    """
+        splits the combined file into byte ranges of about the same size that start
+        and end on line boundaries (every line is one document). a block-compressed
+        combined file is split on block boundaries instead.
+        
+        input:
+            - combined_file: path to the combined file
+            - num_shards: number of ranges to split into
+
+        output: list of (start, end) byte offsets, in file order
+    """
+    if isCompressed(combined_file):
+        return splitBlocks(combined_file, num_shards)
+
+    size = os.path.getsize(combined_file)
+    boundaries = [0]
+    with open(combined_file, 'rb') as file:
+        for i in range(1, num_shards):
+            # move every cut to the start of the next line
+            file.seek(max(size * i // num_shards, boundaries[-1]))
+            file.readline()
+            boundaries.append(min(file.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def readCombinedRange(combined_file, start, end):
+    """
+        streams the documents of the lines between the byte offsets start and end
+        (see splitCombinedFile) of the combined file.
+
+        output: yields (filename, title, content) for every document
+    """
+    if isCompressed(combined_file):
+        # only the blocks of the range are decompressed
+        for line in readBlockLines(combined_file, start, end):
+            parts = parseCombinedLine(line.decode('utf-8'))
+            if parts is not None:
+                yield parts
+        return
+
+    with open(combined_file, 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            line = file.readline()
+            if not line:
+                break
+            position += len(line)
+            parts = parseCombinedLine(line.decode('utf-8'))
+            if parts is not None:
+                yield parts
+
+def _buildShard(combined_file, start, end, segment_dir, stop_words, tokenizer):
+    """
+        worker of buildShardedIndex: indexes one byte range of the combined file and
+        writes it as an index segment, returns the segment directory
+    """
+    index = indexDocuments(readCombinedRange(combined_file, start, end), stop_words, tokenizer = tokenizer)
+    writeIndex(index, segment_dir)
+    return segment_dir
+
+def buildShardedIndex(combined_file, output_dir, workers = None, shard_size = DEFAULT_SHARD_SIZE, stop_words = None,
+                      tokenizer = DEFAULT_TOKENIZER):
+    """
+        builds the index in parallel: the combined file is cut into shards of about
+        shard_size bytes, a process pool indexes every shard into its own segment and
+        the segments are k-way merged into the final index directory. peak memory
+        per worker depends on the shard size, not on the size of the collection.
+        
+        input:
+            - combined_file: path to the combined documents file
+            - output_dir: directory to write the merged memory-mapped index to
+            - workers: number of worker processes (default: number of cpus)
+            - shard_size: target size of a shard in bytes
+            - stop_words: set of words to leave out (default: NLTK english stopwords)
+            - tokenizer: Tokenizer splitting the documents into words (stored in the index)
+
+        output: number of terms of the index, or None if the combined file is missing
+    """
+    if not os.path.exists(combined_file):
+        print(f"Combined file not found: {combined_file}")
+        return None
+    if stop_words is None:
+        stop_words = loadStopwords()
+    workers = workers or os.cpu_count() or 1
+
+    # at least one shard per worker, more if the shards would get too big (uncompressed)
+    size = textSize(combined_file) if isCompressed(combined_file) else os.path.getsize(combined_file)
+    num_shards = max(workers, math.ceil(size / max(shard_size, 1)))
+    ranges = splitCombinedFile(combined_file, num_shards)
+
+    segments_dir = tempfile.mkdtemp(prefix = 'segments_', dir = os.path.dirname(os.path.abspath(output_dir)))
+    try:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            futures = [
+                executor.submit(_buildShard, combined_file, start, end,
+                                os.path.join(segments_dir, f'segment_{i:05d}'), stop_words, tokenizer)
+                for i, (start, end) in enumerate(ranges)
+            ]
+            # keep the segments in file order (doc ids follow the order of the documents)
+            segment_dirs = [future.result() for future in futures]
+
+        print(f"Merging {len(segment_dirs)} segments...")
+        return mergeIndexes(segment_dirs, output_dir)
+    finally:
+        shutil.rmtree(segments_dir, ignore_errors = True)
+
 def saveIndex(index, filename):
     """
-        saves the inverted index to a file using pickle.
+        saves the inverted index to disk.
+        a filename ending in .pkl is saved using pickle, anything else is written
+        as a memory-mapped index directory (see indexStore.py).
     
         input:
             - index: The inverted index to save
-            - filename: The filename to save the index to
-        ouput: index saved to file
+            - filename: The filename (or directory) to save the index to
+        ouput: index saved to file, true if it was saved
     """
     try:
-        # open provided filename
-        with open(filename, 'wb') as f:
-            # save it using pickle
-            pickle.dump(index, f)
+        if filename.endswith('.pkl'):
+            # open provided filename
+            with open(filename, 'wb') as f:
+                # save it using pickle
+                pickle.dump(index, f)
+        else:
+            # write the memory-mapped index directory
+            writeIndex(index, filename)
         print(f"inverted index saved to {filename}")
+        return True
     except Exception as e:
         print(f"failed to save index: {e}")
+        return False
 
 def main():
     # argparser for easier argparsing than using sys
@@ -119,24 +403,110 @@ def main():
     parser.add_argument(
         '-o', '--output_file', 
         type = str, 
-        default = 'inverted_index.pkl',
-        help = 'Filename to save the inverted index (default: inverted_index.pkl)')
+        default = 'inverted_index',
+        help = 'Directory to save the memory-mapped inverted index, or a .pkl filename to save a pickle (default: inverted_index)')
+    parser.add_argument(
+        '-w', '--word_count_file', 
+        type = str, 
+        default = 'wordCount.txt',
+        help = 'Path to the file with the total word count of every document (default: wordCount.txt)')
+    parser.add_argument(
+        '--stopwords_language', 
+        type = str, 
+        default = DEFAULT_LANGUAGE,
+        help = f'NLTK stopword language (default: {DEFAULT_LANGUAGE})')
+    parser.add_argument(
+        '--stopwords_file', 
+        type = str, 
+        default = None,
+        help = 'Path to a custom stopword file with one word per line (overrides --stopwords_language)')
+    parser.add_argument(
+        '-f', '--forward_file', 
+        type = str, 
+        default = 'combined_documents.txt',
+        help = 'Combined documents file the context snippets are taken from when building from word_counts.txt (default: combined_documents.txt)')
+    parser.add_argument(
+        '-c', '--combined_file', 
+        type = str, 
+        default = None,
+        help = 'Build in a single pass from the combined documents file instead of word_counts.txt')
+    parser.add_argument(
+        '-d', '--documents_dir', 
+        type = str, 
+        default = None,
+        help = 'Build in a single pass from a directory of cleaned documents instead of word_counts.txt')
+    parser.add_argument(
+        '--io_threads', 
+        type = int, 
+        default = 1,
+        help = 'Number of threads reading the next files of --documents_dir ahead (default: 1)')
+    parser.add_argument(
+        '--export_word_counts', 
+        type = str, 
+        default = None,
+        help = 'Optionally also write the postings in the word_counts.txt format (single pass builds only)')
+
+    parser.add_argument(
+        '--workers', 
+        type = int, 
+        default = None,
+        help = 'Build from --combined_file in parallel with this many worker processes (0: number of cpus). Needs --combined_file and an index directory as the output')
+    parser.add_argument(
+        '--shard_size', 
+        type = int, 
+        default = DEFAULT_SHARD_SIZE,
+        help = f'Target size of a shard of the combined file in bytes for parallel builds (default: {DEFAULT_SHARD_SIZE})')
+    parser.add_argument(
+        '--stemmer', 
+        type = str, 
+        default = None,
+        help = 'Index the stems of the words: "porter" or a Snowball language such as "english" (default: no stemming). Must match the MapReduce job when building from word_counts.txt')
+    parser.add_argument(
+        '--fold_unicode', 
+        action = 'store_true',
+        help = 'Case fold the documents and remove accents and compatibility forms before splitting them into words. Must match the MapReduce job when building from word_counts.txt')
 
     args = parser.parse_args()
 
-    # ensure nltk stopwords are downloaded
+    # the tokenizer is stored in the index, searches split the queries the same way
     try:
-        nltk.data.find('corpora/stopwords')
-    except LookupError:
-        nltk.download('stopwords')
+        tokenizer = Tokenizer(args.stemmer, args.fold_unicode)
+    except ValueError as e:
+        print(f"Invalid option: {e}")
+        return
+
+    # only the build from the combined file is sharded, do not silently build on one process
+    if args.workers is not None and (not args.combined_file or args.output_file.endswith('.pkl')):
+        print("Invalid option: --workers needs --combined_file and an index directory as the output file (not .pkl)")
+        sys.exit(1)
+
+    # load the stopwords once
+    stop_words = loadStopwords(args.stopwords_language, args.stopwords_file)
 
     # build the index
     print("Building the inverted index...")
-    index = buildInvertedIndex(args.input_file)
+    if args.workers is not None:
+        # parallel build, the segments are merged straight into the output directory
+        num_terms = buildShardedIndex(args.combined_file, args.output_file, args.workers, args.shard_size, stop_words, tokenizer)
+        if num_terms is None:
+            sys.exit(1)
+        print(f"Total unique words (excluding stop words): {num_terms}")
+        print(f"inverted index saved to {args.output_file}")
+        return
+    elif args.combined_file:
+        index = indexDocuments(readCombinedFile(args.combined_file), stop_words, args.export_word_counts, tokenizer)
+    elif args.documents_dir:
+        index = indexDocuments(readDocumentsDir(args.documents_dir, args.io_threads), stop_words, args.export_word_counts, tokenizer)
+    else:
+        index = buildInvertedIndex(args.input_file, args.word_count_file, stop_words, args.forward_file, tokenizer)
+        if index is None:
+            # exit with an error, so processFiles.py does not take the index stage as done
+            sys.exit(1)
     # get unique words (for debugging)
     print(f"Total unique words (excluding stop words): {len(index)}")
     # save idnex
-    saveIndex(index, args.output_file)
+    if not saveIndex(index, args.output_file):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,97 +1,127 @@
-import re
 from mrjob.job import MRJob
 from mrjob.step import MRStep
 from mrjob.protocol import RawValueProtocol
+from mrjob.compat import jobconf_from_env
+
+from stopWords import loadStopwords, DEFAULT_LANGUAGE
+from tokenizer import parseCombinedLine, positionsByWord, Tokenizer
+from blockGzip import readBlockLines
 
 class WordFrequencyMR(MRJob):
     # set the output protocol to RawValueProtocol to prevent Unicode escaping
     # link: https://mrjob.readthedocs.io/en/latest/guides/writing-mrjobs.html#job-protocols
     OUTPUT_PROTOCOL = RawValueProtocol
 
-    # define arguments for the script:
-    # context size: before and after the target word
+    # define arguments for the script
+    # (the context snippets are cut from the index at search time, so there is no context size)
     def configure_args(self):
         super(WordFrequencyMR, self).configure_args()
+        # stopwords are dropped in the mapper, before the shuffle
+        self.add_passthru_arg(
+            '--stopwords-language', default = DEFAULT_LANGUAGE,
+            help = 'NLTK stopword language'
+        )
+        # file args are uploaded to the task nodes by mrjob
+        self.add_file_arg(
+            '--stopwords-file', default = None,
+            help = 'Custom stopword file with one word per line (overrides --stopwords-language)'
+        )
+        # the index must be built with the same tokenizer (see tokenizer.py)
         self.add_passthru_arg(
-            '--context-size', type = int, default = 3,
-            help = 'Number of words to include before and after the target word as context'
+            '--stemmer', default = None,
+            help = 'Emit the stems of the words: "porter" or a Snowball language such as "english"'
+        )
+        self.add_passthru_arg(
+            '--fold-unicode', action = 'store_true',
+            help = 'Case fold the documents and remove accents and compatibility forms before splitting them'
+        )
+        # mrjob decompresses .gz inputs as a single gzip member, so a block-compressed combined file
+        # is read by the mappers themselves: the input lines are the byte ranges of its blocks (see blockGzip.py)
+        self.add_file_arg(
+            '--combined-blocks', default = None,
+            help = 'Block-compressed combined file, the input lines are "start end" byte ranges of its blocks'
         )
 
     def mapper_init(self):
-        # precompile regex for performance
-        self.word_pattern = re.compile(r'\b\w+\b')
+        # load the tokenizer and the stopwords once per mapper
+        self.tokenizer = Tokenizer(self.options.stemmer, self.options.fold_unicode)
+        self.stop_words = self.tokenizer.stopWords(loadStopwords(self.options.stopwords_language, self.options.stopwords_file))
+        # documents are keyed by a compact id instead of their filename: the number of the map
+        # task and the ordinal of the document in that task (unique across all mappers)
+        self.task = int(jobconf_from_env('mapreduce.task.partition', 0))
+        self.num_documents = 0
 
     def mapper(self, _, line):
+        if self.options.combined_blocks is None:
+            yield from self.mapDocument(line)
+            return
+
+        # decompress the blocks of the range, every line is a document of the combined file
+        start, end = map(int, line.split())
+        for document_line in readBlockLines(self.options.combined_blocks, start, end):
+            yield from self.mapDocument(document_line.decode('utf-8').rstrip('\n'))
+
+    def mapDocument(self, line):
         try:
             # split the line by tab into filename, title, and content
-            # split into at most 3 parts
-            # this is how the files were combined
-            parts = line.strip().split('\t', 2)  
-            if len(parts) != 3:
+            parts = parseCombinedLine(line)
+            if parts is None:
                 # skip lines that do not have exactly 3 fields
                 return
 
             # unpack parts into filename, title and content
             filename, title, content = parts
-            # remove leading and trailing whitespaces
-            filename = filename.strip()
-            title = title.strip()
-            content = content.strip()
 
             # tokenize content into words, remove punctuation, convert to lowercase
-            words = self.word_pattern.findall(content.lower())
-
-            # get the context size
-            context_size = self.options.context_size
+            # (shared with the in-process builder in invertedIndex.py)
+            words = self.tokenizer.words(content)
 
-            # for each word (and its index)
-            for i, target_word in enumerate(words):
-                # define the window for context
-                start = max(0, i - context_size)
-                # +1 because slice is exclusive
-                end = min(len(words), i + context_size + 1) 
+            # in-mapper aggregation: every line is a whole document, so the positions
+            # of a word collected here are all of its occurrences in the document.
+            # stopwords are not indexed, so they are not sent through the shuffle
+            # (with a stemmer the words are grouped by their stems)
+            positions_by_word = positionsByWord(words, self.stop_words, self.tokenizer.term)
 
-                # extract context words, including the target word itself
-                context_words = words[start:end]
+            # e.g. '0.1f' instead of the filename in the key of every record of the document
+            doc_id = f"{self.task:x}.{self.num_documents:x}"
+            self.num_documents += 1
 
-                # convert context words to a string
-                context_str = ' '.join(context_words)
+            # the filename and title are sent once per document ...
+            yield doc_id, ['doc', filename, title]
 
-                # create a composite key: filename, title, word
-                composite_key = f"{filename}\t{title}\t{target_word}"
-
-                # emit the composite key and context
-                yield composite_key, context_str
+            # ... and every word once, with its count and positions
+            for target_word, positions in positions_by_word.items():
+                yield doc_id, ['word', target_word, len(positions), positions]
 
         except Exception as e:
             # log the error or skip the line
             print(e)
             pass
 
-    def reducer(self, key, values):
-        # initialize frequency and context list
-        frequency = 0
-        contexts = []
-
-        # for each context in the values passed,
-        # increment frequenct and append context to list
-        for context in values:
-            frequency += 1
-            contexts.append(context)
-
-        # # to avoid extremely large outputs, limit the number of contexts
-        # contexts = contexts[:100]
-
-        # Join contexts with a separator, e.g., ' | '
-        contexts_joined = ' | '.join(contexts)
-
-        # combine key and value into a single string
-        # key: filename, title, word
-        # value: frequency, contexts
-        output_str = f"{key}\t{frequency}\t{contexts_joined}"
-
-        # emit the final output as a single string
-        yield None, output_str
+    def reducer(self, _, values):
+        # the records of one document: its filename and title, and one record per word
+        filename = title = None
+        word_records = []
+        for value in values:
+            if value[0] == 'doc':
+                _, filename, title = value
+            else:
+                word_records.append(value)
+
+        # same order as the old (filename, title, word) keys
+        word_records.sort(key = lambda record: record[1])
+        for _, word, frequency, positions in word_records:
+            # the positions replace the context strings: the index cuts the
+            # contexts out of the tokenized documents when searching
+            positions_joined = ' '.join(map(str, positions))
+
+            # combine the document and word into a single string
+            # key: filename, title, word
+            # value: frequency, positions
+            output_str = f"{filename}\t{title}\t{word}\t{frequency}\t{positions_joined}"
+
+            # emit the final output as a single string
+            yield None, output_str
 
     def steps(self):
         return [
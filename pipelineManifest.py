@@ -0,0 +1,184 @@
+'''
+Description: content-hash manifest of the processing pipeline (see
+processFiles.py). Every stage records what it was run with, so a re-run
+skips the stages whose inputs and parameters did not change, like a small
+build system.
+
+For every stage the manifest stores:
+    - inputs: content hash of every input file or directory, including the
+      source files of the code that runs the stage
+    - params: the options that change its output
+    - outputs: content hash of every output file or directory it wrote
+
+A stage is up to date when its inputs and params match the recorded ones and
+its outputs still have the recorded hashes (an output that was deleted or
+edited makes it run again). A stage that fails or is interrupted is not
+recorded, so a re-run redoes it, and since the next stages hash its outputs
+as their inputs, they only run again if its output actually changed.
+
+The hash of every file is kept with its modification time and size and only
+recomputed when they change, so checking an unchanged pipeline costs a stat
+per file (directories are walked with os.scandir, whose entries cache it).
+'''
+
+import os
+import json
+import hashlib
+
+MANIFEST_FILE = 'pipeline_manifest.json'
+
+def fileDigest(path):
+    """
+        returns the sha1 hex digest of the content of a file
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class PipelineManifest:
+    """
+        manifest of the stages of a pipeline, stored as JSON at path.
+
+        - stages: stage name -> {'inputs', 'params', 'outputs'} of its last successful run
+        - files: path -> [modification time (ns), size, sha1] of every file hashed so far
+    """
+
+    def __init__(self, path = MANIFEST_FILE):
+        self.path = path
+        self.stages = {}
+        self.files = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding = 'utf-8') as manifest_file:
+                    manifest = json.load(manifest_file)
+                self.stages = manifest.get('stages', {})
+                self.files = manifest.get('files', {})
+            except (ValueError, OSError) as e:
+                # a broken manifest only means every stage runs again
+                print(f"Ignoring the pipeline manifest '{path}': {e}")
+
+    def save(self):
+        """
+            writes the manifest (replaced atomically, so an interrupted write keeps the old one)
+        """
+        temp_path = f"{self.path}.tmp"
+        # json.dumps encodes in one go with the C encoder (json.dump streams through the python one),
+        # which matters with a file entry for every document
+        with open(temp_path, 'w', encoding = 'utf-8') as manifest_file:
+            manifest_file.write(json.dumps({'stages': self.stages, 'files': self.files}))
+        os.replace(temp_path, self.path)
+
+    def fileHash(self, path):
+        """
+            returns the content hash of a file, reusing the recorded one if its
+            modification time and size did not change
+        """
+        return self._cachedHash(os.path.abspath(path), os.stat(path))
+
+    def _cachedHash(self, key, stat):
+        """
+            returns the content hash of the file at the absolute path key, given its stat result
+        """
+        known = self.files.get(key)
+        if known is not None and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+        digest = fileDigest(key)
+        self.files[key] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def pathHash(self, path):
+        """
+            returns the content hash of a file or of a directory (its relative file paths
+            and their hashes), or None if the path does not exist
+        """
+        if os.path.isfile(path):
+            return self.fileHash(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha1()
+        self._hashTree(os.path.abspath(path), '', digest)
+        return digest.hexdigest()
+
+    def _hashTree(self, directory, prefix, digest):
+        """
+            adds the relative path (prefix + name) and the hash of every file under a directory
+            to digest, in the order of a top-down os.walk with sorted names (files first, then
+            the subdirectories, symlinks to directories are not followed)
+        """
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key = lambda entry: entry.name)
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry)
+                continue
+            digest.update(f"{prefix}{entry.name}".encode('utf-8'))
+            digest.update(self._cachedHash(entry.path, entry.stat()).encode('ascii'))
+        for entry in subdirs:
+            self._hashTree(entry.path, f"{prefix}{entry.name}{os.sep}", digest)
+
+    def fingerprint(self, paths):
+        """
+            returns {path: content hash} of the given files and directories
+        """
+        return {path: self.pathHash(path) for path in paths}
+
+    def isUpToDate(self, stage, inputs, params, outputs):
+        """
+            true if the stage already ran with the same inputs and params and its outputs are unchanged
+        """
+        recorded = self.stages.get(stage)
+        if recorded is None:
+            return False
+        # params are compared the way they were stored (tuples become lists in JSON)
+        if recorded['params'] != json.loads(json.dumps(params)):
+            return False
+        if recorded['inputs'] != self.fingerprint(inputs):
+            return False
+        current_outputs = self.fingerprint(outputs)
+        return None not in current_outputs.values() and recorded['outputs'] == current_outputs
+
+    def record(self, stage, inputs, params, outputs):
+        """
+            records a successful run of a stage and saves the manifest
+        """
+        self.stages[stage] = {
+            'inputs': self.fingerprint(inputs),
+            'params': json.loads(json.dumps(params)),
+            'outputs': self.fingerprint(outputs)
+        }
+        self.save()
+
+    def runStage(self, stage, run, inputs, params, outputs, force = False):
+        """
+            runs a stage unless it is up to date.
+
+            input:
+                - stage: name of the stage
+                - run: function without arguments that runs the stage and returns true if it succeeded
+                - inputs: files and directories the stage reads (data and code)
+                - params: JSON serializable options that change the output
+                - outputs: files and directories the stage writes
+                - force: run even if the stage is up to date
+
+            output: true if the stage is up to date (skipped, or ran and succeeded)
+        """
+        if not force and self.isUpToDate(stage, inputs, params, outputs):
+            print(f"Skipping {stage}: inputs and parameters unchanged.")
+            return True
+
+        # forget the last run first, so a failed or interrupted run is never taken as up to date
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+        succeeded = bool(run())
+
+        # the stages report their errors instead of raising, so a run only counts if it says it succeeded
+        # and left all its outputs
+        if succeeded and all(os.path.exists(output) for output in outputs):
+            self.record(stage, inputs, params, outputs)
+            return True
+        print(f"Stage {stage} did not finish, it will run again next time.")
+        return False
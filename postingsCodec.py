@@ -0,0 +1,325 @@
+'''
+Description: compressed postings lists.
+
+A postings list (ascending doc ids with their counts) is cut into blocks of
+BLOCK_SIZE postings. Inside a block every posting is stored as two varints:
+the gap to the previous doc id and the count. A fixed-width skip table in
+front of the blocks holds the last doc id and the end offset of every block,
+so a reader can jump over whole blocks without decoding them.
+
+Layout of an encoded postings list (all fixed-width fields little-endian):
+    - header: df (u32), number of blocks (u32), block size (u32)
+    - skip table: (last doc id (u32), block end offset (u32)) per block
+    - blocks: varint(doc id gap), varint(count) per posting
+
+The token positions of a term are stored next to its postings list, so the
+positions of a single posting can be decoded without touching the others:
+    - offsets table: (df + 1) u32 offsets from the start of the encoded positions
+    - positions: varint(position gap) per occurrence, gaps restart at every posting
+'''
+
+import struct
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+# number of postings per block (one skip table entry per block)
+BLOCK_SIZE = 128
+
+HEADER = struct.Struct('<III')
+SKIP_ENTRY = struct.Struct('<II')
+POSITION_OFFSET = struct.Struct('<I')
+
+def _appendVarint(out, value):
+    """
+        appends value to the bytearray out as a variable-byte integer (7 bits per byte)
+    """
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encodePostings(doc_ids, counts, block_size = BLOCK_SIZE):
+    """
+        encodes a postings list into delta + varint compressed blocks with a skip table.
+
+        input:
+            - doc_ids: ascending doc ids
+            - counts: count of the term in each document (same length as doc_ids)
+            - block_size: number of postings per block
+
+        output: bytes
+    """
+    df = len(doc_ids)
+    skips = bytearray()
+    blocks = bytearray()
+    previous = 0
+    for start in range(0, df, block_size):
+        end = min(start + block_size, df)
+        for i in range(start, end):
+            doc_id = doc_ids[i]
+            if doc_id < previous:
+                raise ValueError("doc ids must be in ascending order")
+            _appendVarint(blocks, doc_id - previous)
+            _appendVarint(blocks, counts[i])
+            previous = doc_id
+        skips += SKIP_ENTRY.pack(previous, len(blocks))
+
+    num_blocks = len(skips) // SKIP_ENTRY.size
+    return HEADER.pack(df, num_blocks, block_size) + bytes(skips) + bytes(blocks)
+
+def documentFrequency(data):
+    """
+        returns the number of postings in an encoded postings list without decoding it
+    """
+    return HEADER.unpack_from(data, 0)[0]
+
+def _decodeBlock(data, pos, end, previous):
+    """
+        decodes the postings between pos and end, returns (doc ids, counts) lists
+    """
+    doc_ids = []
+    counts = []
+    values = doc_ids
+    value = 0
+    shift = 0
+    while pos < end:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        # a full varint: gaps and counts alternate
+        if values is doc_ids:
+            previous += value
+            doc_ids.append(previous)
+            values = counts
+        else:
+            counts.append(value)
+            values = doc_ids
+        value = 0
+        shift = 0
+    return doc_ids, counts
+
+class PostingsReader:
+    """
+        streaming decoder over an encoded postings list.
+
+        iterating yields (doc id, count) pairs one block at a time; skipTo uses the
+        skip table to jump straight to the block that can contain a target doc id.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.df, self.num_blocks, self.block_size = HEADER.unpack_from(data, 0)
+        self._blocks_start = HEADER.size + self.num_blocks * SKIP_ENTRY.size
+        skips = list(SKIP_ENTRY.iter_unpack(data[HEADER.size:self._blocks_start]))
+        self._last_docs = [last_doc for last_doc, _ in skips]
+        self._block_ends = [end for _, end in skips]
+
+        # cursor: current block and position inside it
+        self._block = -1
+        self._doc_ids = []
+        self._counts = []
+        self._pos = 0
+
+    def __len__(self):
+        return self.df
+
+    def _loadBlock(self, block):
+        """
+            decodes a block and moves the cursor to its first posting
+        """
+        start = self._block_ends[block - 1] if block > 0 else 0
+        previous = self._last_docs[block - 1] if block > 0 else 0
+        self._doc_ids, self._counts = _decodeBlock(
+            self.data,
+            self._blocks_start + start,
+            self._blocks_start + self._block_ends[block],
+            previous
+        )
+        self._block = block
+        self._pos = 0
+
+    def next(self):
+        """
+            returns the next (doc id, count) pair, or None when the list is exhausted
+        """
+        if self._pos >= len(self._doc_ids):
+            if self._block + 1 >= self.num_blocks:
+                return None
+            self._loadBlock(self._block + 1)
+        posting = (self._doc_ids[self._pos], self._counts[self._pos])
+        self._pos += 1
+        return posting
+
+    def position(self):
+        """
+            returns the index (within the whole list) of the posting returned last
+            by next or skipTo
+        """
+        return self._block * self.block_size + self._pos - 1
+
+    def skipTo(self, target):
+        """
+            advances to the first posting with doc id >= target and returns it
+            (consuming it), or None if there is no such posting.
+            whole blocks whose last doc id is below target are never decoded.
+        """
+        if self._block < 0 or (self._block < self.num_blocks and self._last_docs[self._block] < target):
+            # find the first block that can contain target
+            block = bisect_left(self._last_docs, target, max(self._block, 0))
+            if block >= self.num_blocks:
+                self._block = self.num_blocks
+                self._doc_ids = []
+                self._pos = 0
+                return None
+            self._loadBlock(block)
+
+        # inside the block: the postings are sorted, so bisect from the cursor
+        self._pos = bisect_left(self._doc_ids, target, self._pos)
+        return self.next()
+
+    def __iter__(self):
+        # the rest of the current block, then every following block
+        if 0 <= self._block < self.num_blocks:
+            pos = self._pos
+            self._pos = len(self._doc_ids)
+            yield from zip(self._doc_ids[pos:], self._counts[pos:])
+        for block in range(self._block + 1, self.num_blocks):
+            self._loadBlock(block)
+            self._pos = len(self._doc_ids)
+            yield from zip(self._doc_ids, self._counts)
+
+def decodePostings(data):
+    """
+        decodes a full postings list.
+
+        input:
+            - data: bytes produced by encodePostings
+
+        output: (doc ids, counts) as array('I')
+    """
+    df, num_blocks, _ = HEADER.unpack_from(data, 0)
+    blocks_start = HEADER.size + num_blocks * SKIP_ENTRY.size
+    end = blocks_start
+    if num_blocks:
+        end += SKIP_ENTRY.unpack_from(data, HEADER.size + (num_blocks - 1) * SKIP_ENTRY.size)[1]
+    # blocks are contiguous, so the whole list decodes in one pass
+    doc_ids, counts = _decodeBlock(data, blocks_start, end, 0)
+    return array('I', doc_ids), array('I', counts)
+
+def _decodeVarints(data):
+    """
+        decodes a run of varints with numpy: every byte below 0x80 ends a value,
+        the 7 bit groups of each value are shifted into place and summed per value
+    """
+    raw = np.frombuffer(data, dtype = np.uint8)
+    if not len(raw):
+        return np.zeros(0, dtype = np.int64)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # index of every byte inside its varint
+    shifts = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    groups = (raw & 0x7f).astype(np.int64) << (7 * shifts)
+    return np.add.reduceat(groups, starts)
+
+def decodePostingsArrays(data):
+    """
+        decodes a full postings list into numpy arrays (vectorized, no python loop
+        over the postings).
+
+        input:
+            - data: bytes produced by encodePostings
+
+        output: (doc ids, counts) as int64 numpy arrays
+    """
+    df, num_blocks, _ = HEADER.unpack_from(data, 0)
+    blocks_start = HEADER.size + num_blocks * SKIP_ENTRY.size
+    end = blocks_start
+    if num_blocks:
+        end += SKIP_ENTRY.unpack_from(data, HEADER.size + (num_blocks - 1) * SKIP_ENTRY.size)[1]
+    values = _decodeVarints(data[blocks_start:end])
+    # gaps and counts alternate, and the gaps run on across the blocks
+    return np.cumsum(values[0::2]), values[1::2]
+
+def encodePositions(position_lists):
+    """
+        encodes the token positions of every posting of a term.
+
+        input:
+            - position_lists: ascending token positions of each posting (in postings order)
+
+        output: bytes (offsets table followed by the delta + varint coded positions)
+    """
+    position_lists = list(position_lists)
+    table_size = (len(position_lists) + 1) * POSITION_OFFSET.size
+    blob = bytearray()
+    offsets = [table_size]
+    for positions in position_lists:
+        previous = 0
+        for position in positions:
+            _appendVarint(blob, position - previous)
+            previous = position
+        offsets.append(table_size + len(blob))
+    return b''.join(POSITION_OFFSET.pack(offset) for offset in offsets) + bytes(blob)
+
+def decodePositions(data, i):
+    """
+        returns the token positions of the i-th posting from encoded positions
+    """
+    start, end = struct.unpack_from('<II', data, i * POSITION_OFFSET.size)
+    positions = []
+    previous = 0
+    value = 0
+    shift = 0
+    for byte in data[start:end]:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        positions.append(previous)
+        value = 0
+        shift = 0
+    return positions
+
+def concatPositions(parts):
+    """
+        concatenates the encoded positions of several postings lists of the same term
+        (in postings order) without decoding them
+    """
+    tables = []
+    blobs = []
+    for data in parts:
+        table_size = POSITION_OFFSET.unpack_from(data, 0)[0]
+        tables.append(array('I', (offset for (offset,) in POSITION_OFFSET.iter_unpack(data[:table_size]))))
+        blobs.append(data[table_size:])
+
+    # one offsets table for all postings, shifted past the new table and the blobs before
+    num_postings = sum(len(table) - 1 for table in tables)
+    base = (num_postings + 1) * POSITION_OFFSET.size
+    offsets = [base]
+    for table in tables:
+        shift = base - table[0]
+        offsets.extend(offset + shift for offset in table[1:])
+        base = offsets[-1]
+    return b''.join(POSITION_OFFSET.pack(offset) for offset in offsets) + b''.join(blobs)
+
+def selectPositions(data, indices):
+    """
+        returns the encoded positions of the postings at the given ascending indices only
+        (e.g. without the postings of deleted documents), without decoding them
+    """
+    table_size = (len(indices) + 1) * POSITION_OFFSET.size
+    offsets = [table_size]
+    blobs = []
+    for i in indices:
+        start, end = struct.unpack_from('<II', data, i * POSITION_OFFSET.size)
+        blobs.append(data[start:end])
+        offsets.append(offsets[-1] + end - start)
+    return b''.join(POSITION_OFFSET.pack(offset) for offset in offsets) + b''.join(blobs)
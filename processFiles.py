@@ -1,9 +1,31 @@
 import os
-import re
 import argparse
 from tqdm import tqdm
-import string
 import subprocess
+import itertools
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from invertedIndex import indexDocuments, readCombinedFile, saveIndex, buildShardedIndex, parseDocument
+from stopWords import loadStopwords, DEFAULT_LANGUAGE
+from tokenizer import parseCombinedLine, countWords, Tokenizer, DEFAULT_TOKENIZER
+from pipelineManifest import PipelineManifest, MANIFEST_FILE
+from textCleaner import cleanText
+from fileIO import listFiles, readFiles, splitLines, openOutput
+from blockGzip import openTextOutput, isCompressed, writeSplits
+
+# number of documents a preprocessing worker cleans per batch
+DEFAULT_CHUNK_SIZE = 64
+
+# source files of the code that runs every stage (a change to them reruns the stage)
+STAGE_CODE = {
+    'preprocess': ['processFiles.py', 'textCleaner.py', 'fileIO.py'],
+    'combine': ['processFiles.py', 'fileIO.py', 'blockGzip.py'],
+    'count': ['processFiles.py', 'tokenizer.py', 'fileIO.py'],
+    'stream': ['processFiles.py', 'textCleaner.py', 'invertedIndex.py', 'tokenizer.py', 'fileIO.py', 'blockGzip.py'],
+    'mapreduce': ['mapReduceWordCount.py', 'tokenizer.py', 'stopWords.py', 'blockGzip.py'],
+    'index': ['invertedIndex.py', 'indexStore.py', 'postingsCodec.py', 'tokenizer.py', 'stopWords.py', 'blockGzip.py']
+}
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description = "Process text documents: preprocess, combine, count words, and optionally run MapReduce.")
@@ -23,7 +45,7 @@ def parse_arguments():
         '-o', '--combined_file',
         type = str,
         default = "combined_documents.txt",
-        help = 'Path to the output combined .txt file. Defaults to "combined_documents.txt".'
+        help = 'Path to the output combined .txt file, a name ending in .gz writes it block-compressed (see blockGzip.py). Defaults to "combined_documents.txt".'
     )
     parser.add_argument(
         '-w', '--wordcount_file',
@@ -37,10 +59,16 @@ def parse_arguments():
         help = 'Flag to run the MapReduce job after processing.'
     )
     parser.add_argument(
-        '--context_size',
-        type = int,
-        default = 3,
-        help = 'Number of words to include before and after the target word as context in MapReduce job.'
+        '--stopwords_language',
+        type = str,
+        default = 'english',
+        help = 'NLTK stopword language used by the MapReduce job and the inverted index. Default is "english".'
+    )
+    parser.add_argument(
+        '--stopwords_file',
+        type = str,
+        default = None,
+        help = 'Custom stopword file with one word per line (overrides --stopwords_language).'
     )
     parser.add_argument(
         '--mapreduce_output',
@@ -51,273 +79,624 @@ def parse_arguments():
     parser.add_argument(
         '--build_inverted_index',
         action = 'store_true',
-        help = 'Flag to build the inverted index after MapReduce.'
+        help = 'Flag to build the inverted index (in-process from the combined file, or from the MapReduce output with --run_mapreduce).'
     )
     parser.add_argument(
         '--inverted_index_file',
         type = str,
-        default = 'inverted_index.pkl',
-        help = 'Filename to save the inverted index (default: inverted_index.pkl)'
+        default = 'inverted_index',
+        help = 'Directory to save the memory-mapped inverted index, or a .pkl filename to save a pickle (default: inverted_index)'
+    )
+    parser.add_argument(
+        '--index_workers',
+        type = int,
+        default = None,
+        help = 'Build the inverted index in parallel with this many worker processes (0: number of cpus). Not used with --run_mapreduce or --export_word_counts.'
+    )
+    parser.add_argument(
+        '--export_word_counts',
+        action = 'store_true',
+        help = 'Flag to also write the word counts of the in-process index build to --mapreduce_output (without running MapReduce).'
+    )
+    parser.add_argument(
+        '--workers',
+        type = int,
+        default = 1,
+        help = 'Number of worker processes cleaning the documents (0: number of cpus). Default is 1.'
+    )
+    parser.add_argument(
+        '--chunk_size',
+        type = int,
+        default = DEFAULT_CHUNK_SIZE,
+        help = f'Number of documents a worker cleans per batch. Default is {DEFAULT_CHUNK_SIZE}.'
+    )
+    parser.add_argument(
+        '--unordered',
+        action = 'store_true',
+        help = 'Flag to report the cleaned batches as they finish instead of in input order.'
+    )
+    parser.add_argument(
+        '--io_threads',
+        type = int,
+        default = 1,
+        help = 'Number of threads (per worker) reading the next documents while one is processed, hides the latency of a network filesystem. Default is 1.'
+    )
+    parser.add_argument(
+        '--stemmer',
+        type = str,
+        default = None,
+        help = 'Index the stems of the words: "porter" or a Snowball language such as "english". Default is no stemming.'
+    )
+    parser.add_argument(
+        '--fold_unicode',
+        action = 'store_true',
+        help = 'Flag to case fold the documents and remove accents and compatibility forms before splitting them into words.'
+    )
+    parser.add_argument(
+        '--stream',
+        action = 'store_true',
+        help = 'Flag to clean, combine and count the documents in a single pass that reads every document once (with --build_inverted_index the index is built in the same pass, unless --run_mapreduce or --index_workers is used).'
+    )
+    parser.add_argument(
+        '--write_cleaned',
+        action = 'store_true',
+        help = 'Flag to also write the cleaned documents to --cleaned_dir in a --stream run.'
+    )
+    parser.add_argument(
+        '--manifest',
+        type = str,
+        default = MANIFEST_FILE,
+        help = f'Manifest of the input and output hashes of every stage, stages with unchanged inputs are skipped. Default is "{MANIFEST_FILE}".'
+    )
+    parser.add_argument(
+        '--force',
+        action = 'store_true',
+        help = 'Flag to run every stage, even if its inputs and parameters did not change.'
     )
     return parser.parse_args()
-    return parser.parse_args()
 
-def run_inverted_index(input_file, output_file):
+def scriptPath(filename):
+    """
+        returns the path of a script of the pipeline (they live next to this file, whatever the working directory)
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+def tokenizerOptions(tokenizer, separator = '_'):
+    """
+        returns the command line options of a tokenizer for invertedIndex.py
+        (or mapReduceWordCount.py, whose options are separated by '-')
+    """
+    options = []
+    if tokenizer.stemmer:
+        options += ['--stemmer', tokenizer.stemmer]
+    if tokenizer.fold:
+        options.append(f'--fold{separator}unicode')
+    return options
+
+def run_inverted_index(input_file, output_file, wordcount_file, combined_file, stopwords_language, stopwords_file,
+                       tokenizer = DEFAULT_TOKENIZER):
     """
         runs the invertedIndex.py script using subprocess
 
         parameters:
             - input_file (str): the path to the input file
             - output_file (str): he path to the output file
+            - wordcount_file (str): the path to the word count file
+            - combined_file (str): the path to the combined file (for the context snippets)
+            - stopwords_language (str): NLTK stopword language
+            - stopwords_file (str): optional custom stopword file
+            - tokenizer (Tokenizer): the tokenizer the MapReduce job used
+
+        returns: true if the index was built
     """
     cmd = [
-        'python3', 'invertedIndex.py',
+        'python3', scriptPath('invertedIndex.py'),
         '--input_file', input_file,
-        '--output_file', output_file
+        '--output_file', output_file,
+        '--word_count_file', wordcount_file,
+        '--forward_file', combined_file,
+        '--stopwords_language', stopwords_language
     ]
+    if stopwords_file:
+        cmd += ['--stopwords_file', stopwords_file]
+    cmd += tokenizerOptions(tokenizer)
 
     try:
         subprocess.run(cmd, check = True)
         print(f"Inverted index built and saved to '{output_file}'.")
-    except subprocess.CalledProcessError as e:
+        return True
+    except (subprocess.CalledProcessError, OSError) as e:
         print(f"An error occurred while building the inverted index: {e}")
+        return False
 
-# function to clean a single file's content
-def cleanText(text):
-    # remove sections after specific headers
-    text = re.split(r"==See also==", text, 1)[0]
-    text = re.split(r"== References ==", text, 1)[0]
-    text = re.split(r"== External links ==", text, 1)[0]
-    
-    # Remove various types of headers
-    text = re.sub(r"===.*?===", "", text)  # removes headers like ===Header===
-    text = re.sub(r"==.*?==", "", text)    # removes headers like ==Header==
-    
-    # remove wikitables and HTML/XML tags
-    text = re.sub(r"{\|.*?\|}", "", text, flags=re.DOTALL)  
-    text = re.sub(r"<.*?>", "", text)                       
-    
-    # remove urls and specific patterns
-    text = re.sub(r'http\S+', '', text)
-    text = re.sub(r"\bthumb\|.*?\|", "", text)
-    text = re.sub(r"\b\d+px\b\s*\w*", "", text)  # removes numeric px| patterns and trailing content
-    
-    # replace escaped apostrophe and separate punctuation
-    text = text.replace(r"\"", "\"")  # fix apostrophes
-    text = re.sub(r"([.,*:;!?()|])", r" \1 ", text)  # separate punctuation from words
-    
-    # remove newline characters
-    text = text.replace("\n", " ").replace("\r", " ")
+def build_inverted_index(combined_file, output_file, stopwords_language, stopwords_file, export_file = None, workers = None,
+                         tokenizer = DEFAULT_TOKENIZER):
+    """
+        builds the inverted index in-process, streaming the documents of the combined file
+        straight into the index (no MapReduce job and no word_counts.txt round trip)
+
+        parameters:
+            - combined_file (str): the path to the combined documents file
+            - output_file (str): the path to the index directory (or .pkl file)
+            - stopwords_language (str): NLTK stopword language
+            - stopwords_file (str): optional custom stopword file
+            - export_file (str): optional path to also write the word counts (word_counts.txt format)
+            - workers (int): optional number of worker processes for a parallel (sharded) build
+            - tokenizer (Tokenizer): splits the documents into words (stored in the index)
+
+        returns: true if the index was built
+    """
+    if not os.path.exists(combined_file):
+        print(f"Combined file not found: {combined_file}")
+        return False
+
+    stop_words = loadStopwords(stopwords_language, stopwords_file)
+    print("Building the inverted index...")
+    if workers is not None and export_file is None and not output_file.endswith('.pkl'):
+        # shards are indexed by a process pool and merged into the output directory
+        num_terms = buildShardedIndex(combined_file, output_file, workers, stop_words = stop_words, tokenizer = tokenizer)
+        if num_terms is None:
+            return False
+        print(f"Total unique words (excluding stop words): {num_terms}")
+        print(f"inverted index saved to {output_file}")
+        return True
+
+    index = indexDocuments(readCombinedFile(combined_file), stop_words, export_file, tokenizer)
+    print(f"Total unique words (excluding stop words): {len(index)}")
+    return saveIndex(index, output_file)
+
+def preprocessDocument(filename, text, clean = cleanText):
+    """
+        cleans the text of a raw document (see textCleaner.py), keeping its title line
+
+        parameters:
+            - filename (str): name of the document (for warnings)
+            - text (str): the raw document, as read by fileIO.readText
+            - clean (function): the text cleaner (default: cleanText)
+
+        returns: the cleaned content, the title line and the cleaned body separated by a newline
+    """
+    # extract the title line (strip trailing and leading whitespace) and the body after it
+    first_line, _, body_text = text.partition('\n')
+    title_line = first_line.strip()
     
-    # remove extra whitespace
-    text = re.sub(r"\s+", " ", text).strip()
+    # ensure the title line starts with "Title: "
+    if not title_line.startswith("Title: "):
+        print(f"Warning: {filename} does not start with a title line.")
+        # clean the whole text using the function above
+        return clean(text)
+
+    # clean the body (the title line excluded)
+    cleaned_body = clean(body_text)
     
-    return text
+    # combine the title and cleaned body with a newline
+    return f"{title_line}\n{cleaned_body}"
+
+def cleanChunk(input_dir, filenames, output_dir = None, clean = cleanText, io_threads = 1):
+    """
+        reads and cleans a batch of documents, optionally writing them to the output directory
+        (the unit of work of a preprocessing worker)
+
+        parameters:
+            - input_dir (str): directory of the raw documents
+            - filenames (list): the documents of the batch
+            - output_dir (str): optional directory the cleaned documents are written to
+            - clean (function): the text cleaner (default: cleanText)
+            - io_threads (int): number of threads reading the documents ahead (see fileIO.readFiles)
+
+        returns: list of (filename, cleaned content or None for an empty file, error message or None),
+                 in the order of filenames
+    """
+    results = []
+    for filename, text, error in readFiles(input_dir, filenames, io_threads):
+        # one bad file does not stop the others, it is reported with its error
+        if error is not None:
+            results.append((filename, None, str(error)))
+            continue
+        try:
+            # if file is empty, skip it
+            final_content = None
+            if text:
+                # clean the body, keeping the title line
+                final_content = preprocessDocument(filename, text, clean)
+
+                # save the cleaned content to a new file
+                if output_dir is not None:
+                    with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as file:
+                        file.write(final_content)
+            results.append((filename, final_content, None))
+        except Exception as e:
+            results.append((filename, None, str(e)))
+    return results
 
-def preprocess_files(input_dir, output_dir):
+def preprocessChunk(input_dir, output_dir, filenames, clean = cleanText, io_threads = 1):
+    """
+        cleans a batch of documents and writes them to the output directory
+
+        parameters:
+            - input_dir (str): directory of the raw documents
+            - output_dir (str): directory the cleaned documents are written to
+            - filenames (list): the documents of the batch
+            - clean (function): the text cleaner (default: cleanText)
+            - io_threads (int): number of threads reading the documents ahead
+
+        returns: list of (filename, error message or None), in the order of filenames
+    """
+    # the cleaned content stays in the worker, it is already on disk
+    return [(filename, error) for filename, _, error in cleanChunk(input_dir, filenames, output_dir, clean, io_threads)]
+
+def mapChunks(function, filenames, workers = 1, chunk_size = DEFAULT_CHUNK_SIZE, ordered = True):
+    """
+        runs function(batch) over batches of chunk_size filenames, on a process pool with
+        several workers. only a few batches per worker are in flight at a time, so the results of a
+        large directory are never all held in memory when the caller consumes them slower.
+
+        parameters:
+            - function (function): the unit of work, called with a list of filenames
+              (a module level function or a functools.partial of one, so the workers can unpickle it)
+            - filenames (list): all the filenames
+            - workers (int): number of worker processes (1: in this process, 0: number of cpus)
+            - chunk_size (int): number of filenames per batch
+            - ordered (bool): yield the results of the batches in input order instead of as they finish
+
+        returns: generator of the result of every batch
+    """
+    chunk_size = max(chunk_size, 1)
+    chunks = [filenames[i:i + chunk_size] for i in range(0, len(filenames), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        remaining = iter(chunks)
+        pending = []
+        while True:
+            # keep two batches per worker in flight
+            for chunk in itertools.islice(remaining, 2 * workers - len(pending)):
+                pending.append(executor.submit(function, chunk))
+            if not pending:
+                return
+            if ordered:
+                # batch by batch in input order
+                yield pending.pop(0).result()
+            else:
+                # as soon as a batch is done
+                done, not_done = wait(pending, return_when = FIRST_COMPLETED)
+                pending = [future for future in pending if future in not_done]
+                for future in done:
+                    yield future.result()
+
+def preprocess_files(input_dir, output_dir, workers = 1, chunk_size = DEFAULT_CHUNK_SIZE, ordered = True, clean = cleanText,
+                     io_threads = 1):
+    """
+        cleans every document of the input directory into the output directory.
+        with several workers the documents are cut into batches of chunk_size files
+        that a process pool cleans in parallel (cleaning is cpu-bound).
+
+        parameters:
+            - input_dir (str): directory of the raw documents
+            - output_dir (str): directory the cleaned documents are written to
+            - workers (int): number of worker processes (1: in this process, 0: number of cpus)
+            - chunk_size (int): number of documents per batch
+            - ordered (bool): report the results of the batches in input order instead of as they finish
+            - clean (function): the text cleaner (default: cleanText)
+            - io_threads (int): number of threads per worker reading the documents ahead
+
+        returns: list of (filename, error message) of the documents that failed
+                 (None if the input directory does not exist)
+    """
     # create output directory if it does not exist
     os.makedirs(output_dir, exist_ok=True)
 
     # check if input directory exists
     if not os.path.isdir(input_dir):
         print(f"Error: The input directory '{input_dir}' does not exist.")
-        return
+        return None
 
-    # iterate through files in the input directory
-    for filename in tqdm(os.listdir(input_dir), desc="Preprocessing files"):
-        file_path = os.path.join(input_dir, filename)
-        
-        # open the file
-        with open(file_path, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-        
-        # if file is empty, skip it
-        if not lines:
-            continue
-        
-        # extract the title line (strip trailing and leading whitespace)
-        title_line = lines[0].strip()
-        
-        # ensure the title line starts with "Title: "
-        if not title_line.startswith("Title: "):
-            print(f"Warning: {filename} does not start with a title line.")
-            # get the body text
-            body_text = ''.join(lines)
-            # clean it using the function above
-            cleaned_body = cleanText(body_text)
-            # get the final content
-            final_content = cleaned_body
-        else:
-            # extract the title text
-            title_text = title_line 
-            
-            # combine the remaining lines into body text
-            body_text = ''.join(lines[1:])  # Exclude the title line
-            cleaned_body = cleanText(body_text)
-            
-            # combine the title and cleaned body with a newline
-            final_content = f"{title_text}\n{cleaned_body}"
-        
-        # save the cleaned content to a new file
-        output_path = os.path.join(output_dir, filename)
-        try:
-            with open(output_path, 'w', encoding='utf-8') as file:
-                file.write(final_content)
-        except Exception as e:
-            print(f"Error writing to '{output_path}': {e}")
-            continue
+    filenames = listFiles(input_dir)
+
+    failed = []
+    # iterate through the batches (tqdm for progress tracking)
+    with tqdm(total = len(filenames), desc = "Preprocessing files") as progress:
+        for results in mapChunks(partial(preprocessChunk, input_dir, output_dir, clean = clean, io_threads = io_threads), filenames, workers, chunk_size, ordered):
+            for filename, error in results:
+                if error is not None:
+                    progress.write(f"Error processing '{filename}': {error}")
+                    failed.append((filename, error))
+            progress.update(len(results))
 
-    print(f"Preprocessing complete. Cleaned files saved in {output_dir}")
+    print(f"Preprocessing complete. Cleaned files saved in {output_dir}" + (f" ({len(failed)} files failed)" if failed else ""))
+    return failed
 
-def combine_files(input_dir, combined_file_path):
+def combine_files(input_dir, combined_file_path, io_threads = 1):
     """
         combines all files in the input directory into a single tab-delimited text file
         each line contains 'filename', 'title', and 'content' separated by tabs
 
         parameters:
             - input_dir (str): directory containing the input text files.
-            - combined_file_path (str): Path to the output combined .txt file.
+            - combined_file_path (str): Path to the output combined .txt file (block-compressed if it ends in .gz).
+            - io_threads (int): number of threads reading the files ahead (see fileIO.readFiles)
+
+        returns: true if every file was combined
     """
+    failed = 0
     try:
-        with open(combined_file_path, 'w', encoding='utf-8') as outfile:
+        with openTextOutput(combined_file_path) as outfile:
             # outfile.write("Filename\tTitle\tContent\n")
             
             # get list of files
-            files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f))]
+            files = listFiles(input_dir)
             
             if not files:
                 print(f"No files found in the input directory '{input_dir}'.")
-                return
-
-            # iterate through each file with progress tracking
-            for filename in tqdm(files, desc="Combining files"):
-                file_path = os.path.join(input_dir, filename)
+                return False
+
+            # iterate through each file with progress tracking (every file is read in one go)
+            for filename, text, error in tqdm(readFiles(input_dir, files, io_threads), total=len(files), desc="Combining files"):
+                if error is not None:
+                    print(f"Error processing file '{filename}': {error}")
+                    failed += 1
+                    continue
                 
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as infile:
-                        lines = infile.readlines()
+                    lines = splitLines(text)
+                    
+                    # if file is empty, skip it
+                    if not lines:
+                        print(f"Skipping '{filename}': File is empty.")
+                        continue
+
+                    # initialize title and content
+                    title_text = "[Missing Title]"
+                    content = []
+
+                    # process lines to extract title and content
+                    for line in lines:
+                        # remove trailing and leading whitespaces
+                        line = line.strip()
                         
-                        # if file is empty, skip it
-                        if not lines:
-                            print(f"Skipping '{filename}': File is empty.")
-                            continue
-
-                        # initialize title and content
-                        title_text = "[Missing Title]"
-                        content = []
-
-                        # process lines to extract title and content
-                        for line in lines:
-                            # remove trailing and leading whitespaces
-                            line = line.strip()
-                            
-                            # check for title line
-                            if line.startswith("Title: "):
-                                title_text = line[len("Title: "):].strip()
-                            elif not line.startswith("Filename: "):
-                                # append to content if it's not a filename or title line
-                                content.append(line)
-
-                        # join content lines with spaces
-                        content_text = ' '.join(content)
-
-                        # replace any tabs in the fields to avoid misalignment
-                        filename_clean = filename.replace('\t', ' ')
-                        title_clean = title_text.replace('\t', ' ')
-                        content_clean = content_text.replace('\t', ' ')
-
-                        # create a tab delimited line
-                        line_out = f"{filename_clean}\t{title_clean}\t{content_clean}\n"
-
-                        # rrite the line to the output file
-                        outfile.write(line_out)
+                        # check for title line
+                        if line.startswith("Title: "):
+                            title_text = line[len("Title: "):].strip()
+                        elif not line.startswith("Filename: "):
+                            # append to content if it's not a filename or title line
+                            content.append(line)
+
+                    # join content lines with spaces
+                    content_text = ' '.join(content)
+
+                    # replace any tabs in the fields to avoid misalignment
+                    filename_clean = filename.replace('\t', ' ')
+                    title_clean = title_text.replace('\t', ' ')
+                    content_clean = content_text.replace('\t', ' ')
+
+                    # create a tab delimited line
+                    line_out = f"{filename_clean}\t{title_clean}\t{content_clean}\n"
+
+                    # rrite the line to the output file (buffered, see fileIO.openOutput)
+                    outfile.write(line_out)
 
                 except Exception as e:
                     print(f"Error processing file '{filename}': {e}")
+                    failed += 1
 
-        print(f"All files have been successfully combined into '{combined_file_path}' in tab-delimited format.")
+        print(f"All files have been successfully combined into '{combined_file_path}' in tab-delimited format."
+              if not failed else f"Files combined into '{combined_file_path}' ({failed} files failed).")
+        return not failed
 
     except Exception as e:
         print(f"Failed to write to '{combined_file_path}': {e}")
+        return False
 
-def count_words(input_folder, output_file):
+def count_words(input_folder, output_file, tokenizer = DEFAULT_TOKENIZER, io_threads = 1):
     """
         counts the number of words in each document within the input_folder
-        skips the first line and excludes punctuation
+        skips the first line and counts the words the index is built from (see tokenizer.py)
         writes the results to output_file.
 
         parameters:
             - input_folder (str): location of the input files
             - output_file (str): path to the output file
-    """
-    # prepare a translation table to remove punctuation
-    translator = str.maketrans('', '', string.punctuation)
+            - tokenizer (Tokenizer): splits the documents into words
+            - io_threads (int): number of threads reading the files ahead (see fileIO.readFiles)
 
+        returns: true if the words of every file were counted
+    """
+    failed = 0
     try:
-        with open(output_file, 'w', encoding='utf-8') as outfile:
+        with openOutput(output_file) as outfile:
             # write header line (optional)
             # outfile.write("Filename\tWordCount\n")
 
             # get list of files
-            files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))]
+            files = listFiles(input_folder)
 
             if not files:
                 print(f"No files found in the input directory '{input_folder}'.")
-                return
+                return False
 
-            # iterate over all files (track progress using tqdm)
-            for filename in tqdm(files, desc="Counting words"):
-                file_path = os.path.join(input_folder, filename)
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as infile:
-                        lines = infile.readlines()
-                        
-                        if not lines:
-                            # if the file is empty -> word count is 0
-                            word_count = 0
-                        else:
-                            # skip the first line (assumed to be the title)
-                            content = ''.join(lines[1:])
-                            
-                            # remove punctuation
-                            content = content.translate(translator)
-                            
-                            # split the content into words
-                            words = content.split()
-                            
-                            # count the number of words
-                            word_count = len(words)
-                    
-                    # write the filename and word count to the output file
-                    outfile.write(f"{filename}:{word_count}\n")
-                
-                except Exception as e:
+            # iterate over all files (track progress using tqdm, every file is read in one go)
+            for filename, text, error in tqdm(readFiles(input_folder, files, io_threads), total=len(files), desc="Counting words"):
+                if error is not None:
                     # handle exceptions byt just prinitng out the file that failed
-                    print(f"Error processing '{filename}': {e}")
+                    print(f"Error processing '{filename}': {error}")
+                    failed += 1
+                    continue
 
-        print(f"Word counts have been written to '{output_file}'.")
+                # skip the first line (assumed to be the title), an empty file has a word count of 0
+                content = text.partition('\n')[2]
+
+                # count the words (punctuation removed), split like the index splits them
+                word_count = countWords(content, tokenizer)
+
+                # write the filename and word count to the output file
+                outfile.write(f"{filename}:{word_count}\n")
+
+        print(f"Word counts have been written to '{output_file}'." + (f" ({failed} files failed)" if failed else ""))
+        return not failed
 
     except Exception as e:
         print(f"Failed to write to '{output_file}': {e}")
+        return False
+
+def streamDocuments(input_dir, combined_file, wordcount_file, cleaned_dir = None, workers = 1, chunk_size = DEFAULT_CHUNK_SIZE,
+                    ordered = True, failed = None, clean = cleanText, tokenizer = DEFAULT_TOKENIZER, io_threads = 1):
+    """
+        single pass over the raw documents: every document is read once, cleaned (in batches on a
+        process pool with several workers) and fanned out to the combined file and the word counts,
+        and to the cleaned directory if one is given. the files get the same lines preprocess_files,
+        combine_files and count_words write, in the order of the input directory.
+
+        parameters:
+            - input_dir (str): directory of the raw documents
+            - combined_file (str): path to the output combined .txt file (block-compressed if it ends in .gz)
+            - wordcount_file (str): path to the output word count file
+            - cleaned_dir (str): optional directory the cleaned documents are also written to
+            - workers (int): number of worker processes (1: in this process, 0: number of cpus)
+            - chunk_size (int): number of documents per batch
+            - ordered (bool): keep the input order instead of taking the batches as they finish
+            - failed (list): optional list the (filename, error message) of the failed documents are added to
+            - clean (function): the text cleaner (default: cleanText)
+            - tokenizer (Tokenizer): splits the documents into words for the word counts
+            - io_threads (int): number of threads per worker reading the documents ahead
+
+        returns: generator of (filename, title, content) of every combined document, like readCombinedFile
+                 (the pass runs as it is consumed, e.g. by indexDocuments)
+    """
+    filenames = listFiles(input_dir)
+    if cleaned_dir is not None:
+        os.makedirs(cleaned_dir, exist_ok=True)
+
+    with openTextOutput(combined_file) as combined, openOutput(wordcount_file) as counts, \
+         tqdm(total = len(filenames), desc = "Processing files") as progress:
+        batches = mapChunks(partial(cleanChunk, input_dir, output_dir = cleaned_dir, clean = clean, io_threads = io_threads),
+                            filenames, workers, chunk_size, ordered)
+        for results in batches:
+            # the lines of a batch are written together
+            combined_lines = []
+            count_lines = []
+            for filename, content, error in results:
+                if error is not None:
+                    progress.write(f"Error processing '{filename}': {error}")
+                    if failed is not None:
+                        failed.append((filename, error))
+                    continue
+                # an empty raw document has no cleaned file, so it is neither combined nor counted
+                if content is None:
+                    continue
+
+                # count the words of the body, skipping the title line (like count_words)
+                body = content.partition('\n')[2]
+                count_lines.append(f"{filename}:{countWords(body, tokenizer)}\n")
+
+                # the lines of the cleaned document the way they are read back from its file
+                lines = splitLines(content)
+                if not lines:
+                    continue
+
+                # tab delimited filename, title and content (like combine_files)
+                line_out = '\t'.join(parseDocument(filename, lines)) + '\n'
+                combined_lines.append(line_out)
+
+                # the document the way readCombinedFile reads it back
+                document = parseCombinedLine(line_out)
+                if document is not None:
+                    yield document
+            combined.writelines(combined_lines)
+            counts.writelines(count_lines)
+            progress.update(len(results))
+
+def stream_files(input_dir, combined_file, wordcount_file, cleaned_dir = None, workers = 1, chunk_size = DEFAULT_CHUNK_SIZE,
+                 ordered = True, index_file = None, stopwords_language = DEFAULT_LANGUAGE, stopwords_file = None, export_file = None,
+                 tokenizer = DEFAULT_TOKENIZER, io_threads = 1):
+    """
+        preprocesses, combines and counts the words of the documents in a single pass over the
+        input directory (see streamDocuments), without going through the cleaned directory.
+        with an index file the inverted index is built in the same pass, like build_inverted_index.
 
-def run_mapreduce(combined_file, output_file, context_size):
+        parameters:
+            - input_dir (str): directory of the raw documents
+            - combined_file (str): path to the output combined .txt file (block-compressed if it ends in .gz)
+            - wordcount_file (str): path to the output word count file
+            - cleaned_dir (str): optional directory the cleaned documents are also written to
+            - workers (int), chunk_size (int), ordered (bool): batches of the cleaning (see preprocess_files)
+            - index_file (str): optional index directory (or .pkl file) to build
+            - stopwords_language (str): NLTK stopword language of the index
+            - stopwords_file (str): optional custom stopword file of the index
+            - export_file (str): optional path to also write the word counts of the index (word_counts.txt format)
+            - tokenizer (Tokenizer): splits the documents into words (for the word counts and the index)
+            - io_threads (int): number of threads per worker reading the documents ahead
+
+        returns: true if every document was processed
+    """
+    # check if input directory exists
+    if not os.path.isdir(input_dir):
+        print(f"Error: The input directory '{input_dir}' does not exist.")
+        return False
+
+    failed = []
+    documents = streamDocuments(input_dir, combined_file, wordcount_file, cleaned_dir, workers, chunk_size, ordered, failed,
+                                tokenizer = tokenizer, io_threads = io_threads)
+    if index_file is None:
+        # run the pass
+        for _ in documents:
+            pass
+    else:
+        stop_words = loadStopwords(stopwords_language, stopwords_file)
+        index = indexDocuments(documents, stop_words, export_file, tokenizer)
+        print(f"Total unique words (excluding stop words): {len(index)}")
+        if not saveIndex(index, index_file):
+            return False
+
+    print(f"Documents combined into '{combined_file}' and word counts written to '{wordcount_file}'"
+          + (f" ({len(failed)} files failed)." if failed else "."))
+    return not failed
+
+def run_mapreduce(combined_file, output_file, stopwords_language, stopwords_file, tokenizer = DEFAULT_TOKENIZER):
     """
         runs the MapReduce job using mapReduceWordCount.py
+        (the mappers of a block-compressed combined file get the byte ranges of its blocks as their input)
+
+        returns: true if the job succeeded
     """
-    # cuild the command to run the MapReduce job
-    cmd = [
-        'python3', 'mapReduceWordCount.py',
-        combined_file,
-        '--context-size', str(context_size)
-    ]
+    if not os.path.exists(combined_file):
+        print(f"Combined file not found: {combined_file}")
+        return False
 
-    # open the output file to write the MapReduce results
-    with open(output_file, 'w', encoding = 'utf-8') as outfile:
-        # run the command and redirect stdout to the output file
-        subprocess.run(cmd, stdout = outfile)
+    # cuild the command to run the MapReduce job
+    splits_file = None
+    if isCompressed(combined_file):
+        splits_file = f"{combined_file}.splits"
+        writeSplits(combined_file, splits_file)
+        cmd = ['python3', scriptPath('mapReduceWordCount.py'), splits_file, '--combined-blocks', combined_file]
+    else:
+        cmd = ['python3', scriptPath('mapReduceWordCount.py'), combined_file]
+    cmd += ['--stopwords-language', stopwords_language]
+    if stopwords_file:
+        cmd += ['--stopwords-file', stopwords_file]
+    cmd += tokenizerOptions(tokenizer, '-')
 
+    try:
+        # open the output file to write the MapReduce results
+        with open(output_file, 'w', encoding = 'utf-8') as outfile:
+            # run the command and redirect stdout to the output file
+            returncode = subprocess.run(cmd, stdout = outfile).returncode
+    except OSError as e:
+        print(f"An error occurred while running the MapReduce job: {e}")
+        return False
+    finally:
+        if splits_file is not None and os.path.exists(splits_file):
+            os.remove(splits_file)
+
+    if returncode != 0:
+        print(f"The MapReduce job failed (exit status {returncode}).")
+        return False
     print(f"MapReduce job complete. Results saved in '{output_file}'.")
+    return True
 
 def main():
     args = parse_arguments()
@@ -326,27 +705,99 @@ def main():
     combined_file = args.combined_file
     wordcount_file = args.wordcount_file
     run_mr = args.run_mapreduce
-    context_size = args.context_size
     mapreduce_output = args.mapreduce_output
     build_index = args.build_inverted_index
     inverted_index_file = args.inverted_index_file
 
 
-    # preprocess files
-    preprocess_files(input_dir, cleaned_dir)
-
-    # combine files
-    combine_files(cleaned_dir, combined_file)
+    # one tokenizer for the word counts, the MapReduce job and the index (it is stored in the index)
+    try:
+        tokenizer = Tokenizer(args.stemmer, args.fold_unicode)
+    except ValueError as e:
+        print(f"Invalid option: {e}")
+        return
 
-    # count words
-    count_words(cleaned_dir, wordcount_file)
+    # every stage is skipped if its inputs (data and code), parameters and outputs did not change
+    manifest = PipelineManifest(args.manifest)
+
+    def code(stage):
+        return [scriptPath(filename) for filename in STAGE_CODE[stage]]
+
+    # the stopwords change the MapReduce output and the index
+    stopwords_inputs = [args.stopwords_file] if args.stopwords_file else []
+    stopwords_params = {'stopwords_language': args.stopwords_language, 'stopwords_file': bool(args.stopwords_file),
+                        'tokenizer': tokenizer.config()}
+
+    # the in-process index (not sharded) can be built in the same pass as the documents are streamed
+    index_in_pass = args.stream and build_index and not run_mr and args.index_workers is None
+    export_file = mapreduce_output if args.export_word_counts else None
+
+    if args.stream:
+        # every raw document is read once and goes straight to the combined file and the word counts
+        # (the cleaned directory is only written with --write_cleaned)
+        stream_cleaned_dir = cleaned_dir if args.write_cleaned else None
+        inputs = [input_dir] + code('stream')
+        params = {'write_cleaned': args.write_cleaned, 'index': index_in_pass, 'tokenizer': tokenizer.config()}
+        outputs = [combined_file, wordcount_file] + ([cleaned_dir] if args.write_cleaned else [])
+        index_file = None
+        if index_in_pass:
+            index_file = inverted_index_file
+            inputs += stopwords_inputs + code('index')
+            params.update(stopwords_params, export_word_counts = bool(export_file))
+            outputs += [inverted_index_file] + ([export_file] if export_file else [])
+        manifest.runStage(
+            'stream',
+            lambda: stream_files(input_dir, combined_file, wordcount_file, stream_cleaned_dir, args.workers, args.chunk_size,
+                                 not args.unordered, index_file, args.stopwords_language, args.stopwords_file,
+                                 export_file if index_in_pass else None, tokenizer, args.io_threads),
+            inputs, params, outputs, args.force
+        )
+    else:
+        # preprocess files (the number of workers and threads is not a parameter, they do not change the output)
+        # a run with failed documents (or without an input directory) is not recorded, so they are retried next time
+        manifest.runStage('preprocess', lambda: preprocess_files(input_dir, cleaned_dir, args.workers, args.chunk_size, not args.unordered,
+                                                                 io_threads = args.io_threads) == [],
+                          [input_dir] + code('preprocess'), {}, [cleaned_dir], args.force)
+
+        # combine files
+        manifest.runStage('combine', lambda: combine_files(cleaned_dir, combined_file, args.io_threads),
+                          [cleaned_dir] + code('combine'), {}, [combined_file], args.force)
+
+        # count words
+        manifest.runStage('count', lambda: count_words(cleaned_dir, wordcount_file, tokenizer, args.io_threads),
+                          [cleaned_dir] + code('count'), {'tokenizer': tokenizer.config()}, [wordcount_file], args.force)
 
     # run MapReduce job if requested
+    mapreduce_done = True
     if run_mr:
-        run_mapreduce(combined_file, mapreduce_output, context_size)
-
-    if build_index:
-        run_inverted_index(mapreduce_output, inverted_index_file)
+        mapreduce_done = manifest.runStage('mapreduce', lambda: run_mapreduce(combined_file, mapreduce_output, args.stopwords_language, args.stopwords_file, tokenizer),
+                                           [combined_file] + stopwords_inputs + code('mapreduce'), stopwords_params, [mapreduce_output], args.force)
+
+    if build_index and not index_in_pass:
+        if run_mr and not mapreduce_done:
+            # the output of a failed job is missing or incomplete
+            print("Skipping index: the MapReduce job did not finish.")
+        elif run_mr:
+            # index the MapReduce output
+            manifest.runStage(
+                'index',
+                lambda: run_inverted_index(mapreduce_output, inverted_index_file, wordcount_file, combined_file, args.stopwords_language, args.stopwords_file, tokenizer),
+                [mapreduce_output, wordcount_file, combined_file] + stopwords_inputs + code('index'),
+                dict(stopwords_params, source = 'mapreduce'),
+                [inverted_index_file],
+                args.force
+            )
+        else:
+            # single pass over the combined file, word_counts.txt is only written if asked for
+            # (the number of index workers is not a parameter, the parallel build writes the same index)
+            manifest.runStage(
+                'index',
+                lambda: build_inverted_index(combined_file, inverted_index_file, args.stopwords_language, args.stopwords_file, export_file, args.index_workers, tokenizer),
+                [combined_file] + stopwords_inputs + code('index'),
+                dict(stopwords_params, source = 'combined', export_word_counts = bool(export_file)),
+                [inverted_index_file] + ([export_file] if export_file else []),
+                args.force
+            )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,115 @@
+'''
+Description: bounded LRU cache of search results.
+
+Query traffic is skewed towards a few hundred terms, so the top n results of
+a query are kept and returned again without scoring. Queries are normalized
+by their parse tree (so 'War  peace' and 'war AND peace' share an entry) and
+the key also holds the number of results, the context size and the ranking
+function with its parameters.
+
+Every key starts with the build id of the index (see indexStore.py), so a
+rebuilt index never returns results of the previous one: as soon as a query
+for another build id arrives, the entries of the old build are dropped.
+'''
+
+import threading
+from collections import OrderedDict
+
+# default number of queries kept
+DEFAULT_CACHE_SIZE = 1024
+
+def queryKey(index, tree, top_n, context_size, scorer):
+    """
+        returns the cache key of a query.
+
+        input:
+            - index: InvertedIndex or MappedIndex the query runs on
+            - tree: query tree from parseQuery (the normalized query)
+            - top_n: number of results
+            - context_size: number of words before and after a match shown as its context
+            - scorer: ranking function from scoring.py
+
+        output: hashable key, the build id of the index first
+    """
+    # indexes pickled before build ids existed are told apart by object
+    build_id = getattr(index, 'build_id', None) or id(index)
+    return (build_id, repr(tree), top_n, context_size, scorer.key())
+
+class QueryCache:
+    """
+        LRU cache of query key -> results with hit / miss / eviction counters.
+        a max_entries of 0 disables it. safe to share between threads (searchServer.py
+        runs queries on a thread pool).
+    """
+
+    def __init__(self, max_entries = DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.build_id = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def _checkBuild(self, key):
+        """
+            drops every entry when the key belongs to another index build
+        """
+        if key[0] != self.build_id:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.build_id = key[0]
+
+    def get(self, key):
+        """
+            returns the cached results of a key (now the most recently used) or None
+        """
+        with self.lock:
+            self._checkBuild(key)
+            results = self.entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key, results):
+        """
+            stores the results of a key, evicting the least recently used entry when full
+        """
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self._checkBuild(key)
+            self.entries[key] = results
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+            returns the counters (and the hit rate) as a dictionary
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def summary(self):
+        """
+            returns the counters as one line of text
+        """
+        stats = self.stats()
+        return (f"query cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+                f"{stats['invalidations']} invalidated ({stats['hit_rate']:.1%} hit rate)")
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,629 @@
+'''
+Description: boolean query parser and evaluator for the inverted index.
+
+Supported syntax (operators must be written in capitals, so the words
+'and', 'or' and 'not' can still be searched):
+    - new york              implicit AND between terms
+    - war AND peace         both terms
+    - war OR peace          either term
+    - war NOT peace         war but not peace
+    - (war OR peace) king   parentheses for grouping
+    - "new york"            phrase: the words next to each other, in order
+    - war NEAR/5 peace      proximity: at most 5 positions apart, in any order
+                            (NEAR/1 is next to each other, NEAR/5 allows up to
+                            4 words in between; operands can be words, phrases
+                            or other NEARs, but not stopwords)
+
+Conjunctions are evaluated starting from the rarest term; every other term
+is merged in with skipTo on its compressed postings (or a galloping search
+for sub-expressions), so an AND query costs close to its shortest postings
+list instead of the sum of all of them.
+
+Ranking decodes the postings of every query term into numpy arrays, adds
+the scores of all postings of a term to a dense per-document score array in
+one array operation and selects the top n matches with argpartition.
+
+Phrases and NEAR are first evaluated as a conjunction of their words, then
+the token positions of the remaining documents are merged: every operand is
+turned into a sorted list of (start, end) spans per document, phrases by
+intersecting the shifted position lists and NEAR by sliding over the spans
+of both operands. Stopwords inside a phrase are not indexed, but they keep
+their place, so "war of the worlds" still needs two words between war and
+worlds.
+
+The words of a query are split, folded and stemmed by the tokenizer of the
+index (see tokenizer.py), so they are the same terms the documents were
+indexed with.
+'''
+
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+from postingsCodec import decodePositions
+from tokenizer import DEFAULT_CONTEXT_SIZE, DEFAULT_TOKENIZER, contextWindow
+from scoring import TfIdfScorer, topK
+
+OPERATORS = ('AND', 'OR', 'NOT')
+
+# NEAR/k proximity operator (k: largest distance between the positions of the operands, 1 = adjacent)
+NEAR_PATTERN = re.compile(r'NEAR/(\d+)')
+
+# parentheses, quotes, NEAR/k, or runs of word characters (split into words by the tokenizer)
+TOKEN_PATTERN = re.compile(r'\(|\)|"|NEAR/\d+|\w+')
+
+class QuerySyntaxError(ValueError):
+    """
+        raised when a query cannot be parsed
+    """
+
+def isOperator(token):
+    """
+        true for query tokens that are not words (operators, parentheses and quotes)
+    """
+    return token in OPERATORS or token in ('(', ')', '"') or NEAR_PATTERN.fullmatch(token) is not None
+
+def tokenizeQuery(query, tokenizer = None):
+    """
+        splits a query into parentheses, quotes, operators and lowercase words
+        (split like the documents by the tokenizer, default: no stemming or folding)
+    """
+    tokenizer = tokenizer or DEFAULT_TOKENIZER
+    tokens = []
+    for token in TOKEN_PATTERN.findall(query):
+        if isOperator(token):
+            tokens.append(token)
+        else:
+            tokens.extend(tokenizer.words(token))
+    return tokens
+
+def _groupPhrases(tokens, stop_words, tokenizer):
+    """
+        replaces every quoted part of the tokens with a single ('phrase', [(term, offset)])
+        item, drops the stopwords and turns the other words into index terms. inside a
+        phrase the stopwords are dropped too, but the offsets of the other words still count them.
+        a stopword (or a phrase of stopwords) next to NEAR raises a QuerySyntaxError.
+    """
+    grouped = []
+    phrase = None
+    # the previous operand if it was dropped as a stopword (NEAR cannot be used with it)
+    dropped = None
+
+    def isNear(token):
+        return isinstance(token, str) and NEAR_PATTERN.fullmatch(token) is not None
+
+    def drop(operand):
+        if grouped and isNear(grouped[-1]):
+            raise QuerySyntaxError(f"{grouped[-1]} cannot be used with {operand}: stopwords are not indexed")
+        return operand
+
+    for token in tokens:
+        if token == '"':
+            if phrase is None:
+                phrase = []
+                continue
+            words = [(tokenizer.term(word), offset) for offset, word in enumerate(phrase) if word not in stop_words]
+            if words:
+                # offsets are relative to the first indexed word
+                first = words[0][1]
+                grouped.append(('phrase', [(word, offset - first) for word, offset in words]))
+                dropped = None
+            else:
+                dropped = drop(f'"{" ".join(phrase)}"')
+            phrase = None
+        elif phrase is not None:
+            # operators inside quotes are just words (parentheses are ignored)
+            if token in OPERATORS:
+                phrase.extend(tokenizer.words(token))
+            elif not isOperator(token):
+                phrase.append(token)
+        elif isOperator(token):
+            if isNear(token) and dropped is not None:
+                raise QuerySyntaxError(f"{token} cannot be used with {dropped}: stopwords are not indexed")
+            grouped.append(token)
+            dropped = None
+        elif token not in stop_words:
+            grouped.append(tokenizer.term(token))
+            dropped = None
+        else:
+            dropped = drop(f"'{token}'")
+    if phrase is not None:
+        raise QuerySyntaxError("missing closing quote")
+    return grouped
+
+def parseQuery(query, stop_words = (), tokenizer = None):
+    """
+        parses a boolean query into a tree of tuples:
+            ('term', word), ('and', [children]), ('or', [children]), ('not', child),
+            ('phrase', [(word, offset), ...]), ('near', k, [left, right])
+
+        input:
+            - query: the query string
+            - stop_words: words to drop from the query (they are not in the index)
+            - tokenizer: Tokenizer of the index (default: no stemming or folding)
+
+        output: the query tree (its words are index terms)
+    """
+    tokenizer = tokenizer or DEFAULT_TOKENIZER
+    tokens = _groupPhrases(tokenizeQuery(query, tokenizer), stop_words, tokenizer)
+    if not tokens:
+        raise QuerySyntaxError("the query does not contain any searchable words")
+
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        return token
+
+    def parseOr():
+        children = [parseAnd()]
+        while peek() == 'OR':
+            take()
+            children.append(parseAnd())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parseAnd():
+        children = [parseNear()]
+        while peek() is not None and peek() not in ('OR', ')'):
+            # AND is optional between two operands
+            if peek() == 'AND':
+                take()
+            children.append(parseNear())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parseNear():
+        node = parseNot()
+        while isinstance(peek(), str) and NEAR_PATTERN.fullmatch(peek()):
+            distance = int(NEAR_PATTERN.fullmatch(take()).group(1))
+            if distance < 1:
+                raise QuerySyntaxError(f"NEAR/{distance} cannot match anything, NEAR/1 means next to each other")
+            right = parseNot()
+            for operand in (node, right):
+                if operand[0] not in ('term', 'phrase', 'near'):
+                    raise QuerySyntaxError("NEAR only works between words and phrases")
+            node = ('near', distance, [node, right])
+        return node
+
+    def parseNot():
+        if peek() == 'NOT':
+            take()
+            return ('not', parseNot())
+        return parseAtom()
+
+    def parseAtom():
+        token = peek()
+        if token is None:
+            raise QuerySyntaxError("the query ends with an operator")
+        if token == '(':
+            take()
+            node = parseOr()
+            if peek() != ')':
+                raise QuerySyntaxError("missing closing parenthesis")
+            take()
+            return node
+        if isinstance(token, tuple):
+            take()
+            words = token[1]
+            # a phrase of a single word is just that word
+            return ('term', words[0][0]) if len(words) == 1 else token
+        if isOperator(token):
+            raise QuerySyntaxError(f"unexpected '{token}'")
+        return ('term', take())
+
+    tree = parseOr()
+    if position != len(tokens):
+        raise QuerySyntaxError(f"unexpected '{tokens[position]}'")
+    return tree
+
+def queryTerms(tree):
+    """
+        returns the terms of the query that are not negated (in query order, no duplicates)
+    """
+    terms = []
+
+    def walk(node):
+        kind = node[0]
+        if kind == 'term':
+            if node[1] not in terms:
+                terms.append(node[1])
+        elif kind == 'phrase':
+            for word, _ in node[1]:
+                if word not in terms:
+                    terms.append(word)
+        elif kind in ('and', 'or'):
+            for child in node[1]:
+                walk(child)
+        elif kind == 'near':
+            for child in node[2]:
+                walk(child)
+
+    walk(tree)
+    return terms
+
+def _gallopTo(values, target, low):
+    """
+        returns the first index >= low with values[index] >= target,
+        probing 1, 2, 4, ... positions ahead before bisecting
+    """
+    n = len(values)
+    bound = 1
+    while low + bound < n and values[low + bound] < target:
+        bound *= 2
+    return bisect_left(values, target, low + bound // 2, min(low + bound + 1, n))
+
+def intersectSorted(a, b):
+    """
+        intersects two ascending doc id lists, galloping through the longer one
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    result = []
+    position = 0
+    for doc_id in a:
+        position = _gallopTo(b, doc_id, position)
+        if position >= len(b):
+            break
+        if b[position] == doc_id:
+            result.append(doc_id)
+    return result
+
+def matchReader(doc_ids, reader):
+    """
+        walks ascending doc ids against a PostingsReader using skipTo and
+        yields (doc id, count) for every doc id that is in the postings list
+    """
+    current = None
+    for doc_id in doc_ids:
+        if current is None or current[0] < doc_id:
+            current = reader.skipTo(doc_id)
+            if current is None:
+                return
+        if current[0] == doc_id:
+            yield current
+
+def evaluate(index, tree):
+    """
+        evaluates a query tree against the index.
+
+        input:
+            - index: InvertedIndex or MappedIndex
+            - tree: query tree from parseQuery
+
+        output: ascending list of matching doc ids
+    """
+    kind = tree[0]
+
+    if kind == 'term':
+        postings = index.postings(tree[1])
+        return postings.doc_ids.tolist() if postings is not None else []
+
+    if kind == 'or':
+        matches = set()
+        for child in tree[1]:
+            matches.update(evaluate(index, child))
+        return sorted(matches)
+
+    if kind == 'not':
+        return _exclude(index, list(range(index.num_docs)), tree[1])
+
+    if kind in ('phrase', 'near'):
+        return sorted(matchSpans(index, tree))
+
+    # and: positive operands rarest first, then the negated ones are removed
+    positives = [child for child in tree[1] if child[0] != 'not']
+    negatives = [child[1] for child in tree[1] if child[0] == 'not']
+
+    terms = sorted((child for child in positives if child[0] == 'term'), key = lambda child: index.documentFrequency(child[1]))
+    # sub-expressions are evaluated up front and ordered by their size
+    subresults = sorted((evaluate(index, child) for child in positives if child[0] != 'term'), key = len)
+
+    if terms and (not subresults or index.documentFrequency(terms[0][1]) <= len(subresults[0])):
+        result = evaluate(index, terms[0])
+        terms = terms[1:]
+    elif subresults:
+        result = subresults[0]
+        subresults = subresults[1:]
+    else:
+        result = list(range(index.num_docs))
+
+    for child in terms:
+        if not result:
+            return []
+        reader = index.postingsReader(child[1])
+        if reader is None:
+            return []
+        result = [doc_id for doc_id, _ in matchReader(result, reader)]
+
+    for subresult in subresults:
+        if not result:
+            return []
+        result = intersectSorted(result, subresult)
+
+    for child in negatives:
+        if not result:
+            return []
+        result = _exclude(index, result, child)
+
+    return result
+
+def _exclude(index, doc_ids, node):
+    """
+        removes the documents matching node from ascending doc ids
+    """
+    if node[0] == 'term':
+        reader = index.postingsReader(node[1])
+        if reader is None:
+            return doc_ids
+        excluded = {doc_id for doc_id, _ in matchReader(doc_ids, reader)}
+    else:
+        excluded = set(evaluate(index, node))
+    return [doc_id for doc_id in doc_ids if doc_id not in excluded]
+
+def _termPositions(index, word, doc_ids = None):
+    """
+        returns {doc id: token positions} of a word for the ascending doc ids that
+        contain it (every document containing it when doc_ids is None)
+    """
+    reader = index.postingsReader(word)
+    if reader is None:
+        return {}
+    data = index.encodedPositions(word)
+
+    result = {}
+    if doc_ids is None:
+        posting = reader.next()
+        while posting is not None:
+            result[posting[0]] = decodePositions(data, reader.position())
+            posting = reader.next()
+    else:
+        for doc_id, _ in matchReader(doc_ids, reader):
+            result[doc_id] = decodePositions(data, reader.position())
+    return result
+
+def _phraseSpans(index, words, doc_ids = None):
+    """
+        spans of a phrase: the positions of every word, shifted back by its offset
+        in the phrase, are intersected (rarest word first, so later words are only
+        looked up in the documents that are still left)
+    """
+    starts = None
+    for word, offset in sorted(words, key = lambda item: index.documentFrequency(item[0])):
+        positions = _termPositions(index, word, doc_ids)
+        if starts is None:
+            starts = {doc_id: [position - offset for position in doc_positions] for doc_id, doc_positions in positions.items()}
+        else:
+            merged = {}
+            for doc_id, doc_starts in starts.items():
+                if doc_id in positions:
+                    common = intersectSorted(doc_starts, [position - offset for position in positions[doc_id]])
+                    if common:
+                        merged[doc_id] = common
+            starts = merged
+        if not starts:
+            return {}
+        doc_ids = sorted(starts)
+
+    length = max(offset for _, offset in words)
+    return {doc_id: [(start, start + length) for start in doc_starts] for doc_id, doc_starts in starts.items()}
+
+def _nearSpans(left, right, distance):
+    """
+        merges two sorted span lists of one document: every pair of spans that do not
+        overlap and are at most distance positions apart (1: adjacent) becomes one span covering both
+    """
+    right_starts = [start for start, _ in right]
+    longest = max(end - start for start, end in right)
+    spans = set()
+    for start, end in left:
+        # only the right spans starting in this window can be close enough
+        low = bisect_left(right_starts, start - distance - longest)
+        for right_start, right_end in right[low:]:
+            if right_start > end + distance:
+                break
+            if right_start > end:
+                gap = right_start - end
+            elif right_end < start:
+                gap = start - right_end
+            else:
+                # overlapping spans (e.g. the same occurrence twice)
+                continue
+            if gap <= distance:
+                spans.add((min(start, right_start), max(end, right_end)))
+    return sorted(spans)
+
+def matchSpans(index, node, doc_ids = None):
+    """
+        finds where a term, phrase or NEAR node matches inside the documents.
+
+        input:
+            - index: InvertedIndex or MappedIndex
+            - node: ('term', ...), ('phrase', ...) or ('near', ...) query node
+            - doc_ids: ascending doc ids to look in (None: every document)
+
+        output: dictionary doc id -> sorted (start, end) token spans of the matches
+    """
+    kind = node[0]
+    if kind == 'term':
+        return {doc_id: [(position, position) for position in positions]
+                for doc_id, positions in _termPositions(index, node[1], doc_ids).items()}
+    if kind == 'phrase':
+        return _phraseSpans(index, node[1], doc_ids)
+
+    # near: the right operand is only looked up in the documents of the left one
+    distance, (left, right) = node[1], node[2]
+    left_spans = matchSpans(index, left, doc_ids)
+    if not left_spans:
+        return {}
+    right_spans = matchSpans(index, right, sorted(left_spans))
+    result = {}
+    for doc_id, spans in right_spans.items():
+        merged = _nearSpans(left_spans[doc_id], spans, distance)
+        if merged:
+            result[doc_id] = merged
+    return result
+
+def _positionalNodes(tree):
+    """
+        returns the phrase and NEAR nodes of the query that are not negated
+    """
+    kind = tree[0]
+    if kind in ('phrase', 'near'):
+        return [tree]
+    if kind in ('and', 'or'):
+        return [node for child in tree[1] for node in _positionalNodes(child)]
+    return []
+
+def _isUnionOfTerms(tree):
+    """
+        true for a single term or an OR of plain terms
+    """
+    if tree[0] == 'term':
+        return True
+    return tree[0] == 'or' and all(child[0] == 'term' for child in tree[1])
+
+def searchTerm(index, term, top_n = 10, context_size = DEFAULT_CONTEXT_SIZE, scorer = None):
+    """
+        ranks the documents containing a single term (tf-idf unless another scorer is given)
+
+        input:
+            - index: InvertedIndex, MappedIndex or SegmentedIndex
+            - term: lowercase word to search for
+            - top_n: number of top results to return
+            - context_size: number of words before and after the word shown as its context
+            - scorer: ranking function from scoring.py (default: tf-idf)
+
+        output: list of n entries with scores, empty when the term is not indexed
+    """
+    postings = index.postings(term)
+    if postings is None or not len(postings):
+        return []
+
+    # score every posting at once from the values precomputed when the index was built
+    # (normalized term frequencies and idf for tf-idf, length norms for bm25)
+    if scorer is None:
+        scorer = TfIdfScorer()
+    posting_scores = scorer.prepare(index, term).scoreAll(postings)
+
+    # select the top n postings with argpartition instead of sorting every posting
+    # (earlier postings win ties like in a stable sort)
+    deleted = index.deletedDocs()
+    if deleted is not None:
+        # documents deleted since their segment was written are skipped (see updateIndex.py)
+        live = np.flatnonzero(~deleted[postings.doc_ids])
+        top_positions = live[topK(posting_scores[live], top_n)]
+    else:
+        top_positions = topK(posting_scores, top_n)
+
+    # only build result entries for the postings that are returned
+    results = []
+    for i in top_positions.tolist():
+        doc_id = int(postings.doc_ids[i])
+        filename, title = index.document(doc_id)
+        results.append({
+            'filename': filename,
+            'title': title,
+            'count': int(postings.counts[i]),
+            'contexts': index.contexts(term, i, doc_id, context_size),
+            'score': float(posting_scores[i])
+        })
+    return results
+
+def searchQuery(index, tree, top_n = 10, context_size = DEFAULT_CONTEXT_SIZE, scorer = None):
+    """
+        evaluates a query tree and ranks the matches by the sum of the scores
+        (normalized tf-idf by default) of the query terms they contain. the scores
+        are accumulated into a dense per-document array and only the top n
+        documents are selected (argpartition).
+
+        input:
+            - index: InvertedIndex, MappedIndex or SegmentedIndex
+            - tree: query tree from parseQuery
+            - top_n: number of top results to return
+            - context_size: number of words before and after a match shown as its context
+            - scorer: ranking function from scoring.py (default: tf-idf)
+
+        output: list of n entries with scores (same shape as searchTerm results)
+    """
+    if scorer is None:
+        scorer = TfIdfScorer()
+    terms = [term for term in queryTerms(tree) if index.documentFrequency(term) > 0]
+
+    # per-term scorers (precomputed idf and weights of the query terms)
+    scorers = {term: scorer.prepare(index, term) for term in terms}
+
+    # the postings of every query term are decoded once into numpy arrays
+    postings_by_term = {term: index.postings(term) for term in terms}
+
+    if _isUnionOfTerms(tree):
+        # every document containing one of the terms matches
+        if not terms:
+            return []
+        hits = np.zeros(index.num_docs, dtype = bool)
+        for postings in postings_by_term.values():
+            hits[postings.doc_ids] = True
+        matches = np.flatnonzero(hits)
+    else:
+        matches = np.asarray(evaluate(index, tree), dtype = np.int64)
+
+    # documents deleted since their segment was written are skipped (see updateIndex.py)
+    deleted = index.deletedDocs()
+    if deleted is not None:
+        matches = matches[~deleted[matches]]
+    if not len(matches):
+        return []
+
+    # dense per-document score array: every term adds the scores of all its
+    # postings at once (a term has at most one posting per document)
+    scores = np.zeros(index.num_docs)
+    for term, postings in postings_by_term.items():
+        scores[postings.doc_ids] += scorers[term].scoreAll(postings)
+
+    # top n of the matches (matches are ascending, so smaller doc ids win ties)
+    match_scores = scores[matches]
+    top = topK(match_scores, top_n)
+    ranked = list(zip(match_scores[top].tolist(), matches[top].tolist()))
+
+    # counts and contexts for the returned documents only
+    top_docs = sorted(doc_id for _, doc_id in ranked)
+    top_array = np.asarray(top_docs, dtype = np.int64)
+    counts = dict.fromkeys(top_docs, 0)
+    first_match = {}
+    for term, postings in postings_by_term.items():
+        # position of every returned document in the postings of the term
+        found = np.searchsorted(postings.doc_ids, top_array)
+        for doc_id, i in zip(top_docs, found.tolist()):
+            if i < len(postings) and postings.doc_ids[i] == doc_id:
+                counts[doc_id] += int(postings.counts[i])
+                # positions are aligned with the postings of the term
+                first_match.setdefault(doc_id, (term, i))
+
+    # phrase and NEAR matches are shown around the whole match instead of a single word
+    match_spans = {}
+    for node in _positionalNodes(tree):
+        for doc_id, spans in matchSpans(index, node, top_docs).items():
+            match_spans.setdefault(doc_id, spans)
+
+    results = []
+    for score, doc_id in ranked:
+        filename, title = index.document(doc_id)
+        contexts = []
+        if doc_id in match_spans:
+            tokens = index.documentTokens(doc_id)
+            contexts = [contextWindow(tokens, start, context_size, end) for start, end in match_spans[doc_id]] if tokens else []
+        elif doc_id in first_match:
+            term, i = first_match[doc_id]
+            contexts = index.contexts(term, i, doc_id, context_size)
+        results.append({
+            'filename': filename,
+            'title': title,
+            'count': counts[doc_id],
+            'contexts': contexts,
+            'score': score
+        })
+    return results
@@ -1,5 +1,4 @@
-import pickle
-import math
+import argparse
 from rich import print  
 from rich.console import Console
 from rich.panel import Panel
@@ -9,150 +8,51 @@ from rich.table import Table
 from rich.text import Text
 from rich import box
 import pyfiglet
-import time
 
-# run only first time
-import nltk
+from tokenizer import DEFAULT_CONTEXT_SIZE
+from scoring import SCORERS, TfIdfScorer, DEFAULT_K1, DEFAULT_B
+from queryEngine import tokenizeQuery, isOperator
+from searchClient import SearchClient, SearchServerError, DEFAULT_SERVER_URL
 
-# ensure NLTK stopwords are downloaded
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
-
-from nltk.corpus import stopwords
-
-def load_inverted_index(pickle_file):
-    """
-        loads the inverted index from a pickle file.
-        
-        input:
-            - pickle_file: path to the pickle file containing the inverted index
-
-        output:
-            - the inverted index dictionary
-    """
-    try:
-        # open the file provided
-        with open(pickle_file, 'rb') as f:
-            inverted_index = pickle.load(f)
-        return inverted_index
-    except FileNotFoundError:
-        # file does not exist
-        print(f"[bold red]Error: The file '{pickle_file}' does not exist.[/bold red]")
-    except Exception as e:
-        # error while loading
-        print(f"[bold red]An error occurred while loading the index: {e}[/bold red]")
-    return None
-
-def load_word_count(word_count_file):
-    """
-        loads the word counts from a file into a dictionary.
-        
-        input:
-            - word_count_file: path to the word count file
-
-        output:
-            - dictionary mapping filenames to their total word counts
+def getTotalDocs(client):
     """
-    # initialize dictionary
-    word_count = {}
-    try:
-        # open the file
-        with open(word_count_file, 'r') as f:
-            # for each line 
-            for line in f:
-                # strip of whitespace (leading and trailing)
-                line = line.strip()
-                # if line is empty
-                if not line:
-                    # continue partsing thorugh file
-                    continue
-                # is there is no : in the line (this is th format of the word_count file)
-                if ':' not in line:
-                    print(f"[bold yellow]Warning: Skipping malformed line: '{line}'[/bold yellow]")
-                    continue
-                # split the line with : as delimiter
-                filename, count = line.split(':', 1)
-                # strip the filename of trailing and leading whitespaces again
-                filename = filename.strip()
-                try:
-                    # get the count after stiping of trailing and leading whitespaces
-                    count = int(count.strip())
-                    # set the wordcount of the filename to the count
-                    word_count[filename] = count
-                except ValueError:
-                    print(f"[bold yellow]Warning: Invalid count for '{filename}': '{count}'[/bold yellow]")
-    except FileNotFoundError:
-        print(f"[bold red]Error: The file '{word_count_file}' does not exist.[/bold red]")
-    except Exception as e:
-        print(f"[bold red]An error occurred while loading word counts: {e}[/bold red]")
-    return word_count
-
-def getTotalDocs(word_count_dict):
-    """
-        computes the total number of unique documents from the word count dictionary.
+        returns the total number of documents the idf of the served index was computed with.
     
         input:
-            - word_count_dict: dictionary mapping filenames to total word counts
+            - client: SearchClient of the search server
 
         output: total number of unique documents
     """
-    return len(word_count_dict)
+    return client.stats()['total_docs']
 
-def search_word(inverted_index, word, N, word_count_dict, n=10):
+def run_query(client, query, n = 10, context_size = DEFAULT_CONTEXT_SIZE, ranking = TfIdfScorer.name,
+              k1 = DEFAULT_K1, b = DEFAULT_B):
     """
-        searches for a word in the inverted index and returns the top n entries sorted by tf-idf
-        
+        runs a query that can contain several words and AND / OR / NOT operators
+        (see queryEngine.py) on the search server and returns the top n entries sorted by score
+
         input:
-            - inverted_index: the inverted index dictionary
-            - word: the word to search for
-            - N: total number of documents
-            - word_count_dict: dictionary mapping filenames to total word counts
-            - top_n: number of top results to return
+            - client: SearchClient of the search server
+            - query: the query string
+            - n: number of top results to return
+            - context_size: number of words before and after a match shown as its context
+            - ranking: ranking function (see scoring.py), k1 / b: BM25 parameters
 
-        output: list of n entries with tf-idf scores
+        output: list of n entries with scores
     """
-    # get the results from the inverted index
-    results = inverted_index.get(word.lower(), [])
-    # if there are no results, print as such
-    if not results:
-        print(f"[bold red]The word '{word}' was not found in the index.[/bold red]")
-        return []
-
-    # get the length of the results
-    df = len(results)
-    # if there are none, print as such
-    if df == 0:
-        print(f"[bold red]The word '{word}' was not found in any document.[/bold red]")
+    try:
+        response = client.search(query, n, context_size, ranking, k1, b)
+    except SearchServerError as e:
+        print(f"[bold red]{e}[/bold red]")
         return []
-
-    # inverse document frequency
-    idf = math.log(N / df)
-
-    # calculate normalized tf-idf for each entry
-    for entry in results:
-        # get the count of the words in the file
-        tf_count = entry.get('count', 0)
-        # get the corresponding filename
-        filename = entry.get('filename')
-        # get total count of words in the file
-        total_words = word_count_dict.get(filename, 1)  
-        # if total words <= 0 (there are none)
-        if total_words <= 0:
-            total_words = 1  # avoid division by zero
-        # term frequency
-        tf = tf_count / total_words
-        # set the tfidf value for the current entry
-        entry['tfidf'] = tf * idf
-
-    # sort results based on TF-IDF score in descending order
-    sorted_results = sorted(results, key=lambda x: x['tfidf'], reverse=True)
-    return sorted_results[:n]
+    # the server explains empty results (invalid query, unknown word, no match)
+    if response['message']:
+        print(f"[bold red]{response['message']}[/bold red]")
+    return response['results']
 
 def highlight_word(text, word, max_length = 100):
     """
-        highlights all occurrences of the search word in the given text and truncates it if necessary
+        highlights all occurrences of the search word(s) in the given text and truncates it if necessary
         
         input:
             - text: the context text
@@ -167,29 +67,34 @@ def highlight_word(text, word, max_length = 100):
 
     # initialize rich text object
     rich_text = Text(text)
-    # set all words to lower (already done but just to make sure)
-    word_lower = word.lower()
+    text_lower = text.lower()
 
-    start = 0
+    # a query can contain several words (and operators or quotes, which are not highlighted)
+    for word_lower in tokenizeQuery(word):
+        if isOperator(word_lower):
+            continue
 
-    # loop over the text and higlitht the word what is needed
-    while True:
-        index = text.lower().find(word_lower, start)
-        if index == -1:
-            break
-        # highlight the word
-        rich_text.stylize("bold red", index, index + len(word))
-        start = index + len(word)
+        start = 0
+
+        # loop over the text and higlitht the word what is needed
+        while True:
+            index = text_lower.find(word_lower, start)
+            if index == -1:
+                break
+            # highlight the word
+            rich_text.stylize("bold red", index, index + len(word_lower))
+            start = index + len(word_lower)
 
     return rich_text
 
-def display_results(word, results):
+def display_results(word, results, label = TfIdfScorer.label):
     """
-        displays the search results in a readable format, including the title and TF-IDF score
+        displays the search results in a readable format, including the title and the score
         
         input:
             - word: the searched word
             - results: list of result entries
+            - label: name of the ranking function the scores come from
     """
     # if results are empty
     if not results:
@@ -206,14 +111,14 @@ def display_results(word, results):
     table.add_column("No.", no_wrap = True, justify = 'right', style = "bold white")
     table.add_column("Filename")
     table.add_column("Article Title", style = "bold")
-    table.add_column("TF-IDF Score", justify = "center")
+    table.add_column(f"{label} Score", justify = "center")
     table.add_column("Context")
 
     # get the entries for the column values
     for idx, entry in enumerate(results, 1):
         filename = entry.get('filename', 'N/A')
         title = entry.get('title', 'No Title')
-        tfidf = f"{entry.get('tfidf', 0):.3f}"  # Increased precision
+        score = f"{entry.get('score', 0):.3f}"  # Increased precision
         contexts = entry.get('contexts', [])
         context_sample = contexts[0] if contexts else "No context available."
 
@@ -225,7 +130,7 @@ def display_results(word, results):
             str(idx),
             filename,
             title,
-            tfidf,
+            score,
             highlighted_context
         )
 
@@ -263,14 +168,14 @@ def display_banner(console):
     # print the centered panel to the console
     console.print(centered_panel)
 
-def interactive_search(inverted_index, N, word_count_dict):
+def interactive_search(client, context_size = DEFAULT_CONTEXT_SIZE, ranking = TfIdfScorer.name, k1 = DEFAULT_K1, b = DEFAULT_B):
     """
-        Loop for searching words in the inverted index.
+        Loop for searching words on the search server.
         
         input:
-            - inverted_index: the inverted index dictionary
-            - N: total number of documents
-            - word_count_dict: dictionary mapping filenames to total word counts
+            - client: SearchClient of the search server
+            - context_size: number of words before and after a match shown as its context
+            - ranking: ranking function (see scoring.py), k1 / b: BM25 parameters
     """
 
     # initialize the Rich console
@@ -289,73 +194,79 @@ def interactive_search(inverted_index, N, word_count_dict):
         if not word:
             print("[bold yellow]Please enter a valid word.[/bold yellow]")
             continue
-        # accept no stopword as they were removed in the making of the inverted index
-        if word.lower() in stopwords.words('english'):
-            print("[bold yellow]Stopwords are not searchable.[/bold yellow]")
-            continue
 
-        # search the word in the inverted index
-        results = search_word(inverted_index, word, N, word_count_dict)
+        # search the word (or boolean query) on the server (stopwords are rejected there,
+        # the index stores the stopword set it was built with)
+        results = run_query(client, word, context_size = context_size, ranking = ranking, k1 = k1, b = b)
         # display results
         if results:
-            display_results(word, results)
+            display_results(word, results, SCORERS[ranking].label)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Search the inverted index.")
+    parser.add_argument(
+        '--context_size',
+        type = int,
+        default = DEFAULT_CONTEXT_SIZE,
+        help = f'Number of words shown before and after a match as its context. Default is {DEFAULT_CONTEXT_SIZE}.'
+    )
+    parser.add_argument(
+        '--ranking',
+        type = str,
+        choices = sorted(SCORERS),
+        default = TfIdfScorer.name,
+        help = f'Ranking function. Default is {TfIdfScorer.name}.'
+    )
+    parser.add_argument(
+        '--k1',
+        type = float,
+        default = DEFAULT_K1,
+        help = f'BM25 term frequency saturation. Default is {DEFAULT_K1}.'
+    )
+    parser.add_argument(
+        '--b',
+        type = float,
+        default = DEFAULT_B,
+        help = f'BM25 length normalization. Default is {DEFAULT_B}.'
+    )
+    parser.add_argument(
+        '--server',
+        type = str,
+        default = DEFAULT_SERVER_URL,
+        help = f'URL of the search server (start it with searchServer.py). Default is {DEFAULT_SERVER_URL}.'
+    )
+    return parser.parse_args()
 
 def main():
-    # inverted index file (made through inverted_index.py file)
-    index_file = 'inverted_index.pkl'  
-    # word count file (made through wordCount.py file)
-    word_count_file = 'wordCount.txt'  
+    args = parse_arguments()
+    # the index is loaded once by the search server (searchServer.py)
+    client = SearchClient(args.server)
     # initialize a Rich console
     console = Console()
 
-    # display loading animation for the inverted index
+    # display loading animation while connecting to the search server
     with Progress(
         SpinnerColumn(),
-        TextColumn("[bold green]Loading Inverted Index..."),
+        TextColumn("[bold green]Connecting to the search server..."),
         transient=True,
     ) as progress:
-        progress.add_task("loading")
-        inverted_index = load_inverted_index(index_file)
-        time.sleep(1)  # simulate loading time (for short files)
-
-    if inverted_index is None:
-        console.print("[bold red]Failed to load the inverted index. Exiting...[/bold red]")
-        return
+        progress.add_task("connecting")
+        try:
+            # total number of documents of the served index
+            N = getTotalDocs(client)
+        except SearchServerError as e:
+            console.print(f"[bold red]{e}. Exiting...[/bold red]")
+            return
 
     # display success message
-    print("[bold green]Inverted index loaded successfully![/bold green]\n")
-
-    # display loading animation for the word counts
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[bold green]Loading Word Counts..."),
-        transient=True,
-    ) as progress:
-        progress.add_task("loading_word_count")
-        word_count_dict = load_word_count(word_count_file)
-        time.sleep(1)  # simulate loading time (for short files)
-
-    # if the dict is empty, exit
-    if not word_count_dict:
-        console.print("[bold red]Failed to load word counts or word counts are empty. Exiting...[/bold red]")
-        return
-
-    # compute total number of documents
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[bold green]Computing total number of documents..."),
-        transient=True,
-    ) as progress:
-        progress.add_task("computing")
-        N = getTotalDocs(word_count_dict)
-        time.sleep(1)  # Simulate computation time
+    print("[bold green]Connected to the search server![/bold green]\n")
 
     print(f"[bold blue]Total Documents: {N}[/bold blue]\n")
     # display the MapIndex banner
     display_banner(console)
 
     # start the interactive search
-    interactive_search(inverted_index, N, word_count_dict)
+    interactive_search(client, args.context_size, args.ranking, args.k1, args.b)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+'''
+Description: ranking functions for the search.
+
+A scorer turns the postings of a query term into score contributions. For
+every query term it prepares a term scorer with:
+    - scoreAll(postings): contributions of every posting as a numpy array aligned
+      with the postings, computed with array operations over the decoded postings
+
+Available ranking functions:
+    - tfidf: count / document length * log(N / df), the original ranking
+    - bm25: idf * count * (k1 + 1) / (count + k1 * (1 - b + b * length / average length))
+
+Everything that only depends on the collection (the normalized term
+frequencies, the idf and the length / average length of every document) is
+precomputed when the index is built, so a scorer only combines stored values
+with its parameters.
+
+topK selects the best n scores of an array with argpartition instead of
+sorting all of them.
+'''
+
+import math
+
+import numpy as np
+
+# default BM25 parameters
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+class TfIdfScorer:
+    """
+        normalized tf-idf: count / document length * log(N / df)
+    """
+    name = 'tfidf'
+    label = 'TF-IDF'
+
+    def prepare(self, index, term):
+        """
+            returns the term scorer of a query term
+        """
+        return _TfIdfTerm(index.weights(term), index.idf(term))
+
+    def key(self):
+        """
+            identifies the ranking (with its parameters) in cache keys
+        """
+        return (self.name,)
+
+class _TfIdfTerm:
+    def __init__(self, weights, idf):
+        self.weights = weights
+        self.idf = idf
+
+    def scoreAll(self, postings):
+        # float64 like the python floats the scores used to be
+        return np.frombuffer(self.weights, dtype = np.float32).astype(np.float64) * self.idf
+
+class BM25Scorer:
+    """
+        Okapi BM25 with tunable k1 (term frequency saturation) and b (length normalization)
+    """
+    name = 'bm25'
+    label = 'BM25'
+
+    def __init__(self, k1 = DEFAULT_K1, b = DEFAULT_B):
+        self.k1 = k1
+        self.b = b
+
+    def prepare(self, index, term):
+        """
+            returns the term scorer of a query term
+        """
+        df = index.documentFrequency(term)
+        # probabilistic idf, the + 1 keeps it positive for very common words
+        idf = math.log(1 + (index.total_docs - df + 0.5) / (df + 0.5))
+        return _BM25Term(idf, self.k1, self.b, index.lengthNorms())
+
+    def key(self):
+        """
+            identifies the ranking (with its parameters) in cache keys
+        """
+        return (self.name, self.k1, self.b)
+
+class _BM25Term:
+    def __init__(self, idf, k1, b, length_norms):
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.length_norms = length_norms
+
+    def scoreAll(self, postings):
+        length_norms = np.frombuffer(self.length_norms, dtype = np.float32)[postings.doc_ids].astype(np.float64)
+        counts = postings.counts.astype(np.float64)
+        k = self.k1 * (1 - self.b + self.b * length_norms)
+        return self.idf * (self.k1 + 1) * counts / (counts + k)
+
+def topK(scores, n):
+    """
+        returns the positions of the n highest scores, best first. equal scores are
+        ordered by position, like a stable sort.
+
+        input:
+            - scores: numpy array of scores
+            - n: number of positions to return
+
+        output: numpy array of positions into scores
+    """
+    if n <= 0 or not len(scores):
+        return np.zeros(0, dtype = np.int64)
+    if n < len(scores):
+        # everything at least as good as the n-th best score (found in linear time),
+        # so ties at the cut are decided by position like everywhere else
+        nth = scores[np.argpartition(scores, len(scores) - n)[len(scores) - n]]
+        candidates = np.flatnonzero(scores >= nth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:n]]
+
+SCORERS = {
+    TfIdfScorer.name: TfIdfScorer,
+    BM25Scorer.name: BM25Scorer
+}
+
+def makeScorer(name = TfIdfScorer.name, k1 = DEFAULT_K1, b = DEFAULT_B):
+    """
+        returns the scorer of a ranking function.
+
+        input:
+            - name: 'tfidf' or 'bm25'
+            - k1, b: BM25 parameters (ignored by tfidf)
+
+        output: scorer
+    """
+    if name == BM25Scorer.name:
+        return BM25Scorer(k1, b)
+    if name not in SCORERS:
+        raise ValueError(f"unknown ranking function: {name} (choose from {', '.join(SCORERS)})")
+    return SCORERS[name]()
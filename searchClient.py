@@ -0,0 +1,75 @@
+'''
+Description: client of the search server (see searchServer.py) used by the
+search UIs. Requests are plain HTTP/JSON through urllib, so the UIs do not
+load the index themselves.
+'''
+
+import json
+from urllib.error import URLError, HTTPError
+from urllib.request import Request, urlopen
+
+from tokenizer import DEFAULT_CONTEXT_SIZE
+from scoring import TfIdfScorer, DEFAULT_K1, DEFAULT_B
+
+DEFAULT_SERVER_URL = 'http://127.0.0.1:8765'
+
+class SearchServerError(RuntimeError):
+    """
+        raised when the search server cannot be reached or rejects a request
+    """
+
+class SearchClient:
+    """
+        talks to a search server at url (e.g. 'http://127.0.0.1:8765')
+    """
+
+    def __init__(self, url = DEFAULT_SERVER_URL, timeout = 30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, payload = None):
+        """
+            sends a GET (or a POST with a JSON payload) and returns the decoded JSON response
+        """
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = Request(self.url + path, data = data, headers = {'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout = self.timeout) as response:
+                return json.load(response)
+        except HTTPError as e:
+            # the server explains rejected requests in the 'error' field
+            try:
+                message = json.load(e).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise SearchServerError(f"search server error ({e.code}): {message}")
+        except (URLError, OSError) as e:
+            raise SearchServerError(f"cannot reach the search server at {self.url}: {getattr(e, 'reason', e)}")
+
+    def search(self, query, top_n = 10, context_size = DEFAULT_CONTEXT_SIZE, ranking = TfIdfScorer.name,
+               k1 = DEFAULT_K1, b = DEFAULT_B):
+        """
+            runs one query on the server.
+
+            output: {'query', 'results', 'message'} (see searchServer.py)
+        """
+        return self._request('/search', {
+            'q': query, 'n': top_n, 'context_size': context_size, 'ranking': ranking, 'k1': k1, 'b': b
+        })
+
+    def searchBatch(self, queries, top_n = 10, context_size = DEFAULT_CONTEXT_SIZE, ranking = TfIdfScorer.name,
+                    k1 = DEFAULT_K1, b = DEFAULT_B):
+        """
+            runs several queries in one request (the server scores them concurrently).
+
+            output: list of responses in the order of the queries
+        """
+        return self._request('/search', {
+            'queries': list(queries), 'n': top_n, 'context_size': context_size, 'ranking': ranking, 'k1': k1, 'b': b
+        })['responses']
+
+    def stats(self):
+        """
+            returns the index information and cache counters of the server
+        """
+        return self._request('/stats')
@@ -0,0 +1,468 @@
+'''
+Description: long-running search server. Loads the inverted index once and
+answers queries over a small HTTP/JSON API, so the search UIs (and any other
+consumer) do not have to load the index into their own process.
+
+Endpoints:
+    - GET  /search?q=war+peace&n=10&context_size=3&ranking=bm25&k1=1.2&b=0.75
+      runs one query (only q is required)
+    - POST /search with a JSON body {"q": ..., "n": ...} (one query) or
+      {"queries": [{"q": ...}, ...], "n": ...} (a batch, options given next to
+      "queries" apply to every query that does not set its own)
+    - GET  /stats: index information and the query cache counters
+    - GET  /health: liveness check
+
+Every query gets a response {"query", "results", "message"}: the results have
+the same shape as searchTerm / searchQuery results and message explains an
+empty result (invalid query, unknown word, stopword, no match). A batch gets
+{"responses": [...]} in the order of its queries.
+
+The server runs on asyncio (standard library only). Queries run on a thread
+pool of --max_concurrency threads so the event loop keeps accepting
+connections while a query is scored, and a semaphore bounds how many queries
+are in flight at once. Results are cached in a QueryCache (see queryCache.py).
+
+The index on disk is checked every --reload_interval seconds (a stat of
+segments.json, meta.json or the pickle file, which builds and updates write
+last): when it was rebuilt or updated, it is reopened and the cache drops the
+results of the old build, so the server never has to be restarted.
+'''
+
+import os
+import json
+import time
+import pickle
+import asyncio
+import threading
+import argparse
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from indexStore import openIndex, META_FILE, SEGMENTS_FILE
+from tokenizer import DEFAULT_CONTEXT_SIZE
+from scoring import SCORERS, TfIdfScorer, makeScorer, DEFAULT_K1, DEFAULT_B
+from queryCache import QueryCache, queryKey, DEFAULT_CACHE_SIZE
+from queryEngine import parseQuery, searchQuery, searchTerm, QuerySyntaxError
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# queries scored at the same time
+DEFAULT_MAX_CONCURRENCY = 4
+# queries accepted in one batch request
+DEFAULT_MAX_BATCH = 100
+# largest request body accepted (bytes)
+MAX_BODY_SIZE = 1 << 20
+# largest number of results a query can ask for
+MAX_RESULTS = 1000
+# seconds between two checks whether the index was rebuilt or updated on disk
+DEFAULT_RELOAD_INTERVAL = 2.0
+
+class RequestError(ValueError):
+    """
+        raised for requests the server cannot answer (sent back as 400 with the message)
+    """
+
+def loadIndex(index_path):
+    """
+        loads the inverted index from a memory-mapped index directory or a pickle file.
+
+        input:
+            - index_path: path to the index directory (or pickle file)
+
+        output: the inverted index, or None if it could not be loaded
+    """
+    try:
+        # memory-mapped index directory: only the term dictionary header is read here
+        if os.path.isdir(index_path):
+            return openIndex(index_path)
+        with open(index_path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        print(f"error: file '{index_path}' does not exist.")
+    except Exception as e:
+        print(f"an error occurred while loading the index: {e}")
+    return None
+
+def indexVersion(index_path):
+    """
+        returns a cheap signature of the index on disk: path, modification time, size and inode of
+        the file a build or an update writes last (segments.json, meta.json or the pickle file)
+
+        output: the signature, or None if the file cannot be read
+    """
+    path = index_path
+    if os.path.isdir(index_path):
+        path = os.path.join(index_path, SEGMENTS_FILE)
+        if not os.path.exists(path):
+            path = os.path.join(index_path, META_FILE)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+class SearchService:
+    """
+        runs queries against a loaded index (no networking, also usable in-process).
+
+        - index: InvertedIndex or MappedIndex
+        - cache: QueryCache shared by every query
+        - index_path: where the index was loaded from, it is reopened when it changes
+          on disk (checked at most every reload_interval seconds). None: never reloaded
+    """
+
+    def __init__(self, index, cache_size = DEFAULT_CACHE_SIZE, index_path = None, reload_interval = DEFAULT_RELOAD_INTERVAL):
+        self.index = index
+        self.cache = QueryCache(cache_size)
+        self.index_path = index_path
+        self.reload_interval = reload_interval
+        self.version = indexVersion(index_path) if index_path is not None else None
+        self.next_check = time.monotonic() + reload_interval
+        self.reloads = 0
+        self.reload_lock = threading.Lock()
+
+    def currentIndex(self):
+        """
+            returns the index, reopened first if it was rebuilt or updated on disk since it was
+            loaded (the cache drops the results of the old build on its next lookup, see queryCache.py)
+        """
+        if self.index_path is None or time.monotonic() < self.next_check:
+            return self.index
+        # one thread checks, the others keep using the current index meanwhile
+        if not self.reload_lock.acquire(blocking = False):
+            return self.index
+        try:
+            self.next_check = time.monotonic() + self.reload_interval
+            version = indexVersion(self.index_path)
+            if version is not None and version != self.version:
+                index = loadIndex(self.index_path)
+                # an index that cannot be opened (e.g. half written) is tried again at the next check
+                if index is not None:
+                    # queries that are already running finish on the old index
+                    self.index = index
+                    self.version = version
+                    self.reloads += 1
+                    print(f"Inverted index reloaded ({index.num_docs} documents).")
+        finally:
+            self.reload_lock.release()
+        return self.index
+
+    def search(self, query, top_n = 10, context_size = DEFAULT_CONTEXT_SIZE, ranking = TfIdfScorer.name,
+               k1 = DEFAULT_K1, b = DEFAULT_B):
+        """
+            runs a query that can contain several words, AND / OR / NOT operators,
+            phrases and NEAR (see queryEngine.py)
+
+            input:
+                - query: the query string
+                - top_n: number of top results to return
+                - context_size: number of words before and after a match shown as its context
+                - ranking: name of the ranking function (see scoring.py)
+                - k1, b: BM25 parameters
+
+            output: {'query', 'results', 'message'} (message is None unless the results are empty)
+        """
+        index = self.currentIndex()
+        # stopwords were removed in the making of the inverted index
+        words = index.tokenizer.words(query)
+        if len(words) == 1 and words[0] in index.stop_words:
+            return _response(query, [], "Stopwords are not searchable.")
+
+        # parse the query with the tokenizer of the index (stopwords are dropped as they are not in the index)
+        try:
+            tree = parseQuery(query, index.stop_words, index.tokenizer)
+        except QuerySyntaxError as e:
+            return _response(query, [], f"Invalid query: {e}")
+
+        scorer = makeScorer(ranking, k1, b)
+        # the same (normalized) query on the same index build returns the cached results
+        key = queryKey(index, tree, top_n, context_size, scorer)
+        results = self.cache.get(key)
+        if results is not None:
+            return _response(query, results)
+
+        if tree[0] == 'term':
+            # a single word is a plain word search
+            results = searchTerm(index, tree[1], top_n, context_size, scorer)
+            message = f"The word '{tree[1]}' was not found in the index." if not results else None
+        else:
+            # evaluate the boolean query and rank the matching documents
+            results = searchQuery(index, tree, top_n, context_size, scorer)
+            message = f"No documents match the query '{query}'." if not results else None
+
+        # empty results are not cached, they are cheap to find again
+        if results:
+            self.cache.put(key, results)
+        return _response(query, results, message)
+
+    def stats(self):
+        """
+            returns information about the index and the cache counters
+        """
+        index = self.currentIndex()
+        return {
+            'build_id': getattr(index, 'build_id', None),
+            'reloads': self.reloads,
+            'num_docs': index.num_docs,
+            'deleted_docs': getattr(index, 'num_deleted', 0),
+            'total_docs': index.total_docs,
+            'num_terms': len(index),
+            'tokenizer': index.tokenizer.config(),
+            'rankings': sorted(SCORERS),
+            'cache': self.cache.stats()
+        }
+
+def _response(query, results, message = None):
+    return {'query': query, 'results': results, 'message': message}
+
+def searchOptions(values, defaults = None):
+    """
+        reads the options of a query (from the query string or a JSON object) and
+        checks them, options that are not given come from defaults.
+
+        output: dictionary of SearchService.search keyword arguments (without query)
+    """
+    defaults = defaults or {}
+
+    def option(name, convert, default):
+        value = values.get(name, defaults.get(name, default))
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            raise RequestError(f"invalid value for '{name}': {value!r}")
+
+    options = {
+        'top_n': option('n', int, 10),
+        'context_size': option('context_size', int, DEFAULT_CONTEXT_SIZE),
+        'ranking': option('ranking', str, TfIdfScorer.name),
+        'k1': option('k1', float, DEFAULT_K1),
+        'b': option('b', float, DEFAULT_B)
+    }
+    if not 0 < options['top_n'] <= MAX_RESULTS:
+        raise RequestError(f"'n' must be between 1 and {MAX_RESULTS}")
+    if options['context_size'] < 0:
+        raise RequestError("'context_size' cannot be negative")
+    if options['ranking'] not in SCORERS:
+        raise RequestError(f"unknown ranking function: {options['ranking']} (choose from {', '.join(sorted(SCORERS))})")
+    return options
+
+def _queryString(values):
+    query = values.get('q')
+    if not isinstance(query, str) or not query.strip():
+        raise RequestError("missing query 'q'")
+    return query
+
+class SearchServer:
+    """
+        asyncio HTTP/JSON front end of a SearchService with bounded concurrency
+    """
+
+    def __init__(self, service, max_concurrency = DEFAULT_MAX_CONCURRENCY, max_batch = DEFAULT_MAX_BATCH):
+        self.service = service
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers = max_concurrency)
+        # created in serve, a semaphore belongs to the event loop it is used in
+        self.max_concurrency = max_concurrency
+        self.slots = None
+
+    async def runQuery(self, query, options):
+        """
+            runs one query on the thread pool, waiting for a free slot first
+        """
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, lambda: self.service.search(query, **options))
+
+    async def handleSearch(self, values):
+        """
+            answers a search request (one query or a batch)
+        """
+        if 'queries' not in values:
+            return await self.runQuery(_queryString(values), searchOptions(values))
+
+        queries = values['queries']
+        if not isinstance(queries, list):
+            raise RequestError("'queries' must be a list")
+        if len(queries) > self.max_batch:
+            raise RequestError(f"at most {self.max_batch} queries per batch")
+        # options next to 'queries' are the defaults of every query of the batch
+        defaults = {name: value for name, value in values.items() if name != 'queries'}
+        jobs = []
+        for item in queries:
+            # a batch can be a list of query strings or of query objects
+            item = {'q': item} if isinstance(item, str) else item
+            if not isinstance(item, dict):
+                raise RequestError("every query of a batch must be a string or an object")
+            jobs.append((_queryString(item), searchOptions(item, defaults)))
+        # the queries of a batch run concurrently (up to the concurrency limit)
+        responses = await asyncio.gather(*(self.runQuery(query, options) for query, options in jobs))
+        return {'responses': responses}
+
+    async def route(self, method, target, body):
+        """
+            returns (status, payload) of a request
+        """
+        url = urlsplit(target)
+        if url.path == '/health' and method == 'GET':
+            return HTTPStatus.OK, {'status': 'ok'}
+        if url.path == '/stats' and method == 'GET':
+            return HTTPStatus.OK, self.service.stats()
+        if url.path == '/search':
+            if method == 'GET':
+                # the last value of every query string parameter
+                values = {name: items[-1] for name, items in parse_qs(url.query).items()}
+            elif method == 'POST':
+                try:
+                    values = json.loads(body or b'{}')
+                except ValueError:
+                    raise RequestError("request body is not valid JSON")
+                if not isinstance(values, dict):
+                    raise RequestError("request body must be a JSON object")
+            else:
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"method {method} not allowed"}
+            return HTTPStatus.OK, await self.handleSearch(values)
+        return HTTPStatus.NOT_FOUND, {'error': f"unknown path: {url.path}"}
+
+    async def handleConnection(self, reader, writer):
+        """
+            serves the HTTP/1.1 requests of one connection (kept alive unless the client closes it)
+        """
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line.strip():
+                        break
+                    parts = request_line.decode('latin-1').split()
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                except ValueError:
+                    # a request line or header longer than the stream limit (64 KB): the rest of
+                    # the request cannot be found, so answer and close the connection
+                    await _writeResponse(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'request line or header too large'}, False)
+                    break
+
+                keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    if len(parts) != 3:
+                        raise RequestError("malformed request line")
+                    try:
+                        length = int(headers.get('content-length', 0))
+                    except ValueError:
+                        raise RequestError("invalid Content-Length")
+                    if length > MAX_BODY_SIZE:
+                        status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'request body too large'}
+                        keep_alive = False
+                    else:
+                        body = await reader.readexactly(length) if length > 0 else b''
+                        status, payload = await self.route(parts[0], parts[1], body)
+                except RequestError as e:
+                    status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+                except Exception as e:
+                    # keep serving other requests, report the failure to the client
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"internal error: {e}"}
+
+                await _writeResponse(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # the client went away
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host = DEFAULT_HOST, port = DEFAULT_PORT):
+        """
+            accepts connections until the task is cancelled
+        """
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        server = await asyncio.start_server(self.handleConnection, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Serving the inverted index on http://{address[0]}:{address[1]}")
+        async with server:
+            await server.serve_forever()
+
+async def _writeResponse(writer, status, payload, keep_alive):
+    """
+        writes an HTTP/1.1 response with a JSON payload
+    """
+    data = json.dumps(payload).encode('utf-8')
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+    )
+    await writer.drain()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Serve the inverted index over HTTP/JSON.")
+    parser.add_argument(
+        '-i', '--index',
+        type = str,
+        default = 'inverted_index',
+        help = 'Path to the index directory (or pickle file). Default is "inverted_index".'
+    )
+    parser.add_argument(
+        '--host',
+        type = str,
+        default = DEFAULT_HOST,
+        help = f'Address to listen on. Default is {DEFAULT_HOST}.'
+    )
+    parser.add_argument(
+        '--port',
+        type = int,
+        default = DEFAULT_PORT,
+        help = f'Port to listen on. Default is {DEFAULT_PORT}.'
+    )
+    parser.add_argument(
+        '--max_concurrency',
+        type = int,
+        default = DEFAULT_MAX_CONCURRENCY,
+        help = f'Number of queries scored at the same time. Default is {DEFAULT_MAX_CONCURRENCY}.'
+    )
+    parser.add_argument(
+        '--max_batch',
+        type = int,
+        default = DEFAULT_MAX_BATCH,
+        help = f'Number of queries accepted in one batch request. Default is {DEFAULT_MAX_BATCH}.'
+    )
+    parser.add_argument(
+        '--cache_size',
+        type = int,
+        default = DEFAULT_CACHE_SIZE,
+        help = f'Number of queries whose results are cached (0 disables the cache). Default is {DEFAULT_CACHE_SIZE}.'
+    )
+    parser.add_argument(
+        '--reload_interval',
+        type = float,
+        default = DEFAULT_RELOAD_INTERVAL,
+        help = f'Seconds between two checks whether the index was rebuilt or updated (0 never reloads it). Default is {DEFAULT_RELOAD_INTERVAL}.'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    print("Loading the inverted index...")
+    index = loadIndex(args.index)
+    if index is None:
+        return
+    print(f"Inverted index loaded successfully ({index.num_docs} documents).")
+
+    # the index is reopened when a rebuild or an update replaces it on disk
+    index_path = args.index if args.reload_interval > 0 else None
+    service = SearchService(index, args.cache_size, index_path, args.reload_interval)
+    server = SearchServer(service, max(args.max_concurrency, 1), args.max_batch)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(server.service.cache.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+'''
+Description: stopword lists shared by the mapper, the index builder and the search UIs.
+
+Stopwords come either from NLTK (any language it ships) or from a custom file
+with one word per line. Every list is loaded once per process and returned
+as a frozenset, so membership tests are O(1). The index stores the list it
+was built with, and the search UIs use that list instead of loading their own.
+'''
+
+import os
+from functools import lru_cache
+
+DEFAULT_LANGUAGE = 'english'
+
+@lru_cache(maxsize = None)
+def loadStopwords(language = DEFAULT_LANGUAGE, stopwords_file = None):
+    """
+        loads a stopword list (cached, so repeated calls are free).
+
+        input:
+            - language: NLTK stopword language, e.g. 'english' (ignored when stopwords_file is given)
+            - stopwords_file: optional path to a file with one stopword per line ('#' starts a comment)
+
+        output: frozenset of lowercase stopwords
+    """
+    if stopwords_file:
+        if not os.path.exists(stopwords_file):
+            print(f"Stopwords file not found: {stopwords_file}")
+            return frozenset()
+        words = set()
+        with open(stopwords_file, 'r', encoding = 'utf-8') as f:
+            for line in f:
+                word = line.split('#', 1)[0].strip().lower()
+                if word:
+                    words.add(word)
+        return frozenset(words)
+
+    import nltk
+
+    # ensure nltk stopwords are downloaded
+    try:
+        nltk.data.find('corpora/stopwords')
+    except LookupError:
+        nltk.download('stopwords')
+
+    from nltk.corpus import stopwords
+
+    return frozenset(word.lower() for word in stopwords.words(language))
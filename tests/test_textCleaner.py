@@ -0,0 +1,56 @@
+'''
+Description: golden-output test of the document cleaner (textCleaner.py).
+
+    - cleaner_golden.json holds a fixed set of documents covering every kind of
+      markup the cleaner removes, with their cleaned text as written by the
+      original chained re.sub cleaner (utils/benchmarkCleaner.referenceCleanText)
+    - random texts built from the same markup must be cleaned like the reference does
+
+How to run: python3 -m pytest tests (or python3 -m unittest discover tests)
+'''
+
+import os
+import sys
+import json
+import unittest
+
+# the cleaner lives in the project root, the reference cleaner in utils/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'utils'))
+
+from textCleaner import cleanText
+from benchmarkCleaner import referenceCleanText, fuzzTexts
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cleaner_golden.json')
+
+# number of random texts compared with the reference cleaner
+NUM_FUZZED = 20000
+
+class TextCleanerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(GOLDEN_FILE, 'r', encoding = 'utf-8') as f:
+            cls.golden = json.load(f)
+
+    def test_golden_documents(self):
+        for document in self.golden:
+            with self.subTest(document = document['name']):
+                self.assertEqual(cleanText(document['text']), document['cleaned'])
+
+    def test_reference_matches_golden(self):
+        # the reference cleaner the fuzzed texts are compared with still writes the golden outputs
+        for document in self.golden:
+            with self.subTest(document = document['name']):
+                self.assertEqual(referenceCleanText(document['text']), document['cleaned'])
+
+    def test_fuzzed_markup(self):
+        for i, text in enumerate(fuzzTexts(NUM_FUZZED)):
+            expected = referenceCleanText(text)
+            cleaned = cleanText(text)
+            if cleaned != expected:
+                self.fail(f"fuzzed text {i} {text!r}: cleaned to {cleaned!r} instead of {expected!r}")
+
+if __name__ == "__main__":
+    unittest.main()
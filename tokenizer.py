@@ -0,0 +1,215 @@
+'''
+Description: document parsing and tokenization shared by the MapReduce job,
+the in-process index builder, the word counter and the query parser, so
+every stage splits a text into the same words.
+
+A Tokenizer lowercases the text and takes the runs of word characters as its
+words (their positions are indexed and the document length is their number).
+It can optionally fold the text (case folding, compatibility forms and
+accents removed, so 'Café' and 'cafe' are the same word) and stem the words
+(the terms of the index are then the stems, e.g. 'running' -> 'run'). Its
+configuration is stored in the header of the index (meta.json, see
+indexStore.py), so queries are always tokenized like the index was built.
+
+Plain ASCII text takes a fast path: a translate table lowercases it and turns
+every character that is not a word character into a space, so str.split
+finds the same words as the regular expression, about three times faster.
+'''
+
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+
+# words: runs of word characters (precompiled once)
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+# ascii fast path: uppercase letters are lowercased, everything but letters, digits and '_' becomes a space
+ASCII_WORD_TABLE = str.maketrans({
+    chr(code): chr(code).lower() if chr(code).isalnum() or chr(code) == '_' else ' '
+    for code in range(128) if chr(code).lower() != chr(code) or not (chr(code).isalnum() or chr(code) == '_')
+})
+
+# version of the word splitting, stored with the tokenizer configuration (bumped when the words change)
+TOKENIZER_VERSION = 1
+
+# default number of words before and after a word shown as its context when searching
+DEFAULT_CONTEXT_SIZE = 3
+
+@lru_cache(maxsize = None)
+def _combiningMarks():
+    """
+        translate table removing every combining mark (built once, on the first fold)
+    """
+    return {code: None for code in range(sys.maxunicode + 1) if unicodedata.combining(chr(code))}
+
+def foldText(text):
+    """
+        folds text for matching: case folded, compatibility characters decomposed
+        (e.g. ligatures and full width letters) and accents removed
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    if text.isascii():
+        return text
+    return text.translate(_combiningMarks())
+
+@lru_cache(maxsize = None)
+def _loadStemmer(stemmer):
+    """
+        loads an NLTK Snowball stemmer once per process ('porter' is the original Porter stemmer)
+    """
+    from nltk.stem import SnowballStemmer
+
+    if stemmer not in SnowballStemmer.languages:
+        raise ValueError(f"unknown stemmer '{stemmer}' (choose from {', '.join(SnowballStemmer.languages)})")
+    return SnowballStemmer(stemmer)
+
+class Tokenizer:
+    """
+        splits texts into words the same way for every stage and for the queries.
+
+        - stemmer: None, or 'porter' or a Snowball language (e.g. 'english'): the terms of the
+          index are the stems of the words
+        - fold: case fold the text and remove accents and compatibility forms before splitting
+
+        the stopwords are matched against the words before they are stemmed.
+    """
+
+    def __init__(self, stemmer = None, fold = False):
+        self.stemmer = stemmer or None
+        self.fold = bool(fold)
+        self._stem = _loadStemmer(self.stemmer).stem if self.stemmer else None
+        # word -> stem, the vocabulary is small compared to the number of tokens
+        self._terms = {}
+
+    @classmethod
+    def fromConfig(cls, config):
+        """
+            returns the tokenizer of a configuration stored in an index (see config),
+            the default tokenizer for indexes written without one
+        """
+        if not config:
+            return DEFAULT_TOKENIZER
+        if config.get('version', TOKENIZER_VERSION) != TOKENIZER_VERSION:
+            raise ValueError(f"unsupported tokenizer version: {config.get('version')}")
+        return cls(config.get('stemmer'), config.get('fold', False))
+
+    def config(self):
+        """
+            returns the JSON serializable configuration (stored in the index header)
+        """
+        return {'version': TOKENIZER_VERSION, 'stemmer': self.stemmer, 'fold': self.fold}
+
+    def __eq__(self, other):
+        return isinstance(other, Tokenizer) and self.config() == other.config()
+
+    def __hash__(self):
+        return hash((self.stemmer, self.fold))
+
+    def __reduce__(self):
+        # pickled (e.g. for pool workers or in a .pkl index) as its configuration
+        return (Tokenizer, (self.stemmer, self.fold))
+
+    def __repr__(self):
+        return f"Tokenizer(stemmer = {self.stemmer!r}, fold = {self.fold})"
+
+    def words(self, text):
+        """
+            splits text into lowercase words (runs of word characters, punctuation removed)
+        """
+        if self.fold:
+            text = foldText(text)
+        elif not text.isascii():
+            text = text.lower()
+        if text.isascii():
+            # fast path: the table lowercases and turns every separator into a space
+            return text.translate(ASCII_WORD_TABLE).split()
+        return WORD_PATTERN.findall(text)
+
+    def term(self, word):
+        """
+            returns the index term of a word (its stem when stemming)
+        """
+        if self._stem is None:
+            return word
+        term = self._terms.get(word)
+        if term is None:
+            term = self._terms[word] = self._stem(word)
+        return term
+
+    def stopWords(self, stop_words):
+        """
+            returns the stopwords the way the words of a text are compared with them (folded when folding)
+        """
+        if not self.fold:
+            return frozenset(stop_words)
+        return frozenset(foldText(word) for word in stop_words)
+
+# no stemming and no folding, the words the index has always been built from
+DEFAULT_TOKENIZER = Tokenizer()
+
+def parseCombinedLine(line):
+    """
+        splits a line of the combined file into its fields.
+
+        input:
+            - line: 'filename\\ttitle\\tcontent' line
+
+        output: (filename, title, content) or None if the line does not have three fields
+    """
+    # split into at most 3 parts, this is how the files were combined
+    parts = line.strip().split('\t', 2)
+    if len(parts) != 3:
+        return None
+    # remove leading and trailing whitespaces
+    filename, title, content = parts
+    return filename.strip(), title.strip(), content.strip()
+
+def positionsByWord(words, stop_words = (), term = None):
+    """
+        groups the token positions of a document by word (stopwords left out).
+
+        input:
+            - words: the tokens of the document
+            - stop_words: words that are not indexed
+            - term: optional function mapping a word to its index term (e.g. Tokenizer.term),
+                    the stopwords are left out before it is applied
+
+        output: dictionary word (or term) -> ascending positions, in order of first appearance
+    """
+    positions_by_word = {}
+    for i, word in enumerate(words):
+        if word in stop_words:
+            continue
+        if term is not None:
+            word = term(word)
+        positions = positions_by_word.get(word)
+        if positions is None:
+            positions = positions_by_word[word] = []
+        positions.append(i)
+    return positions_by_word
+
+def tokenize(content, tokenizer = None):
+    """
+        tokenizes content into lowercase words (punctuation removed)
+    """
+    return (tokenizer or DEFAULT_TOKENIZER).words(content)
+
+def countWords(content, tokenizer = None):
+    """
+        total number of words of a document body: its number of tokens, so the document
+        lengths the term frequencies are normalized with count the same words
+    """
+    return len((tokenizer or DEFAULT_TOKENIZER).words(content))
+
+def contextWindow(words, i, context_size, last = None):
+    """
+        returns the context of words[i] (or of words[i..last] for a multi-word match):
+        up to context_size words before and after it
+    """
+    if last is None:
+        last = i
+    # define the window for context (+1 because slice is exclusive)
+    start = max(0, i - context_size)
+    end = min(len(words), last + context_size + 1)
+    return ' '.join(words[start:end])
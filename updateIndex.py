@@ -0,0 +1,517 @@
+'''
+Description: incremental updates of the inverted index. Instead of running
+the whole pipeline again, only the documents that were added, changed or
+deleted since the last update are processed:
+
+    - new or modified files are found by their modification time and size, and
+      confirmed by a content hash (a file that was only touched is not re-indexed)
+    - they are cleaned, tokenized and indexed into a new segment
+    - the old versions of changed files and the deleted files are marked in the
+      tombstone bitmap of the segment they are in
+    - segments are merged (dropping the tombstoned documents) once there are too
+      many of them or too many of their documents are deleted, by default in a
+      background process so the update itself returns right away
+
+An update costs about as much as indexing the changed documents (plus a stat
+of every file), not the whole collection. Every change is committed by
+atomically replacing segments.json, so a search server opening the index
+always sees a complete generation (see SegmentedIndex in indexStore.py).
+
+Layout of the index directory (besides the segments, see indexStore.py):
+    - sources_<generation>.json: modification time, size, content hash and
+      segment of every source document, referenced from segments.json
+    - .lock: held while the index is updated or merged, so an update and a
+      background merge never change the segments at the same time
+
+The first update of a directory that is not a segmented index yet indexes
+every document into the first segment (a regular index directory keeps the
+stopwords and the tokenizer it was built with). Stopwords or a tokenizer given
+for an existing index must be the ones it was built with, otherwise the
+update is refused.
+
+How to run: python3 updateIndex.py --input_dir documents10k --index_dir inverted_index
+        or: python3 updateIndex.py --index_dir inverted_index --merge_only --merge full
+            (merges every segment into one, e.g. after a large update)
+'''
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # no file locks on windows: updates and merges must not run at the same time there
+    fcntl = None
+
+from indexStore import MappedIndex, writeIndex, mergeIndexes, readSegments, writeSegments, writeTombstones, \
+    segmentTombstones, META_FILE, DOCS_FILE, TERMS_FILE, POSTINGS_FILE, WEIGHTS_FILE, \
+    POSITIONS_FILE, FORWARD_FILE
+from invertedIndex import indexDocuments, parseDocument
+from processFiles import preprocessDocument
+from stopWords import loadStopwords, DEFAULT_LANGUAGE
+from tokenizer import Tokenizer
+from pipelineManifest import fileDigest
+from fileIO import readText
+
+LOCK_FILE = '.lock'
+# log of the background merge processes
+MERGE_LOG_FILE = 'merge.log'
+
+# merge once there are more segments than this
+DEFAULT_MAX_SEGMENTS = 8
+# rewrite a segment once more than this fraction of its documents is deleted
+DEFAULT_MAX_DELETED = 0.3
+
+# merge modes: in a background process, in this process, every segment into one, not at all
+MERGE_MODES = ('background', 'now', 'full', 'never')
+
+# fields of a sources entry: modification time (ns), size, sha1 of the content, segment (None if not indexed)
+MTIME, SIZE, DIGEST, SEGMENT = range(4)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Update the inverted index with the documents that were added, changed or deleted.")
+    parser.add_argument(
+        '-i', '--input_dir',
+        type = str,
+        default = "documents10k",
+        help = 'Path to the directory of raw documents the index is kept up to date with. Default is "documents10k".'
+    )
+    parser.add_argument(
+        '-o', '--index_dir',
+        type = str,
+        default = "inverted_index",
+        help = 'Path to the segmented index directory. Default is "inverted_index".'
+    )
+    parser.add_argument(
+        '--check_contents',
+        action = 'store_true',
+        help = 'Hash every document, also those whose modification time and size did not change.'
+    )
+    parser.add_argument(
+        '--merge',
+        type = str,
+        choices = MERGE_MODES,
+        default = 'background',
+        help = 'When to merge segments: in a background process, now, every segment into one (full) or never. Default is "background".'
+    )
+    parser.add_argument(
+        '--merge_only',
+        action = 'store_true',
+        help = 'Only merge the segments (as chosen by --merge), without looking for changed documents.'
+    )
+    parser.add_argument(
+        '--max_segments',
+        type = int,
+        default = DEFAULT_MAX_SEGMENTS,
+        help = f'Segments are merged once there are more than this. Default is {DEFAULT_MAX_SEGMENTS}.'
+    )
+    parser.add_argument(
+        '--max_deleted',
+        type = float,
+        default = DEFAULT_MAX_DELETED,
+        help = f'A segment is rewritten once more than this fraction of its documents is deleted. Default is {DEFAULT_MAX_DELETED}.'
+    )
+    parser.add_argument(
+        '--stopwords_language',
+        type = str,
+        default = None,
+        help = f'NLTK stopword language of a new index (an existing index keeps its own, other stopwords are refused). Default is "{DEFAULT_LANGUAGE}".'
+    )
+    parser.add_argument(
+        '--stopwords_file',
+        type = str,
+        default = None,
+        help = 'Custom stopword file with one word per line for a new index (overrides --stopwords_language).'
+    )
+    parser.add_argument(
+        '--stemmer',
+        type = str,
+        default = None,
+        help = 'Stemmer of a new index (an existing index keeps its own tokenizer, another one is refused): "porter" or a Snowball language such as "english". Default is no stemming.'
+    )
+    parser.add_argument(
+        '--fold_unicode',
+        action = 'store_true',
+        help = 'Flag to case fold and remove accents in a new index (an existing index keeps its own tokenizer, another one is refused).'
+    )
+    return parser.parse_args()
+
+@contextmanager
+def lockIndex(index_dir):
+    """
+        holds the update lock of an index directory (waits while another update or merge runs)
+    """
+    os.makedirs(index_dir, exist_ok = True)
+    with open(os.path.join(index_dir, LOCK_FILE), 'w') as lock_file:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def scanSources(input_dir, sources, check_contents = False):
+    """
+        compares the documents of input_dir with the sources recorded at the last update.
+
+        input:
+            - input_dir: directory of raw documents
+            - sources: filename -> [mtime, size, digest, segment] of the last update
+            - check_contents: hash every file, not only those whose modification time or size changed
+
+        output: (changed, deleted, current) where changed are the new or modified filenames
+                (sorted), deleted the filenames that are gone and current the new sources
+                (the segments of changed files are filled in once they are indexed)
+    """
+    changed = []
+    current = {}
+    for entry in os.scandir(input_dir):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        known = sources.get(entry.name)
+        if known is not None and not check_contents and known[MTIME] == stat.st_mtime_ns and known[SIZE] == stat.st_size:
+            current[entry.name] = known
+            continue
+
+        # the modification time is only a hint: a touched file with the same content is kept
+        digest = fileDigest(entry.path)
+        if known is not None and known[DIGEST] == digest:
+            current[entry.name] = [stat.st_mtime_ns, stat.st_size, digest, known[SEGMENT]]
+        else:
+            current[entry.name] = [stat.st_mtime_ns, stat.st_size, digest, None]
+            changed.append(entry.name)
+
+    deleted = sorted(filename for filename in sources if filename not in current)
+    return sorted(changed), deleted, current
+
+def readSource(input_dir, filename):
+    """
+        cleans a raw document like preprocess_files and combine_files would
+
+        output: (filename, title, content), or None for an empty file
+    """
+    text = readText(os.path.join(input_dir, filename))
+    if not text:
+        return None
+    return parseDocument(filename, preprocessDocument(filename, text).split('\n'))
+
+def _readSources(index_dir, manifest):
+    """
+        returns the sources recorded by the last update (empty for a new index)
+    """
+    if not manifest.get('sources'):
+        return {}
+    with open(os.path.join(index_dir, manifest['sources']), 'r', encoding = 'utf-8') as sources_file:
+        return json.load(sources_file)
+
+def _writeSources(index_dir, sources, generation):
+    """
+        writes the sources of a generation, returns the file name
+    """
+    name = f'sources_{generation:06d}.json'
+    with open(os.path.join(index_dir, name), 'w', encoding = 'utf-8') as sources_file:
+        json.dump(sources, sources_file)
+    return name
+
+def _segmentDocIds(segment, filenames):
+    """
+        returns the doc ids of the given filenames in a segment
+    """
+    doc_ids = []
+    for doc_id in range(segment.num_docs):
+        if segment.document(doc_id)[0] in filenames:
+            doc_ids.append(doc_id)
+    return doc_ids
+
+def _commit(index_dir, manifest, segments, sources):
+    """
+        makes a new generation current: writes its sources and replaces segments.json,
+        then removes the files no generation refers to anymore
+    """
+    generation = manifest['generation']
+    # segments whose documents are all deleted are dropped right away
+    segments = [entry for entry in segments if entry['num_deleted'] < entry['num_docs']]
+    manifest = dict(manifest, segments = segments, sources = _writeSources(index_dir, sources, generation))
+    writeSegments(index_dir, manifest)
+    _removeUnused(index_dir, manifest)
+    return manifest
+
+def _removeUnused(index_dir, manifest):
+    """
+        removes segments, tombstones and sources of older generations (including those
+        left behind by an update that did not finish). readers that still have an older
+        generation open keep their files: they are memory-mapped or already read.
+    """
+    names = {entry['name']: entry.get('deletes') for entry in manifest['segments']}
+    for entry in os.scandir(index_dir):
+        if entry.is_dir() and entry.name.startswith('segment_'):
+            if entry.name not in names:
+                shutil.rmtree(entry.path, ignore_errors = True)
+                continue
+            for segment_file in os.scandir(entry.path):
+                if segment_file.name.startswith('deletes_') and segment_file.name != names[entry.name]:
+                    os.remove(segment_file.path)
+        elif entry.name.startswith('sources_') and entry.name != manifest['sources']:
+            os.remove(entry.path)
+
+def _indexSettings(index_dir, manifest):
+    """
+        returns the (stopwords, tokenizer) an existing index was built with: those of its first
+        segment, or of the regular index in index_dir before its first update. (None, None) for a new index
+    """
+    if manifest is not None:
+        if not manifest['segments']:
+            return None, None
+        path = os.path.join(index_dir, manifest['segments'][0]['name'])
+    elif os.path.exists(os.path.join(index_dir, META_FILE)):
+        path = index_dir
+    else:
+        return None, None
+    segment = MappedIndex(path)
+    try:
+        return segment.stop_words, segment.tokenizer
+    finally:
+        segment.close()
+
+def updateIndex(input_dir, index_dir, stop_words = None, check_contents = False, tokenizer = None):
+    """
+        brings a segmented index up to date with a directory of raw documents: the new and
+        modified documents are indexed into a new segment and the old versions of modified
+        documents as well as the deleted documents are tombstoned.
+
+        input:
+            - input_dir: directory of raw documents
+            - index_dir: segmented index directory (created, or converted from a regular
+                         index directory, on the first update)
+            - stop_words: stopwords of a new index (None: the NLTK english stopwords). an existing
+                          index keeps its own, other stopwords are refused
+            - check_contents: hash every document instead of trusting unchanged modification times
+            - tokenizer: Tokenizer of a new index (None: no stemming or folding). an existing index
+                         keeps its own, another tokenizer is refused
+
+        output: dictionary with the number of 'added', 'changed' and 'deleted' documents,
+                or None if the update was refused
+    """
+    if not os.path.isdir(input_dir):
+        print(f"Error: The input directory '{input_dir}' does not exist.")
+        return None
+
+    with lockIndex(index_dir):
+        manifest = readSegments(index_dir)
+
+        # every segment is built with the stopwords and tokenizer of the existing index
+        index_stop_words, index_tokenizer = _indexSettings(index_dir, manifest)
+        if index_tokenizer is not None:
+            if tokenizer is not None and tokenizer != index_tokenizer:
+                print(f"Error: the index '{index_dir}' was built with the tokenizer {index_tokenizer.config()}, "
+                      f"not {tokenizer.config()}.")
+                return None
+            if stop_words is not None and index_tokenizer.stopWords(stop_words) != index_stop_words:
+                print(f"Error: the index '{index_dir}' was built with other stopwords.")
+                return None
+            stop_words, tokenizer = index_stop_words, index_tokenizer
+
+        if manifest is None:
+            # first update: every document goes into the first segment
+            manifest = {'generation': 0, 'segments': [], 'sources': None}
+        sources = _readSources(index_dir, manifest)
+
+        changed, deleted, current = scanSources(input_dir, sources, check_contents)
+        stats = {
+            'added': sum(1 for filename in changed if filename not in sources),
+            'changed': sum(1 for filename in changed if filename in sources),
+            'deleted': len(deleted)
+        }
+        if not changed and not deleted:
+            if current != sources:
+                # only modification times of touched files changed
+                manifest['generation'] += 1
+                _commit(index_dir, manifest, manifest['segments'], current)
+            return stats
+
+        generation = manifest['generation'] + 1
+        manifest['generation'] = generation
+        segments = [dict(entry) for entry in manifest['segments']]
+
+        # tombstones: the indexed versions of changed and deleted documents, grouped by segment
+        removed = {}
+        for filename in changed + deleted:
+            segment_name = sources.get(filename, [None] * 4)[SEGMENT]
+            if segment_name is not None:
+                removed.setdefault(segment_name, set()).add(filename)
+        for entry in segments:
+            if entry['name'] not in removed:
+                continue
+            segment = MappedIndex(os.path.join(index_dir, entry['name']))
+            try:
+                doc_ids = _segmentDocIds(segment, removed[entry['name']])
+            finally:
+                segment.close()
+            tombstones = segmentTombstones(index_dir, entry)
+            tombstones[doc_ids] = True
+            # a new file per generation, readers of the old generation keep theirs
+            entry['deletes'] = f'deletes_{generation:06d}.bin'
+            entry['num_deleted'] = int(tombstones.sum())
+            writeTombstones(os.path.join(index_dir, entry['name'], entry['deletes']), tombstones)
+
+        # the new and changed documents go into a new segment
+        documents = [document for document in (readSource(input_dir, filename) for filename in changed) if document is not None]
+        if documents:
+            if stop_words is None:
+                stop_words = loadStopwords()
+            index = indexDocuments(documents, stop_words, tokenizer = tokenizer or Tokenizer())
+            name = f'segment_{generation:06d}'
+            writeIndex(index, os.path.join(index_dir, name))
+            segments.append({'name': name, 'num_docs': index.num_docs, 'deletes': None, 'num_deleted': 0})
+            for filename, _, _ in documents:
+                current[filename][SEGMENT] = name
+
+        _commit(index_dir, manifest, segments, current)
+
+        # a regular index directory converted on its first update keeps no stale files
+        for filename in (META_FILE, DOCS_FILE, TERMS_FILE, POSTINGS_FILE, WEIGHTS_FILE, POSITIONS_FILE, FORWARD_FILE):
+            path = os.path.join(index_dir, filename)
+            if os.path.exists(path):
+                os.remove(path)
+    return stats
+
+def planMerge(segments, max_segments = DEFAULT_MAX_SEGMENTS, max_deleted = DEFAULT_MAX_DELETED, full = False):
+    """
+        chooses the segments to merge next.
+
+        a segment with too many deleted documents is merged with every segment after it.
+        otherwise, once there are more than max_segments segments, the newest segments
+        are merged with older ones that are not larger than all of them together, so the
+        large old segments are rewritten rarely (every document is merged about log(n) times).
+
+        input:
+            - segments: the 'segments' of segments.json
+            - max_segments: largest number of segments kept without merging
+            - max_deleted: largest fraction of deleted documents of a segment kept without merging
+            - full: merge every segment into one
+
+        output: (start, end) range of segments to merge into one, or None
+    """
+    if not segments:
+        return None
+    if full:
+        if len(segments) > 1 or segments[0]['num_deleted']:
+            return 0, len(segments)
+        return None
+    for start, entry in enumerate(segments):
+        if entry['num_deleted'] > max_deleted * entry['num_docs']:
+            return start, len(segments)
+    if len(segments) <= max_segments:
+        return None
+    start = len(segments) - 2
+    while start > 0 and segments[start - 1]['num_docs'] <= sum(entry['num_docs'] for entry in segments[start:]):
+        start -= 1
+    return start, len(segments)
+
+def mergeSegments(index_dir, max_segments = DEFAULT_MAX_SEGMENTS, max_deleted = DEFAULT_MAX_DELETED, full = False):
+    """
+        merges segments of a segmented index (see planMerge) until none are due, dropping
+        their tombstoned documents.
+
+        output: number of merges
+    """
+    merges = 0
+    with lockIndex(index_dir):
+        manifest = readSegments(index_dir)
+        if manifest is None:
+            print(f"Error: '{index_dir}' is not a segmented index.")
+            return 0
+
+        while True:
+            segments = manifest['segments']
+            plan = planMerge(segments, max_segments, max_deleted, full)
+            if plan is None:
+                return merges
+            start, end = plan
+
+            generation = manifest['generation'] + 1
+            manifest['generation'] = generation
+            name = f'segment_{generation:06d}'
+            merged = segments[start:end]
+            mergeIndexes(
+                [os.path.join(index_dir, entry['name']) for entry in merged],
+                os.path.join(index_dir, name),
+                [segmentTombstones(index_dir, entry) for entry in merged]
+            )
+            num_docs = sum(entry['num_docs'] - entry['num_deleted'] for entry in merged)
+
+            # documents of the merged segments are in the new segment now
+            merged_names = {entry['name'] for entry in merged}
+            sources = _readSources(index_dir, manifest)
+            for source in sources.values():
+                if source[SEGMENT] in merged_names:
+                    source[SEGMENT] = name
+
+            new_segments = segments[:start] + [{'name': name, 'num_docs': num_docs, 'deletes': None, 'num_deleted': 0}] + segments[end:]
+            manifest = _commit(index_dir, manifest, new_segments, sources)
+            merges += 1
+            if full:
+                return merges
+
+def startBackgroundMerge(index_dir, max_segments = DEFAULT_MAX_SEGMENTS, max_deleted = DEFAULT_MAX_DELETED):
+    """
+        merges the segments in a detached process (its output goes to merge.log in the
+        index directory), returns the process
+    """
+    cmd = [
+        sys.executable, os.path.abspath(__file__),
+        '--index_dir', index_dir,
+        '--merge_only',
+        '--merge', 'now',
+        '--max_segments', str(max_segments),
+        '--max_deleted', str(max_deleted)
+    ]
+    with open(os.path.join(index_dir, MERGE_LOG_FILE), 'a', encoding = 'utf-8') as log_file:
+        return subprocess.Popen(cmd, stdin = subprocess.DEVNULL, stdout = log_file, stderr = subprocess.STDOUT,
+                                start_new_session = True)
+
+def main():
+    args = parse_arguments()
+
+    if not args.merge_only:
+        # only the options that are given are checked against an existing index
+        stop_words = None
+        if args.stopwords_language is not None or args.stopwords_file is not None:
+            stop_words = loadStopwords(args.stopwords_language or DEFAULT_LANGUAGE, args.stopwords_file)
+        tokenizer = None
+        if args.stemmer is not None or args.fold_unicode:
+            try:
+                tokenizer = Tokenizer(args.stemmer, args.fold_unicode)
+            except ValueError as e:
+                print(f"Invalid option: {e}")
+                return
+        print(f"Updating the index '{args.index_dir}' from '{args.input_dir}'...")
+        stats = updateIndex(args.input_dir, args.index_dir, stop_words, args.check_contents, tokenizer)
+        if stats is None:
+            return
+        print(f"Added: {stats['added']}, changed: {stats['changed']}, deleted: {stats['deleted']}")
+
+    manifest = readSegments(args.index_dir)
+    if manifest is None or args.merge == 'never':
+        return
+    full = args.merge == 'full'
+    if planMerge(manifest['segments'], args.max_segments, args.max_deleted, full) is None:
+        return
+    if args.merge == 'background':
+        process = startBackgroundMerge(args.index_dir, args.max_segments, args.max_deleted)
+        print(f"Merging segments in the background (pid {process.pid}, log in {os.path.join(args.index_dir, MERGE_LOG_FILE)}).")
+    else:
+        print("Merging segments...")
+        merges = mergeSegments(args.index_dir, args.max_segments, args.max_deleted, full)
+        print(f"Merged segments {merges} time(s).")
+
+if __name__ == "__main__":
+    main()
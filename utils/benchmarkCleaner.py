@@ -0,0 +1,232 @@
+'''
+Description: golden-output check and docs/sec benchmark of the document cleaner
+(textCleaner.py) against the original chained re.split / re.sub cleaner, which is
+kept below as the reference.
+
+How to run: python3 utils/benchmarkCleaner.py [-i documents10k] [--golden cleaner_golden.json] [--fuzz 20000]
+    - every document of the input directory is cleaned by both cleaners, the outputs must be identical
+    - --fuzz also compares them on random texts built from the markup the cleaner removes
+      (nested and overlapping headers, tags, tables, urls, ...)
+    - --golden compares the outputs with the sha1 of every cleaned document stored in a file,
+      which is only written (from the reference cleaner) with --write_golden
+    - the script exits with status 1 when a check fails (tests/test_textCleaner.py runs the
+      same comparisons on a committed set of documents)
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+
+# the cleaner lives in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textCleaner import cleanText
+
+# pieces the fuzzed texts are made of
+FUZZ_PIECES = [
+    '==', '===', '= ', '==See also==', '== References ==', '== External links ==', 'See also', '{|', '|}', '|',
+    '<', '>', '<br>', 'ht', 'tp', 'http', 'https://en.wikipedia.org', 'thumb|', 'thumb', '12', '300px', 'px', '5 px',
+    '\\"', '\\', '"', '.', ',', '*', ':', ';', '!', '?', '(', ')', ' ', '  ', '\n', '\r\n', '\t', '\xa0', ' ',
+    'word', 'Word2', 'é', '_', 'left'
+]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Check and benchmark the document cleaner against the original one.")
+    parser.add_argument(
+        '-i', '--input_dir',
+        type = str,
+        default = "documents10k",
+        help = 'Directory of raw documents to clean. Default is "documents10k".'
+    )
+    parser.add_argument(
+        '--golden',
+        type = str,
+        default = None,
+        help = 'Optional JSON file with the sha1 of every cleaned document to compare with (see --write_golden).'
+    )
+    parser.add_argument(
+        '--write_golden',
+        action = 'store_true',
+        help = 'Flag to write the golden file from the reference cleaner instead of comparing with it.'
+    )
+    parser.add_argument(
+        '--fuzz',
+        type = int,
+        default = 20000,
+        help = 'Number of random texts to compare the cleaners on. Default is 20000.'
+    )
+    parser.add_argument(
+        '--repeat',
+        type = int,
+        default = 3,
+        help = 'Number of timed runs over the documents (the fastest is reported). Default is 3.'
+    )
+    return parser.parse_args()
+
+def referenceCleanText(text):
+    """
+        the original cleaner of processFiles.py and utils/preprocess.py (one pass per pattern)
+    """
+    # remove sections after specific headers
+    text = re.split(r"==See also==", text, 1)[0]
+    text = re.split(r"== References ==", text, 1)[0]
+    text = re.split(r"== External links ==", text, 1)[0]
+
+    # Remove various types of headers
+    text = re.sub(r"===.*?===", "", text)  # removes headers like ===Header===
+    text = re.sub(r"==.*?==", "", text)    # removes headers like ==Header==
+
+    # remove wikitables and HTML/XML tags
+    text = re.sub(r"{\|.*?\|}", "", text, flags=re.DOTALL)
+    text = re.sub(r"<.*?>", "", text)
+
+    # remove urls and specific patterns
+    text = re.sub(r'http\S+', '', text)
+    text = re.sub(r"\bthumb\|.*?\|", "", text)
+    text = re.sub(r"\b\d+px\b\s*\w*", "", text)  # removes numeric px| patterns and trailing content
+
+    # replace escaped apostrophe and separate punctuation
+    text = text.replace(r"\"", "\"")  # fix apostrophes
+    text = re.sub(r"([.,*:;!?()|])", r" \1 ", text)  # separate punctuation from words
+
+    # remove newline characters
+    text = text.replace("\n", " ").replace("\r", " ")
+
+    # remove extra whitespace
+    text = re.sub(r"\s+", " ", text).strip()
+
+    return text
+
+def loadDocuments(input_dir):
+    """
+        reads the body of every document of a directory, like processFiles.preprocessDocument passes it to the cleaner
+
+        output: list of (filename, body text)
+    """
+    documents = []
+    for filename in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, filename)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path, 'r', encoding = 'utf-8') as f:
+                lines = f.readlines()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Skipping {filename}: {e}")
+            continue
+        if lines and lines[0].strip().startswith("Title: "):
+            lines = lines[1:]
+        documents.append((filename, ''.join(lines)))
+    return documents
+
+def fuzzTexts(count, seed = 0):
+    """
+        generates random texts out of FUZZ_PIECES
+    """
+    rng = random.Random(seed)
+    return [''.join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(1, 40))) for _ in range(count)]
+
+def compare(texts, labels):
+    """
+        cleans every text with both cleaners, prints the first difference
+
+        output: number of texts cleaned differently
+    """
+    mismatches = 0
+    for label, text in zip(labels, texts):
+        expected = referenceCleanText(text)
+        cleaned = cleanText(text)
+        if cleaned != expected:
+            if mismatches == 0:
+                print(f"Output differs for {label}: {text[:200]!r}")
+                print(f"    reference: {expected[:200]!r}")
+                print(f"    cleaner:   {cleaned[:200]!r}")
+            mismatches += 1
+    return mismatches
+
+def checkGolden(golden_file, documents, write):
+    """
+        compares the cleaned documents with the sha1 digests stored in the golden file,
+        or writes the file from the reference cleaner
+
+        output: number of documents that do not match (0 when the file was written),
+                None if the golden file does not exist
+    """
+    if not write and not os.path.exists(golden_file):
+        print(f"Golden file '{golden_file}' not found, write it with --write_golden.")
+        return None
+    if write:
+        golden = {filename: hashlib.sha1(referenceCleanText(text).encode('utf-8')).hexdigest() for filename, text in documents}
+        with open(golden_file, 'w', encoding = 'utf-8') as f:
+            json.dump(golden, f, indent = 0, sort_keys = True)
+        print(f"Golden outputs of {len(golden)} documents written to {golden_file}.")
+        return 0
+
+    with open(golden_file, 'r', encoding = 'utf-8') as f:
+        golden = json.load(f)
+    mismatches = 0
+    for filename, text in documents:
+        if filename not in golden:
+            continue
+        if hashlib.sha1(cleanText(text).encode('utf-8')).hexdigest() != golden[filename]:
+            if mismatches == 0:
+                print(f"Golden output differs for {filename}.")
+            mismatches += 1
+    missing = len(set(golden) - {filename for filename, _ in documents})
+    print(f"Golden check: {len(golden) - missing - mismatches} of {len(golden)} documents match"
+          + (f" ({missing} not in the input directory)." if missing else "."))
+    return mismatches
+
+def timeCleaner(clean, texts, repeat):
+    """
+        output: fastest time (sec) of cleaning all texts
+    """
+    best = float('inf')
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        for text in texts:
+            clean(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    args = parse_arguments()
+
+    documents = loadDocuments(args.input_dir) if os.path.isdir(args.input_dir) else []
+    if not documents:
+        print(f"No documents found in '{args.input_dir}', only the fuzzed texts are checked.")
+
+    # golden output: identical to the reference on every document and every fuzzed text
+    failed = compare([text for _, text in documents], [filename for filename, _ in documents])
+    print(f"Documents: {len(documents) - failed} of {len(documents)} cleaned identically.")
+    fuzzed = fuzzTexts(args.fuzz)
+    fuzz_failed = compare(fuzzed, [f"fuzzed text {i}" for i in range(len(fuzzed))])
+    print(f"Fuzzed texts: {len(fuzzed) - fuzz_failed} of {len(fuzzed)} cleaned identically.")
+    if args.golden:
+        golden_failed = checkGolden(args.golden, documents, args.write_golden)
+        # a missing golden file is a failed check, not a pass
+        failed += 1 if golden_failed is None else golden_failed
+    if failed or fuzz_failed:
+        print("Golden check FAILED.")
+        sys.exit(1)
+
+    if not documents:
+        return
+
+    # throughput over the documents
+    texts = [text for _, text in documents]
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) / 1e6
+    reference_time = timeCleaner(referenceCleanText, texts, args.repeat)
+    cleaner_time = timeCleaner(cleanText, texts, args.repeat)
+    print(f"{'Cleaner':<12}{'sec':>10}{'docs/sec':>12}{'MB/sec':>10}")
+    for name, elapsed in (('reference', reference_time), ('textCleaner', cleaner_time)):
+        print(f"{name:<12}{elapsed:>10.3f}{len(texts) / elapsed:>12,.0f}{megabytes / elapsed:>10.1f}")
+    print(f"Speedup: {reference_time / cleaner_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
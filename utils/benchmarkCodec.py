@@ -0,0 +1,151 @@
+'''
+Description: round-trip check and decode-throughput benchmark for the postings codec.
+
+How to run: python3 utils/benchmarkCodec.py [--index_dir inverted_index] [--num_lists 200] [--df 5000]
+    - with --index_dir the postings of the largest terms of an existing index are used
+    - otherwise random postings lists with geometric doc id gaps are generated
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+
+# the codec lives in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postingsCodec import encodePostings, decodePostings, decodePostingsArrays, PostingsReader
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Benchmark the compressed postings codec.")
+    parser.add_argument(
+        '--index_dir',
+        type = str,
+        default = None,
+        help = 'Optional memory-mapped index directory to take the postings lists from.'
+    )
+    parser.add_argument(
+        '--num_lists',
+        type = int,
+        default = 200,
+        help = 'Number of postings lists to benchmark. Default is 200.'
+    )
+    parser.add_argument(
+        '--df',
+        type = int,
+        default = 5000,
+        help = 'Average length of the generated postings lists. Default is 5000.'
+    )
+    return parser.parse_args()
+
+def generatePostings(num_lists, df):
+    """
+        generates random postings lists with geometric doc id gaps and small counts
+    """
+    lists = []
+    for _ in range(num_lists):
+        length = max(1, int(random.expovariate(1 / df)))
+        doc_ids = []
+        doc_id = -1
+        for _ in range(length):
+            doc_id += 1 + int(random.expovariate(0.2))
+            doc_ids.append(doc_id)
+        counts = [1 + int(random.expovariate(0.5)) for _ in range(length)]
+        lists.append((doc_ids, counts))
+    return lists
+
+def loadPostings(index_dir, num_lists):
+    """
+        loads the postings lists of the num_lists most frequent terms of an index
+    """
+    from indexStore import openIndex
+    from postingsCodec import documentFrequency
+
+    index = openIndex(index_dir)
+    terms = sorted(index.keys(), key = lambda word: documentFrequency(index.encodedPostings(word)), reverse = True)
+    lists = []
+    for word in terms[:num_lists]:
+        postings = index.postings(word)
+        lists.append((postings.doc_ids.tolist(), postings.counts.tolist()))
+    return lists
+
+def main():
+    args = parse_arguments()
+
+    if args.index_dir:
+        lists = loadPostings(args.index_dir, args.num_lists)
+    else:
+        random.seed(0)
+        lists = generatePostings(args.num_lists, args.df)
+
+    total_postings = sum(len(doc_ids) for doc_ids, _ in lists)
+    if total_postings == 0:
+        print("No postings to benchmark.")
+        return
+
+    # encode
+    start = time.perf_counter()
+    encoded = [encodePostings(doc_ids, counts) for doc_ids, counts in lists]
+    encode_time = time.perf_counter() - start
+
+    # round trip: full decode and streaming decode must give back the input
+    for (doc_ids, counts), data in zip(lists, encoded):
+        decoded_ids, decoded_counts = decodePostings(data)
+        if list(decoded_ids) != doc_ids or list(decoded_counts) != counts:
+            print("Round trip FAILED: full decode does not match the input.")
+            return
+        decoded_ids, decoded_counts = decodePostingsArrays(data)
+        if decoded_ids.tolist() != doc_ids or decoded_counts.tolist() != counts:
+            print("Round trip FAILED: numpy decode does not match the input.")
+            return
+        if list(PostingsReader(data)) != list(zip(doc_ids, counts)):
+            print("Round trip FAILED: streaming decode does not match the input.")
+            return
+    print(f"Round trip OK for {len(lists)} lists ({total_postings} postings).")
+
+    # size: two 32 bit integers per posting uncompressed
+    raw_bytes = total_postings * 8
+    encoded_bytes = sum(len(data) for data in encoded)
+    print(f"Size: {raw_bytes} bytes raw -> {encoded_bytes} bytes encoded "
+          f"({encoded_bytes / total_postings:.2f} bytes/posting, {raw_bytes / encoded_bytes:.1f}x smaller)")
+
+    # full decode throughput
+    start = time.perf_counter()
+    for data in encoded:
+        decodePostings(data)
+    decode_time = time.perf_counter() - start
+
+    # vectorized (numpy) full decode throughput
+    start = time.perf_counter()
+    for data in encoded:
+        decodePostingsArrays(data)
+    numpy_time = time.perf_counter() - start
+
+    # streaming decode throughput
+    start = time.perf_counter()
+    for data in encoded:
+        for _ in PostingsReader(data):
+            pass
+    stream_time = time.perf_counter() - start
+
+    # skipping: jump to every 100th doc id of each list
+    start = time.perf_counter()
+    skips = 0
+    for (doc_ids, _), data in zip(lists, encoded):
+        reader = PostingsReader(data)
+        for target in doc_ids[::100]:
+            reader.skipTo(target)
+            skips += 1
+    skip_time = time.perf_counter() - start
+
+    print(f"Encode:          {total_postings / encode_time:12,.0f} postings/sec")
+    print(f"Full decode:     {total_postings / decode_time:12,.0f} postings/sec "
+          f"({encoded_bytes / decode_time / 1e6:.1f} MB/sec)")
+    print(f"Numpy decode:    {total_postings / numpy_time:12,.0f} postings/sec "
+          f"({encoded_bytes / numpy_time / 1e6:.1f} MB/sec)")
+    print(f"Streaming:       {total_postings / stream_time:12,.0f} postings/sec")
+    print(f"skipTo:          {skips / skip_time:12,.0f} skips/sec")
+
+if __name__ == "__main__":
+    main()
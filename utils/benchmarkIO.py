@@ -0,0 +1,119 @@
+'''
+Description: files/sec benchmark of the bulk file I/O (fileIO.py) against the
+per-file text mode reads it replaced (os.listdir + isfile, open + readlines +
+join, one write per line).
+
+How to run: python3 utils/benchmarkIO.py [-i cleaned_documents10k] [--threads 1 4 16] [--repeat 3]
+    - every file of the input directory is read both ways, the texts must be identical
+    - the combined-file write is timed as one write per line against the buffered batch writes
+      (the output goes to a temporary file)
+    - on a local disk the files come from the page cache, threads only help on network filesystems
+'''
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+# the I/O helpers live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fileIO import listFiles, readFiles, openOutput
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Check and benchmark the bulk file I/O against per-file readlines().")
+    parser.add_argument(
+        '-i', '--input_dir',
+        type = str,
+        default = "cleaned_documents10k",
+        help = 'Directory of documents to read. Default is "cleaned_documents10k".'
+    )
+    parser.add_argument(
+        '--threads',
+        type = int,
+        nargs = '+',
+        default = [1, 4, 16],
+        help = 'Numbers of reading threads to time. Default is 1 4 16.'
+    )
+    parser.add_argument(
+        '--repeat',
+        type = int,
+        default = 3,
+        help = 'Number of timed runs (the fastest is reported). Default is 3.'
+    )
+    return parser.parse_args()
+
+def readLinesTexts(input_dir):
+    """
+        the reads the stages used to do: list, stat every entry, open in text mode, readlines and join
+    """
+    texts = []
+    for filename in [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f))]:
+        with open(os.path.join(input_dir, filename), 'r', encoding = 'utf-8') as file:
+            lines = file.readlines()
+        texts.append(''.join(lines))
+    return texts
+
+def bulkTexts(input_dir, threads):
+    """
+        the reads of fileIO: one scandir, one read per file, optionally read ahead by threads
+    """
+    return [text for _, text, _ in readFiles(input_dir, listFiles(input_dir), threads)]
+
+def writeLines(path, lines):
+    with open(path, 'w', encoding = 'utf-8') as file:
+        for line in lines:
+            file.write(line)
+
+def writeBatches(path, lines, batch_size = 64):
+    with openOutput(path) as file:
+        for i in range(0, len(lines), batch_size):
+            file.writelines(lines[i:i + batch_size])
+
+def best(function, repeat):
+    """
+        output: fastest time (sec) of running function
+    """
+    fastest = float('inf')
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        function()
+        fastest = min(fastest, time.perf_counter() - start)
+    return fastest
+
+def main():
+    args = parse_arguments()
+    if not os.path.isdir(args.input_dir):
+        print(f"Error: The input directory '{args.input_dir}' does not exist.")
+        return
+
+    # the same texts, in the same order
+    expected = readLinesTexts(args.input_dir)
+    for threads in args.threads:
+        if bulkTexts(args.input_dir, threads) != expected:
+            print(f"Texts read with {threads} thread(s) differ from readlines(), check FAILED.")
+            return
+    num_files = len(expected)
+    print(f"Read check: {num_files} files read identically.")
+
+    print(f"{'Read':<22}{'sec':>10}{'files/sec':>12}")
+    baseline = best(lambda: readLinesTexts(args.input_dir), args.repeat)
+    print(f"{'readlines':<22}{baseline:>10.3f}{num_files / baseline:>12,.0f}")
+    for threads in args.threads:
+        elapsed = best(lambda: bulkTexts(args.input_dir, threads), args.repeat)
+        print(f"{f'fileIO, {threads} thread(s)':<22}{elapsed:>10.3f}{num_files / elapsed:>12,.0f}"
+              f"  ({baseline / elapsed:.2f}x)")
+
+    # one tab delimited line per file, like the combined file
+    lines = [f"{i}\t{' '.join(text.split())}\n" for i, text in enumerate(expected)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'combined.txt')
+        line_time = best(lambda: writeLines(path, lines), args.repeat)
+        batch_time = best(lambda: writeBatches(path, lines), args.repeat)
+    print(f"{'Write':<22}{'sec':>10}")
+    print(f"{'one write per line':<22}{line_time:>10.3f}")
+    print(f"{'buffered batches':<22}{batch_time:>10.3f}  ({line_time / batch_time:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 import os
+import sys
 import argparse
 from tqdm import tqdm
 
+# the file I/O helpers live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fileIO import listFiles, readFiles, splitLines
+from blockGzip import openTextOutput
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description = "Combine multiple text files into a single tab-delimited file with filename, title, and content."
@@ -16,73 +23,81 @@ def parse_arguments():
         '-o', '--output_file',
         type = str,
         default = "combined_documents.txt",
-        help = 'Path to the output combined .txt file. Defaults to "combined_documents.txt".'
+        help = 'Path to the output combined .txt file, a name ending in .gz writes it block-compressed (see blockGzip.py). Defaults to "combined_documents.txt".'
+    )
+    parser.add_argument(
+        '--io_threads',
+        type = int,
+        default = 1,
+        help = 'Number of threads reading the next files while one is processed (for network filesystems). Default is 1.'
     )
     return parser.parse_args()
 
-def combineFiles(input_dir, combined_file_path):
+def combineFiles(input_dir, combined_file_path, io_threads = 1):
     """
         combines all files in the input directory into a single tab-delimited text file
         each line contains 'filename', 'title', and 'content' separated by tabs
 
         parameters:
             - input_dir (str): directory containing the input text files.
-            - combined_file_path (str): Path to the output combined .txt file.
+            - combined_file_path (str): Path to the output combined .txt file (block-compressed if it ends in .gz).
+            - io_threads (int): number of threads reading the files ahead (see fileIO.readFiles)
     """
     try:
-        with open(combined_file_path, 'w', encoding='utf-8') as outfile:
+        with openTextOutput(combined_file_path) as outfile:
             # write header line (optional)
             outfile.write("Filename\tTitle\tContent\n")
             
             # get list of files
-            files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f))]
+            files = listFiles(input_dir)
             
             if not files:
                 print(f"No files found in the input directory '{input_dir}'.")
                 return
 
-            # iterate through each file with progress tracking
-            for filename in tqdm(files, desc="Combining files"):
-                file_path = os.path.join(input_dir, filename)
+            # iterate through each file with progress tracking (every file is read in one go)
+            for filename, text, error in tqdm(readFiles(input_dir, files, io_threads), total=len(files), desc="Combining files"):
+                if error is not None:
+                    print(f"Error processing file '{filename}': {error}")
+                    continue
                 
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as infile:
-                        lines = infile.readlines()
+                    lines = splitLines(text)
+                    
+                    # if file is empty, skip it
+                    if not lines:
+                        print(f"Skipping '{filename}': File is empty.")
+                        continue
+
+                    # initialize title and content
+                    title_text = "[Missing Title]"
+                    content = []
+
+                    # process lines to extract title and content
+                    for line in lines:
+                        # remove trailing and leading whitespaces
+                        line = line.strip()
                         
-                        # if file is empty, skip it
-                        if not lines:
-                            print(f"Skipping '{filename}': File is empty.")
-                            continue
-
-                        # initialize title and content
-                        title_text = "[Missing Title]"
-                        content = []
-
-                        # process lines to extract title and content
-                        for line in lines:
-                            # remove trailing and leading whitespaces
-                            line = line.strip()
-                            
-                            # check for title line
-                            if line.startswith("Title: "):
-                                title_text = line[len("Title: "):].strip()
-                            elif not line.startswith("Filename: "):
-                                # append to content if it's not a filename or title line
-                                content.append(line)
-
-                        # join content lines with spaces
-                        content_text = ' '.join(content)
-
-                        # replace any tabs in the fields to avoid misalignment
-                        filename_clean = filename.replace('\t', ' ')
-                        title_clean = title_text.replace('\t', ' ')
-                        content_clean = content_text.replace('\t', ' ')
-
-                        # create a tab-delimited line
-                        line_out = f"{filename_clean}\t{title_clean}\t{content_clean}\n"
-
-                        # write the line to the output file
-                        outfile.write(line_out)
+                        # check for title line
+                        if line.startswith("Title: "):
+                            title_text = line[len("Title: "):].strip()
+                        elif not line.startswith("Filename: "):
+                            # append to content if it's not a filename or title line
+                            content.append(line)
+
+                    # join content lines with spaces
+                    content_text = ' '.join(content)
+
+                    # replace any tabs in the fields to avoid misalignment
+                    filename_clean = filename.replace('\t', ' ')
+                    title_clean = title_text.replace('\t', ' ')
+                    content_clean = content_text.replace('\t', ' ')
+
+                    # create a tab-delimited line
+                    line_out = f"{filename_clean}\t{title_clean}\t{content_clean}\n"
+
+                    # write the line to the output file (buffered, see blockGzip.openTextOutput)
+                    outfile.write(line_out)
 
                 except Exception as e:
                     print(f"Error processing file '{filename}': {e}")
@@ -102,7 +117,7 @@ def main():
         print(f"Error: The input directory '{input_dir}' does not exist.")
         return
 
-    combineFiles(input_dir, output_combined_file)
+    combineFiles(input_dir, output_combined_file, args.io_threads)
 
 if __name__ == "__main__":
     main()
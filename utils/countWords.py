@@ -1,8 +1,14 @@
 import os
-import string
+import sys
 import argparse
 from tqdm import tqdm
 
+# the tokenizer and the file I/O helpers live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tokenizer import Tokenizer
+from fileIO import listFiles, readFiles, openOutput
+
 def parse_arguments():
     """
     parse command-line arguments for input directory and output file
@@ -22,9 +28,20 @@ def parse_arguments():
         default='wordCount.txt',
         help='Path to the output file where word counts will be written. Defaults to "wordCount.txt".'
     )
+    parser.add_argument(
+        '--fold_unicode',
+        action='store_true',
+        help='Flag to case fold the documents and remove accents before splitting them (use it if the index does).'
+    )
+    parser.add_argument(
+        '--io_threads',
+        type=int,
+        default=1,
+        help='Number of threads reading the next files while one is processed (for network filesystems). Defaults to 1.'
+    )
     return parser.parse_args()
 
-def countWords(input_folder, output_file):
+def countWords(input_folder, output_file, tokenizer = None, io_threads = 1):
     """
     counts the number of words in each document within the input_folder
     skips the first line and excludes punctuation
@@ -33,52 +50,42 @@ def countWords(input_folder, output_file):
     parameters:
         - input_folder (str): location of the input files
         - output_file (str): path to the output file
+        - tokenizer (Tokenizer): splits the documents into words, like the index (default: Tokenizer())
+        - io_threads (int): number of threads reading the files ahead (see fileIO.readFiles)
     """
-    # prepare a translation table to remove punctuation
-    translator = str.maketrans('', '', string.punctuation)
+    # the words are split like the index splits them, so the document lengths match its term frequencies
+    tokenizer = tokenizer or Tokenizer()
 
     try:
-        with open(output_file, 'w', encoding='utf-8') as outfile:
+        with openOutput(output_file) as outfile:
             # write header line (optional)
             # outfile.write("Filename\tWordCount\n")
 
             # get list of files
-            files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))]
+            files = listFiles(input_folder)
 
             if not files:
                 print(f"No files found in the input directory '{input_folder}'.")
                 return
 
-            # iterate over all files with progress tracking
-            for filename in tqdm(files, desc="Counting words"):
-                file_path = os.path.join(input_folder, filename)
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as infile:
-                        lines = infile.readlines()
-                        
-                        if not lines:
-                            # if the file is empty -> word count is 0
-                            word_count = 0
-                        else:
-                            # skip the first line -> title
-                            content = ''.join(lines[1:])
-                            
-                            # remove punctuation
-                            content = content.translate(translator)
-                            
-                            # split the content into words (remove trailing and leading whitespaces)
-                            words = content.split()
-                            
-                            # count the number of words
-                            word_count = len(words)
-                    
-                    # write the filename and word count to the output file
-                    outfile.write(f"{filename}:{word_count}\n")
-                
-                except Exception as e:
+            # iterate over all files with progress tracking (every file is read in one go)
+            for filename, text, error in tqdm(readFiles(input_folder, files, io_threads), total=len(files), desc="Counting words"):
+                if error is not None:
                     # handle exceptions and continue
-                    print(f"Error processing '{filename}': {e}")
+                    print(f"Error processing '{filename}': {error}")
+                    continue
+
+                # skip the first line -> title (an empty file has a word count of 0)
+                content = text.partition('\n')[2]
+
+                # split the content into words (punctuation removed)
+                words = tokenizer.words(content)
+
+                # count the number of words
+                word_count = len(words)
+
+                # write the filename and word count to the output file
+                outfile.write(f"{filename}:{word_count}\n")
 
         print(f"\nWord counts have been written to '{output_file}'.")
     
@@ -95,7 +102,7 @@ def main():
         print(f"Error: The input directory '{input_folder}' does not exist.")
         return
 
-    countWords(input_folder, output_file)
+    countWords(input_folder, output_file, Tokenizer(fold = args.fold_unicode), args.io_threads)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file